@@ -1,8 +1,9 @@
 # bot.py
-import os, django, httpx, secrets, random, asyncio
+import os, django, secrets, random, asyncio
 from decouple import config
 from telegram import InlineKeyboardButton, InlineKeyboardMarkup, Update
 from telegram.ext import Application, CommandHandler, CallbackQueryHandler, ContextTypes
+from telegram.error import RetryAfter
 from asgiref.sync import sync_to_async
 import logging
 import pytz
@@ -13,7 +14,12 @@ logger = logging.getLogger(__name__)
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'main.settings')
 django.setup()
 from django.core.cache import cache
+from main.cache_keys import (
+    TG_LINK_TTL, QUIZ_STATE_TTL, tg_link_key, quiz_word_key, quiz_user_word_key, quiz_exp_key,
+)
 from main.models import UserProfile
+from main import quiz_service
+from main.answer_buffer import ANSWER_FLUSH_INTERVAL, flush_all_answers
 
 BOT_TOKEN = config('TELEGRAM_BOT_TOKEN')
 API_URL = config('DJANGO_API_URL', default='http://127.0.0.1:8000')
@@ -30,48 +36,108 @@ def get_all_telegram_users():
         telegram_id__isnull=False
     ).select_related('user'))
 
+# === Квизы и отчёты — напрямую через main/quiz_service.py, без HTTP ===
+get_daily_quiz = sync_to_async(quiz_service.daily_quiz)
+get_daily_quizzes = sync_to_async(quiz_service.daily_quizzes)
+get_weekly_report = sync_to_async(quiz_service.weekly_report)
+get_praise_report = sync_to_async(quiz_service.praise_report)
+get_weak_words_report = sync_to_async(quiz_service.weak_words_report)
+log_quiz_answer = sync_to_async(quiz_service.log_answer)
+
+
+async def flush_answers(context: ContextTypes.DEFAULT_TYPE):
+    """Переносит буфер ответов в историю и статистику (main/answer_buffer.py)"""
+    try:
+        flushed = await sync_to_async(flush_all_answers)()
+        if flushed:
+            print(f"💾 Перенесено ответов: {flushed}")
+    except Exception as e:
+        logger.error(f"Ошибка переноса ответов: {e}")
+
+
+# === Ежедневная рассылка ===
+# Пользователей в одной пачке подбора вопросов
+BROADCAST_BATCH = 500
+# Одновременных отправок и сообщений в секунду (лимит Telegram — ~30 в секунду на бота)
+BROADCAST_CONCURRENCY = config('BROADCAST_CONCURRENCY', default=20, cast=int)
+BROADCAST_RATE = config('BROADCAST_RATE', default=25, cast=int)
+
+
+class RateLimiter:
+    """Равномерно распределяет отправки: не чаще per_second в секунду."""
+    def __init__(self, per_second):
+        self.interval = 1 / per_second
+        self._next = 0.0
+        self._lock = asyncio.Lock()
+
+    async def wait(self):
+        async with self._lock:
+            now = asyncio.get_running_loop().time()
+            delay = self._next - now
+            self._next = max(now, self._next) + self.interval
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+@sync_to_async
+def save_quiz_states(states):
+    """Текущий вопрос каждого пользователя — одной записью в кэш"""
+    values = {}
+    for tg_id, data in states:
+        if data.get('example_id'):
+            values[quiz_word_key(tg_id)] = data['example_id']
+        if data.get('user_word_id'):
+            values[quiz_user_word_key(tg_id)] = data['user_word_id']
+        values[quiz_exp_key(tg_id)] = data.get('explanation', '')
+    cache.set_many(values, QUIZ_STATE_TTL)
+
+
 async def send_daily_quiz_to_all(context: ContextTypes.DEFAULT_TYPE):
     """Отправляет квиз всем пользователям (вызывается в 12:00 МСК)"""
     print(f"\n⏰ Ежедневная рассылка в {context.job.data['time']}")
     
     profiles = await get_all_telegram_users()
-    print(f"📨 Отправляем квизы {len(profiles)} пользователям")
+    total = len(profiles)
+    print(f"📨 Отправляем квизы {total} пользователям")
     
-    for profile in profiles:
-        try:
-            await send_quiz_to_user(profile.telegram_id, profile.user.id, context.bot)
-        except Exception as e:
-            logger.error(f"Ошибка отправки пользователю {profile.telegram_id}: {e}")
-
-async def send_quiz_to_user(tg_id, user_id, bot):
-    """Отправляет квиз конкретному пользователю"""
-    async with httpx.AsyncClient(timeout=5) as client:
+    semaphore = asyncio.Semaphore(BROADCAST_CONCURRENCY)
+    limiter = RateLimiter(BROADCAST_RATE)
+    stats = {'sent': 0, 'failed': 0}
+    
+    async def send_one(tg_id, data):
+        async with semaphore:
+            try:
+                await send_quiz_message(tg_id, data, context.bot, limiter)
+                stats['sent'] += 1
+            except Exception as e:
+                stats['failed'] += 1
+                logger.error(f"Ошибка отправки пользователю {tg_id}: {e}")
+            done = stats['sent'] + stats['failed']
+            if done % 100 == 0:
+                print(f"📨 Рассылка: {done}/{total} (ошибок: {stats['failed']})")
+    
+    for start in range(0, total, BROADCAST_BATCH):
+        batch = profiles[start:start + BROADCAST_BATCH]
         try:
-            r = await client.post(f"{API_URL}/api/daily-quiz/", json={'user_id': user_id})
-            data = r.json()
+            quizzes = await get_daily_quizzes([p.user_id for p in batch])
         except Exception as e:
-            print(f"❌ Ошибка загрузки для {tg_id}: {e}")
-            return
-    
-    if 'error' in data:
-        print(f"❌ Нет вопросов для {tg_id}: {data['error']}")
-        return
-    
-    # Сохраняем в кэш
-    example_id = data.get('example_id')
-    user_word_id = data.get('user_word_id')
-    
-    if example_id:
-        cache.set(f"quiz_word_{tg_id}", example_id, 300)
-    if user_word_id:
-        cache.set(f"quiz_user_word_{tg_id}", user_word_id, 300)
-    
-    cache.set(f"quiz_exp_{tg_id}", data.get('explanation', ''), 300)
+            stats['failed'] += len(batch)
+            logger.error(f"Ошибка подбора вопросов для {len(batch)} пользователей: {e}")
+            continue
+        
+        ready = [(p.telegram_id, quizzes[p.user_id]) for p in batch]
+        await save_quiz_states(ready)
+        await asyncio.gather(*(send_one(tg_id, data) for tg_id, data in ready))
     
-    # Отправляем вопрос
+    print(f"✅ Рассылка завершена: отправлено {stats['sent']}, ошибок {stats['failed']} из {total}")
+
+
+async def send_quiz_message(tg_id, data, bot, limiter=None):
+    """Отправляет готовый вопрос; при RetryAfter ждёт и повторяет один раз"""
     question = data['question']
-    options = data['options']
+    options = list(data['options'])
     random.shuffle(options)
+    example_id = data.get('example_id')
     
     icons = ['🔹', '🔸', '▫️', '▪️', '🔘']
     kb = []
@@ -80,15 +146,37 @@ async def send_quiz_to_user(tg_id, user_id, bot):
         is_correct = 1 if o.get('is_correct') else 0
         kb.append([InlineKeyboardButton(
             f"{icons[i % len(icons)]} {text}",
-            callback_data=f"ans_{i}_{is_correct}"
+            callback_data=f"ans_{i}_{is_correct}_{example_id}"
         )])
     
-    await bot.send_message(
-        chat_id=tg_id,
-        text=f"⚡ <b>ВОПРОС ДНЯ</b>\n\n{question}",
-        reply_markup=InlineKeyboardMarkup(kb),
-        parse_mode="HTML"
-    )
+    for attempt in range(2):
+        if limiter:
+            await limiter.wait()
+        try:
+            await bot.send_message(
+                chat_id=tg_id,
+                text=f"⚡ <b>ВОПРОС ДНЯ</b>\n\n{question}",
+                reply_markup=InlineKeyboardMarkup(kb),
+                parse_mode="HTML"
+            )
+            return
+        except RetryAfter as e:
+            if attempt:
+                raise
+            delay = e.retry_after
+            await asyncio.sleep(delay.total_seconds() if hasattr(delay, 'total_seconds') else delay)
+
+
+async def send_quiz_to_user(tg_id, user_id, bot):
+    """Отправляет квиз конкретному пользователю"""
+    try:
+        data = await get_daily_quiz(user_id)
+    except Exception as e:
+        print(f"❌ Ошибка загрузки для {tg_id}: {e}")
+        return
+    
+    await save_quiz_states([(tg_id, data)])
+    await send_quiz_message(tg_id, data, bot)
     print(f"✅ Отправлено пользователю {tg_id}")
 
 
@@ -97,23 +185,18 @@ async def _do_quiz(tg_id, message):
     if not profile:
         return await message.reply_text("❌ /start для привязки")
     
-    async with httpx.AsyncClient(timeout=5) as client:
-        try:
-            r = await client.post(f"{API_URL}/api/daily-quiz/", json={'user_id': profile.user.id})
-            data = r.json()
-        except Exception as e:
-            print(f"❌ Ошибка загрузки: {e}")
-            return await message.reply_text("⚠️ Ошибка загрузки")
-    
-    if 'error' in data:
-        return await message.reply_text("🎉 Вопросы закончились")
+    try:
+        data = await get_daily_quiz(profile.user.id)
+    except Exception as e:
+        print(f"❌ Ошибка загрузки: {e}")
+        return await message.reply_text("⚠️ Ошибка загрузки")
     
     # Сохраняем только ID слова в кэш
     example_id = data.get('example_id')
     if example_id:
-        cache.set(f"quiz_word_{tg_id}", example_id, 300)
+        cache.set(quiz_word_key(tg_id), example_id, QUIZ_STATE_TTL)
     
-    cache.set(f"quiz_exp_{tg_id}", data.get('explanation', ''), 300)
+    cache.set(quiz_exp_key(tg_id), data.get('explanation', ''), QUIZ_STATE_TTL)
     
     # Отправляем вопрос
     question = data['question']
@@ -146,7 +229,7 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if profile:
         return await update.message.reply_text(f"✅ Привет, {profile.user.username}!", reply_markup=menu_kb)
     token = secrets.token_urlsafe(16)
-    cache.set(f"tg_link_{token}", tg_id, 300)
+    cache.set(tg_link_key(token), tg_id, TG_LINK_TTL)
     link_kb = InlineKeyboardMarkup([[InlineKeyboardButton("🔗 Привязать", url=f"{API_URL}/profile/link-telegram/?token={token}")]])
     await update.message.reply_text("👋 Привяжи аккаунт:", reply_markup=link_kb)
 
@@ -159,30 +242,11 @@ async def report_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not profile:
         return await update.message.reply_text("❌ Аккаунт не привязан")
     
-    async with httpx.AsyncClient(timeout=5) as client:
-        try:
-            r = await client.post(
-                f"{API_URL}/api/weekly-report/", 
-                json={'user_id': profile.user.id}
-            )
-            
-            # Проверяем статус
-            if r.status_code != 200:
-                print(f"❌ Статус ошибки: {r.status_code}")
-                print(f"Текст ответа: {r.text[:200]}")
-                return await update.message.reply_text("⚠️ Ошибка получения статистики")
-            
-            # Пробуем получить JSON
-            try:
-                data = r.json()
-            except Exception as e:
-                print(f"❌ Ошибка парсинга JSON: {e}")
-                print(f"Ответ сервера: {r.text[:200]}")
-                return await update.message.reply_text("⚠️ Ошибка формата данных")
-            
-        except Exception as e:
-            print(f"❌ Ошибка отчёта: {e}")
-            return await update.message.reply_text("⚠️ Ошибка загрузки")
+    try:
+        data = await get_weekly_report(profile.user.id)
+    except Exception as e:
+        print(f"❌ Ошибка отчёта: {e}")
+        return await update.message.reply_text("⚠️ Ошибка загрузки")
     
     # Формируем отчет
     msg = f"📊 **Ваша статистика**\n\n"
@@ -225,16 +289,11 @@ async def on_button(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await q.message.reply_text("⏳ Готовлю статистику...")
         await q.edit_message_reply_markup(reply_markup=None)
         
-        async with httpx.AsyncClient(timeout=5) as client:
-            try:
-                r = await client.post(
-                    f"{API_URL}/api/weekly-report/", 
-                    json={'user_id': profile.user.id}
-                )
-                data = r.json()
-            except Exception as e:
-                print(f"❌ Ошибка отчёта: {e}")
-                return await q.message.reply_text("⚠️ Ошибка загрузки статистики")
+        try:
+            data = await get_weekly_report(profile.user.id)
+        except Exception as e:
+            print(f"❌ Ошибка отчёта: {e}")
+            return await q.message.reply_text("⚠️ Ошибка загрузки статистики")
         
         msg = f"📊 **Ваша статистика**\n\n"
         msg += f"📚 **Слов в планинге:** {data.get('total_words', 0)}\n\n"
@@ -278,25 +337,17 @@ async def on_button(update: Update, context: ContextTypes.DEFAULT_TYPE):
         else:
             selected_text = word.incorrect_variant or word.text
         
-        exp = cache.get(f"quiz_exp_{tg_id}", word.orthogram.rule if word.orthogram else "Правило")
+        exp = cache.get(quiz_exp_key(tg_id), word.orthogram.rule if word.orthogram else "Правило")
         
         # Логируем ответ
-        async with httpx.AsyncClient(timeout=3.0) as client:
-            await client.post(
-                f"{API_URL}/api/log-quiz-answer/",
-                json={
-                    'user_id': profile.user.id,
-                    'word_id': word_id,
-                    'was_correct': is_correct
-                }
-            )
+        await log_quiz_answer(profile.user.id, int(word_id), is_correct)
         
         # Формируем ответ
         emoji = "✅ Верно!" if is_correct else "❌ Ошибка!"
         response = f"{emoji}\n{selected_text}\n\n📚 {exp}"
         
         # Очищаем кэш
-        cache.delete(f"quiz_exp_{tg_id}")
+        cache.delete(quiz_exp_key(tg_id))
         
         await q.edit_message_text(response, parse_mode="Markdown")
         
@@ -305,20 +356,11 @@ async def on_button(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await q.edit_message_text("⚠️ Ошибка обработки ответа")
 
 async def log_answer(user_id, word_id, user_word_id, was_correct):
-    """Фоновая отправка лога"""
-    async with httpx.AsyncClient(timeout=3.0) as client:
-        try:
-            await client.post(
-                f"{API_URL}/api/log-quiz-answer/",
-                json={
-                    'user_id': user_id,
-                    'word_id': word_id,
-                    'user_word_id': user_word_id,
-                    'was_correct': was_correct
-                }
-            )
-        except:
-            pass
+    """Фоновая запись ответа"""
+    try:
+        await log_quiz_answer(user_id, word_id, was_correct, user_word_id)
+    except Exception as e:
+        logger.error(f"Ошибка записи ответа: {e}")
 
 async def praise_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Показывает, какие слова выучены лучше всего"""
@@ -327,16 +369,11 @@ async def praise_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not profile:
         return await update.message.reply_text("❌ Аккаунт не привязан")
     
-    async with httpx.AsyncClient(timeout=5) as client:
-        try:
-            r = await client.post(
-                f"{API_URL}/api/user-praise/",
-                json={'user_id': profile.user.id}
-            )
-            data = r.json()
-        except Exception as e:
-            print(f"❌ Ошибка похвалы: {e}")
-            return await update.message.reply_text("⚠️ Ошибка загрузки")
+    try:
+        data = await get_praise_report(profile.user.id)
+    except Exception as e:
+        print(f"❌ Ошибка похвалы: {e}")
+        return await update.message.reply_text("⚠️ Ошибка загрузки")
     
     mastered = data.get('mastered_words', [])
     if not mastered:
@@ -359,16 +396,11 @@ async def repeat_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not profile:
         return await update.message.reply_text("❌ Аккаунт не привязан")
     
-    async with httpx.AsyncClient(timeout=5) as client:
-        try:
-            r = await client.post(
-                f"{API_URL}/api/weak-words/",
-                json={'user_id': profile.user.id}
-            )
-            data = r.json()
-        except Exception as e:
-            print(f"❌ Ошибка загрузки слов: {e}")
-            return await update.message.reply_text("⚠️ Ошибка загрузки")
+    try:
+        data = await get_weak_words_report(profile.user.id)
+    except Exception as e:
+        print(f"❌ Ошибка загрузки слов: {e}")
+        return await update.message.reply_text("⚠️ Ошибка загрузки")
     
     weak_words = data.get('weak_words', [])
     if not weak_words:
@@ -416,6 +448,7 @@ if __name__ == '__main__':
                 days=tuple(range(7)),
                 data={'time': '12:00 MSK'}
             )
+            job_queue.run_repeating(flush_answers, interval=ANSWER_FLUSH_INTERVAL, first=ANSWER_FLUSH_INTERVAL)
             print("🤖 Бот запущен и будет отправлять вопросы ежедневно в 12:00 МСК")
         else:
             print("⚠️ JobQueue не доступен, рассылка не будет работать")
@@ -0,0 +1,103 @@
+# bot_state.py
+"""
+Хранилище состояния VK-ботов (привязка аккаунта, текущий вопрос) с TTL.
+
+BOT_STATE_BACKEND=cache  — общий кэш Django (CACHES в main/settings.py:
+                           файл, Redis или таблица БД). Состояние переживает
+                           перезапуск и доступно нескольким процессам бота.
+BOT_STATE_BACKEND=memory — словарь в памяти процесса с вытеснением
+                           просроченных записей (один процесс, без Django).
+
+    users = make_state_store('vk_user', ttl=30 * 24 * 60 * 60)
+    users.set(vk_id, {'user_id': 5})
+    users.get(vk_id)
+"""
+import os
+import threading
+import time
+
+BOT_STATE_BACKEND = os.getenv('BOT_STATE_BACKEND', 'cache')
+
+
+class MemoryStateStore:
+    """Словарь с TTL. Просроченные записи удаляются при чтении и периодической чисткой."""
+
+    # Полная чистка — раз в столько записей
+    SWEEP_EVERY = 1000
+
+    def __init__(self, namespace, ttl):
+        self.namespace = namespace
+        self.ttl = ttl
+        self._data = {}
+        self._writes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return default
+            expires, value = item
+            if expires < time.monotonic():
+                del self._data[key]
+                return default
+            return value
+
+    def set(self, key, value, ttl=None):
+        with self._lock:
+            self._data[key] = (time.monotonic() + (ttl or self.ttl), value)
+            self._writes += 1
+            if self._writes % self.SWEEP_EVERY == 0:
+                self._sweep()
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def _sweep(self):
+        now = time.monotonic()
+        for key in [key for key, (expires, _) in self._data.items() if expires < now]:
+            del self._data[key]
+
+    def __len__(self):
+        return len(self._data)
+
+
+class CacheStateStore:
+    """Состояние в общем кэше Django; срок жизни соблюдает сам кэш."""
+
+    def __init__(self, namespace, ttl):
+        import django
+        os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'main.settings')
+        django.setup()
+        from django.core.cache import cache
+        from main.cache_keys import bot_state_key
+
+        self.namespace = namespace
+        self.ttl = ttl
+        self._cache = cache
+        self._key = bot_state_key
+
+    def get(self, key, default=None):
+        return self._cache.get(self._key(self.namespace, key), default)
+
+    def set(self, key, value, ttl=None):
+        self._cache.set(self._key(self.namespace, key), value, ttl or self.ttl)
+
+    def delete(self, key):
+        self._cache.delete(self._key(self.namespace, key))
+
+
+STATE_STORES = {
+    'cache': CacheStateStore,
+    'memory': MemoryStateStore,
+}
+
+
+def make_state_store(namespace, ttl, backend=None):
+    backend = backend or BOT_STATE_BACKEND
+    try:
+        store_class = STATE_STORES[backend]
+    except KeyError:
+        raise ValueError(f"Неизвестный BOT_STATE_BACKEND: {backend} (варианты: {', '.join(STATE_STORES)})")
+    return store_class(namespace, ttl)
@@ -0,0 +1,137 @@
+# main/answer_buffer.py
+"""
+Отложенная запись ответов ботов (write-behind).
+
+При ответе в боте пишется одна короткая строка PendingQuizAnswer —
+без чтений, пересчёта веса и свёрток. Строка фиксируется в БД до ответа
+пользователю, поэтому подтверждённый ответ не теряется при падении
+процесса. Периодически буфер переносится пачками:
+QuizHistory — одним bulk_create, свёртки статистики — одним UPDATE на
+ключ, UserWord — одним UPDATE на слово (счётчики и вес через F()).
+Перенос и удаление строк буфера идут в одной транзакции.
+
+Переносит буфер бот (bot.py, каждые ANSWER_FLUSH_INTERVAL секунд)
+или: manage.py flush_quiz_answers --interval 10
+"""
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import ExpressionWrapper, F, FloatField, Value
+from django.db.models.functions import Greatest, Least
+from django.utils import timezone
+
+from .models import PendingQuizAnswer, QuizHistory, UserWord
+from .stats import bump_quiz_rollups, latest_time
+
+ANSWER_FLUSH_INTERVAL = 10   # секунд между переносами
+ANSWER_FLUSH_BATCH = 1000    # ответов за одну транзакцию
+
+
+def enqueue_answer(user_id, word_id, was_correct, user_word_id=None):
+    """Принимает ответ в буфер (одна вставка)."""
+    return PendingQuizAnswer.objects.create(
+        user_id=user_id,
+        word_id=word_id,
+        user_word_id=user_word_id,
+        was_correct=bool(was_correct),
+    )
+
+
+def _weight_expression(errors, successes):
+    """Вес как в UserWord.update_weight, по счётчикам после прибавления."""
+    weight = ExpressionWrapper(
+        Value(1.0) + (F('error_count') + errors) * 2.0 - (F('success_count') + successes) * 0.5,
+        output_field=FloatField(),
+    )
+    return Greatest(Value(0.5), Least(Value(10.0), weight))
+
+
+def _apply_user_words(rows):
+    """Счётчики, вес и расписание повторения слов планинга. Возвращает ID затронутых пользователей."""
+    by_word = defaultdict(list)
+    for row in rows:
+        if row['user_word_id']:
+            by_word[row['user_word_id']].append(row)
+    if not by_word:
+        return set()
+
+    now = timezone.now()
+    # Расписание пишется абсолютными значениями: строки блокируются до конца
+    # транзакции, чтобы параллельный перенос (бот и flush_quiz_answers) проигрывал
+    # свою пачку поверх уже сохранённого состояния. Порядок по id — без взаимоблокировок.
+    user_words = UserWord.objects.select_for_update().order_by('id').in_bulk(list(by_word))
+    for user_word_id, answers in by_word.items():
+        user_word = user_words.get(user_word_id)
+        if user_word is None:
+            continue
+
+        # SM-2 зависит от порядка ответов — проигрываем их по очереди
+        for answer in answers:
+            user_word.schedule_review(answer['was_correct'], answer['answered_at'])
+
+        successes = sum(1 for answer in answers if answer['was_correct'])
+        errors = len(answers) - successes
+        updates = {
+            'success_count': F('success_count') + successes,
+            'error_count': F('error_count') + errors,
+            'weight': _weight_expression(errors, successes),
+            'next_due': user_word.next_due,
+            'interval': user_word.interval,
+            'ease': user_word.ease,
+            'repetitions': user_word.repetitions,
+            'updated_at': now,
+        }
+        if errors:
+            updates['last_error'] = latest_time(
+                'last_error', max(a['answered_at'] for a in answers if not a['was_correct'])
+            )
+        UserWord.objects.filter(id=user_word_id).update(**updates)
+
+    return {user_word.user_id for user_word in user_words.values()}
+
+
+def flush_answer_buffer(batch_size=ANSWER_FLUSH_BATCH):
+    """Переносит одну пачку ответов из буфера. Возвращает число перенесённых."""
+    from .planning_sampler import invalidate_planning_sampler
+
+    with transaction.atomic():
+        rows = list(
+            PendingQuizAnswer.objects.select_for_update(skip_locked=True, of=('self',))
+            .order_by('id')
+            .values('id', 'user_id', 'word_id', 'user_word_id', 'was_correct', 'answered_at',
+                    'word__orthogram_id')[:batch_size]
+        )
+        if not rows:
+            return 0
+
+        QuizHistory.objects.bulk_create([
+            QuizHistory(
+                user_id=row['user_id'],
+                word_id=row['word_id'],
+                user_word_id=row['user_word_id'],
+                was_correct=row['was_correct'],
+                answer_time=row['answered_at'],
+            )
+            for row in rows
+        ])
+        bump_quiz_rollups(
+            (row['user_id'], row['word_id'], row['word__orthogram_id'], row['was_correct'], row['answered_at'])
+            for row in rows
+        )
+        user_ids = _apply_user_words(rows)
+        PendingQuizAnswer.objects.filter(id__in=[row['id'] for row in rows]).delete()
+
+    # Веса изменены UPDATE-ом в обход UserWord.update_weight — деревья выборки строятся заново
+    for user_id in user_ids:
+        invalidate_planning_sampler(user_id)
+    return len(rows)
+
+
+def flush_all_answers(batch_size=ANSWER_FLUSH_BATCH):
+    """Переносит весь буфер. Возвращает число перенесённых ответов."""
+    total = 0
+    while True:
+        flushed = flush_answer_buffer(batch_size)
+        total += flushed
+        if flushed < batch_size:
+            return total
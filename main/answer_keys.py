@@ -0,0 +1,61 @@
+# main/answer_keys.py
+"""
+Хранилище ключей ответов отдельно от сессии.
+
+Генерирующие view раньше клали полный ключ ответов в request.session
+(current_exercise, starting_diagnostic, oge_diagnostic, ...), и каждая пара
+«сгенерировать/проверить» перезаписывала большую строку сессии.
+Теперь ключ сохраняется в таблицу AnswerKey с ограниченным сроком жизни,
+а в сессии остаётся только короткий токен под тем же именем.
+Проверяющий view загружает один нужный ключ по токену из сессии;
+клиенту токен не передаётся.
+"""
+import random
+import secrets
+from datetime import timedelta
+
+from django.utils import timezone
+
+from .models import AnswerKey
+
+# Сколько живёт ключ ответов после генерации
+ANSWER_KEY_TTL = timedelta(hours=3)
+# Доля сохранений, после которых удаляются просроченные ключи
+ANSWER_KEY_CLEANUP_RATE = 0.01
+
+
+def save_answer_key(request, name, data):
+    """Сохраняет ключ ответов и кладёт его токен в сессию."""
+    token = secrets.token_hex(16)
+    AnswerKey.objects.create(
+        token=token,
+        name=name,
+        data=data,
+        expires_at=timezone.now() + ANSWER_KEY_TTL,
+    )
+    request.session[name] = token
+
+    if random.random() < ANSWER_KEY_CLEANUP_RATE:
+        clear_expired_answer_keys()
+
+
+def load_answer_key(request, name, default=None):
+    """
+    Возвращает ключ ответов по токену из сессии.
+    Сессии, созданные до появления хранилища, содержат сам ключ — он
+    возвращается как есть.
+    """
+    token = request.session.get(name)
+    if token is None:
+        return default
+    if not isinstance(token, str):
+        return token
+
+    data = AnswerKey.objects.filter(
+        token=token, name=name, expires_at__gt=timezone.now()
+    ).values_list('data', flat=True).first()
+    return default if data is None else data
+
+
+def clear_expired_answer_keys():
+    return AnswerKey.objects.filter(expires_at__lte=timezone.now()).delete()[0]
@@ -2,6 +2,7 @@
 from datetime import timedelta  # type: ignore
 from django.utils import timezone  # type: ignore
 from .models import UserExample, OrthogramExample, UserProfile
+from .sampling import random_sample
 
 
 
@@ -180,11 +181,11 @@ class NeuroAssistant:
     def get_quiz_question(self):
         """Генерирует вопрос дня для квиза (с двумя кнопками)"""
         # Берём случайный пример для орфограммы 661, который помечен как is_for_quiz=True
-        examples = OrthogramExample.objects.filter(
+        examples = random_sample(OrthogramExample.objects.filter(
             orthogram__id='661',
             is_for_quiz=True,
             is_active=True
-        ).order_by('?')[:1]
+        ), 1)
 
         if not examples:
             return None
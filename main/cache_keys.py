@@ -0,0 +1,57 @@
+# main/cache_keys.py
+"""
+Общее пространство ключей кэша для сайта и ботов.
+
+Ключи, которые пишет один процесс, а читает другой (например, bot.py
+создаёт tg_link_, а link_telegram под gunicorn его читает), собираются
+только здесь, чтобы формат и срок жизни совпадали во всех процессах.
+Общий префикс (KEY_PREFIX) и бэкенд задаются в CACHES (main/settings.py).
+"""
+
+# === Сроки жизни (секунды) ===
+TG_LINK_TTL = 5 * 60      # ссылка привязки Telegram-аккаунта
+QUIZ_STATE_TTL = 5 * 60   # текущий вопрос квиза в боте
+PLANNING_SAMPLER_TTL = 60 * 60  # дерево весов планинга (main/planning_sampler.py)
+DAILY_QUIZ_TTL = 24 * 60 * 60   # показанные сегодня вопросы ежедневного квиза
+
+
+# === Привязка Telegram ===
+
+def tg_link_key(token):
+    return f"tg_link_{token}"
+
+
+# === Состояние квиза в боте (по Telegram ID) ===
+
+def quiz_word_key(tg_id):
+    return f"quiz_word_{tg_id}"
+
+
+def quiz_user_word_key(tg_id):
+    return f"quiz_user_word_{tg_id}"
+
+
+def quiz_exp_key(tg_id):
+    return f"quiz_exp_{tg_id}"
+
+
+# === Ежедневный квиз (по ID пользователя сайта, main/quiz_pool.py) ===
+
+def daily_quiz_shown_key(user_id, day):
+    return f"daily_quiz_shown_{user_id}_{day:%Y%m%d}"
+
+
+def daily_quiz_last_key(user_id):
+    return f"daily_quiz_last_{user_id}"
+
+
+# === Взвешенная выборка планинга (по ID пользователя) ===
+
+def planning_sampler_key(user_id):
+    return f"planning_sampler_{user_id}"
+
+
+# === Состояние VK-ботов (bot_state.py) ===
+
+def bot_state_key(namespace, key):
+    return f"bot_state_{namespace}_{key}"
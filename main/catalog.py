@@ -0,0 +1,163 @@
+# main/catalog.py
+"""
+Каталог активных примеров орфограмм, загружаемый один раз на воркер.
+
+Для каждого OrthogramExample заранее вычисляются:
+- правильная буква (extract_correct_letter),
+- ключ подгруппы задания 10/11 (sz, ao, dt, ыи, еи, ъь),
+- множество классов,
+- разобранный шаблон masked_word (main/masks.py) и нормализованная маска *ID*.
+
+Примеры разложены по корзинам (орфограмма, класс), поэтому генераторы
+выбирают слова из готовых списков без разбора строк и запросов к БД.
+Каталог перестраивается, когда меняется версия индекса выборки
+(см. main/sampling.py — она увеличивается при сохранении примеров).
+"""
+import random
+import threading
+from collections import defaultdict
+
+from .masks import extract_correct_letter, parse_mask
+from .models import OrthogramExample
+from .sampling import get_sampling_version, shuffled_stream
+
+# Конфигурация подгрупп для заданий 10/11
+SUBGROUPS = [
+    {'key': 'sz', 'letters': ['з', 'с'], 'orth_ids': [10, 11]},
+    {'key': 'ao', 'letters': ['а', 'о'], 'orth_ids': [10]},
+    {'key': 'dt', 'letters': ['д', 'т'], 'orth_ids': [10]},
+    {'key': 'ыи', 'letters': ['и', 'ы'], 'orth_ids': [28]},
+    {'key': 'еи', 'letters': ['е', 'и'], 'orth_ids': [29]},
+    {'key': 'ъь', 'letters': ['ъ', 'ь', '/'], 'orth_ids': [6]},
+]
+
+SUBGROUP_ORTH_IDS = {oid for group in SUBGROUPS for oid in group['orth_ids']}
+
+
+def normalize_orth_id(orth_id):
+    """'10' -> 10, нечисловые ID остаются строками."""
+    try:
+        return int(orth_id)
+    except (TypeError, ValueError):
+        return orth_id
+
+
+def get_subgroup_key(orth_id, letter):
+    for group in SUBGROUPS:
+        if orth_id in group['orth_ids'] and letter in group['letters']:
+            return group['key']
+    return None
+
+
+class CatalogEntry:
+    """Пример орфограммы с предвычисленными данными."""
+    __slots__ = ('example', 'id', 'orthogram_id', 'letter', 'subgroup', 'grades', 'masked', 'template', 'mask')
+
+    def __init__(self, example):
+        self.example = example
+        self.id = example.id
+        self.orthogram_id = normalize_orth_id(example.orthogram_id)
+        self.masked = (example.masked_word or '').strip()
+
+        letter = extract_correct_letter(example.text or '', self.masked)
+        self.letter = letter.lower() if letter else ''
+        self.subgroup = get_subgroup_key(self.orthogram_id, self.letter)
+        self.grades = frozenset(example.get_grades_list())
+        self.template = parse_mask(self.masked)
+        self.mask = self.template.fill_all(self.orthogram_id)
+
+
+class OrthogramCatalog:
+    """Корзины примеров по орфограмме и по (орфограмме, классу)."""
+
+    def __init__(self, version):
+        self.version = version
+        self.entries = {}
+        self.all_by_orthogram = defaultdict(list)
+        self.by_orthogram = defaultdict(list)
+        self.by_orthogram_grade = defaultdict(list)
+
+        for example in OrthogramExample.objects.filter(is_active=True).order_by('id'):
+            entry = CatalogEntry(example)
+            self.entries[entry.id] = entry
+            self.all_by_orthogram[entry.orthogram_id].append(entry)
+            # В корзины попадают только примеры с извлекаемой буквой
+            if not entry.letter or '*' not in entry.masked:
+                continue
+            self.by_orthogram[entry.orthogram_id].append(entry)
+            for grade in entry.grades:
+                self.by_orthogram_grade[(entry.orthogram_id, grade)].append(entry)
+
+    def get(self, example_id):
+        return self.entries.get(example_id)
+
+    def bucket(self, orth_id, grade=None, with_letter=True):
+        """
+        Список примеров орфограммы (с фильтром по классу).
+        with_letter=False — все активные примеры, в том числе без извлекаемой
+        буквы (задания 13–15 берут ответы из explanation).
+        """
+        orth_id = normalize_orth_id(orth_id)
+        if not with_letter:
+            return self.all_by_orthogram.get(orth_id, [])
+        if grade:
+            try:
+                grade = int(grade)
+            except (TypeError, ValueError):
+                return []
+            return self.by_orthogram_grade.get((orth_id, grade), [])
+        return self.by_orthogram.get(orth_id, [])
+
+    def stream(self, orth_ids, grade=None, with_letter=True):
+        """
+        Лениво отдаёт примеры указанных орфограмм в случайном порядке без
+        повторов. Списки корзин не копируются: каждый шаг выбирает корзину
+        пропорционально остатку и берёт из неё следующий случайный пример.
+        """
+        streams = []
+        remaining = []
+        for orth_id in dict.fromkeys(orth_ids):
+            bucket = self.bucket(orth_id, grade, with_letter)
+            if bucket:
+                streams.append(shuffled_stream(bucket))
+                remaining.append(len(bucket))
+
+        total = sum(remaining)
+        while total:
+            point = random.randrange(total)
+            for i, size in enumerate(remaining):
+                if point < size:
+                    break
+                point -= size
+            remaining[i] -= 1
+            total -= 1
+            yield next(streams[i])
+
+    def sample(self, orth_ids, k, grade=None, exclude_ids=None, with_letter=True):
+        """Выбирает до k случайных примеров из корзин указанных орфограмм."""
+        candidates = []
+        for orth_id in orth_ids:
+            candidates.extend(self.bucket(orth_id, grade, with_letter))
+        if exclude_ids:
+            candidates = [e for e in candidates if e.id not in exclude_ids]
+        if k >= len(candidates):
+            random.shuffle(candidates)
+            return candidates
+        return random.sample(candidates, k)
+
+
+_catalog = None
+_catalog_lock = threading.Lock()
+
+
+def get_orthogram_catalog():
+    """Возвращает каталог текущего воркера, перестраивая его при смене версии."""
+    global _catalog
+    version = get_sampling_version(OrthogramExample)
+    catalog = _catalog
+    if catalog is not None and catalog.version == version:
+        return catalog
+    with _catalog_lock:
+        if _catalog is None or _catalog.version != version:
+            _catalog = OrthogramCatalog(version)
+        return _catalog
@@ -0,0 +1,228 @@
+# main/diagnostic.py
+"""
+Сборка входящей диагностики (ЕГЭ, задания 1–27).
+
+DiagnosticPools заранее определяет, какой контент нужен всем заданиям,
+и загружает его несколькими общими запросами:
+- примеры орфограмм (задания 9–15) — из каталога воркера (main/catalog.py);
+- примеры пунктограмм (задания 16–21) — один запрос id__in по ID,
+  выбранным из индекса случайной выборки;
+- паронимы (задание 5) — один запрос id__in;
+- лексика (задание 6) — первое слово каждого типа (6100, 6200);
+- тексты с вопросами и вариантами (задания 1–3, 23–26) — первый текст
+  с нужными номерами вопросов; вопросы и варианты подгружаются только к нему.
+
+DiagnosticTimer замеряет время и число SQL-запросов на каждое задание;
+результат отдаётся в заголовке Server-Timing.
+
+Пул готовых вариантов (DiagnosticVariant) пополняется командой
+refill_diagnostic_pool; view забирает вариант из пула и собирает
+диагностику на лету, только если пул пуст.
+"""
+import logging
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.db import connection
+from django.db.models import Count, Prefetch, Q
+
+from .catalog import get_orthogram_catalog
+from .models import (
+    Punktum, PunktumExample, TaskPaponim, WordOk, TextAnalysisTask, TextQuestion, DiagnosticVariant,
+)
+from .sampling import sample_ids
+
+logger = logging.getLogger(__name__)
+
+# Сколько примеров каждой пунктограммы нужно диагностике
+DIAGNOSTIC_PUNKTUM_PLAN = {
+    '1600': 5,   # задание 16
+    '1700': 1,   # задание 17
+    '1800': 1,   # задание 18
+    '1900': 1,   # задание 19
+    '2000': 1,   # задание 20
+    '2100': 1,   # задание 21 (тире)
+    '2101': 1,   # задание 21 (двоеточие)
+    '2102': 1,   # задание 21 (запятые)
+}
+
+TEXT_ANALYSIS_NUMBERS = {
+    '1_3': [1, 2, 3],
+    '23_26': [23, 24, 25, 26],
+}
+
+# Целевой размер пула на каждую пару (экзамен, класс)
+DIAGNOSTIC_POOL_SIZE = 50
+# Варианты старше этого срока не выдаются (контент мог измениться)
+DIAGNOSTIC_VARIANT_MAX_AGE = timedelta(days=1)
+# ЕГЭ-вариант зависит от класса (задания 4 и 7), ОГЭ — нет
+DIAGNOSTIC_POOL_GRADES = {
+    'ege': ['', '3', '4', '5', '6', '7', '8', '9', '10', '11'],
+    'oge': [''],
+}
+
+
+class DiagnosticPools:
+    """Контент для всех заданий диагностики, загруженный заранее."""
+
+    def __init__(self, punktum_plan=None):
+        self.orthograms = get_orthogram_catalog()
+        self._load_punktums(punktum_plan or DIAGNOSTIC_PUNKTUM_PLAN)
+        self._load_paronyms()
+        self._load_wordoks()
+        self._load_text_tasks()
+
+    # --- Пунктограммы (16–21) ---
+    def _load_punktums(self, plan):
+        drawn = {}
+        for punktum_id, count in plan.items():
+            drawn[punktum_id] = sample_ids(
+                PunktumExample.objects.filter(punktum__id=punktum_id, is_active=True),
+                count
+            )
+        all_ids = [pk for ids in drawn.values() for pk in ids]
+        objects = PunktumExample.objects.in_bulk(all_ids) if all_ids else {}
+
+        self.punktum_examples = {
+            punktum_id: [objects[pk] for pk in ids if pk in objects]
+            for punktum_id, ids in drawn.items()
+        }
+        self.punktums = Punktum.objects.in_bulk(list(plan.keys()))
+
+    def punktum_sample(self, punktum_id, count):
+        return self.punktum_examples.get(str(punktum_id), [])[:count]
+
+    def punktum_first(self, punktum_id):
+        examples = self.punktum_sample(punktum_id, 1)
+        return examples[0] if examples else None
+
+    # --- Паронимы (5) ---
+    def _load_paronyms(self):
+        erroneous_ids = sample_ids(TaskPaponim.objects.filter(is_active=True, correct_word__gt=''), 1)
+        correct_ids = sample_ids(TaskPaponim.objects.filter(is_active=True, correct_word__exact=''), 4)
+        objects = TaskPaponim.objects.in_bulk(erroneous_ids + correct_ids) if (erroneous_ids or correct_ids) else {}
+
+        self.paronym_erroneous = objects.get(erroneous_ids[0]) if erroneous_ids else None
+        self.paronym_correct = [objects[pk] for pk in correct_ids if pk in objects]
+
+    # --- Лексика (6) ---
+    def _load_wordoks(self):
+        self.wordoks = {
+            task_type: WordOk.objects.filter(is_active=True, task_type=task_type).first()
+            for task_type in ('6100', '6200')
+        }
+
+    # --- Тексты (1–3, 23–26) ---
+    def _load_text_tasks(self):
+        self.text_tasks = {}
+        for task_type, required_numbers in TEXT_ANALYSIS_NUMBERS.items():
+            # Первый активный текст, у которого есть все нужные вопросы
+            task = (
+                TextAnalysisTask.objects.filter(is_active=True)
+                .annotate(required_count=Count(
+                    'questions', filter=Q(questions__question_number__in=required_numbers),
+                ))
+                .filter(required_count=len(required_numbers))
+                .order_by('order', 'id')
+                .prefetch_related(Prefetch(
+                    'questions',
+                    queryset=TextQuestion.objects.filter(question_number__in=required_numbers)
+                    .order_by('question_number').prefetch_related('options'),
+                    to_attr='required_questions',
+                ))
+                .first()
+            )
+            self.text_tasks[task_type] = (task, task.required_questions) if task else (None, [])
+
+    def text_analysis(self, task_type):
+        if task_type not in TEXT_ANALYSIS_NUMBERS:
+            task_type = '23_26'
+        return self.text_tasks[task_type]
+
+
+class DiagnosticTimer:
+    """Время и число SQL-запросов по шагам сборки диагностики."""
+
+    def __init__(self):
+        self.timings = []
+
+    @contextmanager
+    def step(self, name):
+        queries = [0]
+
+        def count_queries(execute, sql, params, many, context):
+            queries[0] += 1
+            return execute(sql, params, many, context)
+
+        start = time.perf_counter()
+        try:
+            with connection.execute_wrapper(count_queries):
+                yield
+        finally:
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            self.timings.append((name, elapsed_ms, queries[0]))
+
+    @property
+    def total_ms(self):
+        return sum(ms for _, ms, _ in self.timings)
+
+    @property
+    def total_queries(self):
+        return sum(q for _, _, q in self.timings)
+
+    def server_timing_header(self):
+        parts = [f'{name};dur={ms:.1f};desc="{q} q"' for name, ms, q in self.timings]
+        parts.append(f'total;dur={self.total_ms:.1f};desc="{self.total_queries} q"')
+        return ', '.join(parts)
+
+    def log(self, title):
+        details = ', '.join(f'{name}={ms:.0f}ms/{q}q' for name, ms, q in self.timings)
+        logger.info(f"{title}: {self.total_ms:.0f}ms, {self.total_queries} запросов ({details})")
+
+
+# === Пул готовых вариантов ===
+
+def pop_diagnostic_variant(kind, grade=None):
+    """Забирает готовый вариант из пула или возвращает None."""
+    if kind == 'oge':
+        grade = ''
+    try:
+        return DiagnosticVariant.pop(kind, grade or '', max_age=DIAGNOSTIC_VARIANT_MAX_AGE)
+    except Exception as e:
+        logger.error(f"Ошибка чтения пула диагностик ({kind}): {e}", exc_info=True)
+        return None
+
+
+def build_diagnostic_variant(kind, grade=''):
+    """Собирает вариант и возвращает (html, ключ ответов)."""
+    from .views import build_starting_diagnostic, build_oge_diagnostic
+
+    if kind == 'oge':
+        html, answers, _ = build_oge_diagnostic()
+    else:
+        html, answers, _ = build_starting_diagnostic(grade or None)
+    return html, answers
+
+
+def refill_diagnostic_pool(kind, grade='', size=DIAGNOSTIC_POOL_SIZE):
+    """
+    Удаляет устаревшие варианты и досоздаёт недостающие до size.
+    Возвращает число созданных вариантов.
+    """
+    from django.utils import timezone
+
+    pool = DiagnosticVariant.objects.filter(kind=kind, grade=grade)
+    pool.filter(created_at__lt=timezone.now() - DIAGNOSTIC_VARIANT_MAX_AGE).delete()
+
+    missing = size - pool.count()
+    variants = []
+    for _ in range(max(missing, 0)):
+        html, answers = build_diagnostic_variant(kind, grade)
+        # Вариант без ключа ответов не проверить — в пул не кладём
+        if not answers:
+            continue
+        variants.append(DiagnosticVariant(kind=kind, grade=grade, html=html, answers=answers))
+
+    DiagnosticVariant.objects.bulk_create(variants)
+    return len(variants)
@@ -0,0 +1,24 @@
+"""
+Пересчёт свёрток статистики квизов (QuizDailyStat, QuizWordStat) по QuizHistory.
+Run: python manage.py backfill_quiz_stats
+     python manage.py backfill_quiz_stats --user 15 --user 42
+"""
+from django.core.management.base import BaseCommand
+
+from main.models import QuizDailyStat, QuizWordStat
+from main.stats import rebuild_quiz_rollups
+
+
+class Command(BaseCommand):
+    help = 'Заполняет свёртки статистики квизов по истории ответов'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, action='append', dest='user_ids',
+                            help='ID пользователя (можно несколько раз); по умолчанию — все')
+
+    def handle(self, *args, **options):
+        rebuild_quiz_rollups(options['user_ids'])
+        self.stdout.write(
+            f'Строк по дням: {QuizDailyStat.objects.count()}, по словам: {QuizWordStat.objects.count()}'
+        )
+        self.stdout.write(self.style.SUCCESS('Готово!'))
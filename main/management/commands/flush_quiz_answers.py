@@ -0,0 +1,31 @@
+"""
+Перенос буфера ответов ботов (PendingQuizAnswer) в QuizHistory, свёртки и UserWord.
+Run: python manage.py flush_quiz_answers
+     python manage.py flush_quiz_answers --interval 10   # фоновый воркер
+"""
+import time
+
+from django.core.management.base import BaseCommand
+
+from main.answer_buffer import ANSWER_FLUSH_BATCH, flush_all_answers
+
+
+class Command(BaseCommand):
+    help = 'Переносит накопленные ответы квизов из буфера пачками'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=ANSWER_FLUSH_BATCH)
+        parser.add_argument('--interval', type=int, default=0,
+                            help='Повторять каждые N секунд (0 — один проход)')
+
+    def handle(self, *args, **options):
+        while True:
+            flushed = flush_all_answers(options['batch_size'])
+            if flushed:
+                self.stdout.write(f'Перенесено ответов: {flushed}')
+
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
+
+        self.stdout.write(self.style.SUCCESS('Готово!'))
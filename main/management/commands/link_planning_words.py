@@ -0,0 +1,45 @@
+"""
+Заполнение OrthogramExample.text_norm и привязка слов планинга к эталонам.
+Run: python manage.py link_planning_words
+     python manage.py link_planning_words --user 15 --user 42
+"""
+from django.core.management.base import BaseCommand
+
+from main.models import OrthogramExample, UserWord, normalize_word
+from main.planning_links import link_planning_words
+
+
+class Command(BaseCommand):
+    help = 'Нормализует тексты эталонных слов и привязывает к ним слова планингов'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, action='append', dest='user_ids',
+                            help='ID пользователя (можно несколько раз); по умолчанию — все')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+
+        # 1. text_norm для примеров, сохранённых в обход сигналов (bulk_create, update)
+        changed = []
+        for example in OrthogramExample.objects.only('id', 'text', 'text_norm').iterator(chunk_size=batch_size):
+            norm = normalize_word(example.text)
+            if example.text_norm != norm:
+                example.text_norm = norm
+                changed.append(example)
+        OrthogramExample.objects.bulk_update(changed, ['text_norm'], batch_size=batch_size)
+        self.stdout.write(f'Обновлено text_norm: {len(changed)}')
+
+        # 2. Привязка слов без эталона — пачками по ID
+        words = UserWord.objects.filter(reference_word__isnull=True)
+        if options['user_ids']:
+            words = words.filter(user_id__in=options['user_ids'])
+        ids = list(words.order_by('id').values_list('id', flat=True))
+
+        linked = 0
+        for start in range(0, len(ids), batch_size):
+            linked += link_planning_words(
+                UserWord.objects.filter(id__in=ids[start:start + batch_size]), batch_size=batch_size
+            )
+        self.stdout.write(f'Слов без эталона: {len(ids)}, привязано: {linked}')
+        self.stdout.write(self.style.SUCCESS('Готово!'))
@@ -0,0 +1,43 @@
+"""
+Пополнение пула готовых вариантов диагностики (ЕГЭ и ОГЭ).
+Run: python manage.py refill_diagnostic_pool
+     python manage.py refill_diagnostic_pool --kind ege --grades 10,11 --size 200
+     python manage.py refill_diagnostic_pool --interval 60   # фоновый воркер
+"""
+import time
+
+from django.core.management.base import BaseCommand
+
+from main.diagnostic import DIAGNOSTIC_POOL_GRADES, DIAGNOSTIC_POOL_SIZE, refill_diagnostic_pool
+
+
+class Command(BaseCommand):
+    help = 'Пополняет пул готовых вариантов диагностики (DiagnosticVariant)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--kind', choices=['ege', 'oge', 'all'], default='all')
+        parser.add_argument('--size', type=int, default=DIAGNOSTIC_POOL_SIZE,
+                            help='Целевое число вариантов на каждый класс')
+        parser.add_argument('--grades', default='',
+                            help='Классы через запятую (по умолчанию — все)')
+        parser.add_argument('--interval', type=int, default=0,
+                            help='Повторять каждые N секунд (0 — один проход)')
+
+    def handle(self, *args, **options):
+        kinds = ['ege', 'oge'] if options['kind'] == 'all' else [options['kind']]
+
+        while True:
+            for kind in kinds:
+                grades = DIAGNOSTIC_POOL_GRADES[kind]
+                if options['grades'] and kind == 'ege':
+                    grades = [g.strip() for g in options['grades'].split(',')]
+                for grade in grades:
+                    created = refill_diagnostic_pool(kind, grade, options['size'])
+                    if created:
+                        self.stdout.write(f'{kind} (класс {grade or "—"}): добавлено {created}')
+
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
+
+        self.stdout.write(self.style.SUCCESS('Готово!'))
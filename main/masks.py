@@ -0,0 +1,154 @@
+# main/masks.py
+"""
+Разбор шаблонов masked_word («к*12*рова», «Он *1600* сказал *1600* что…»).
+
+Строка разбирается один раз в MaskTemplate — чередование текста и слотов
+*ID*. Генераторы заполняют слоты новыми ID склейкой готовых кусков, без
+регулярных выражений и цепочек replace(..., 1) на каждый запрос.
+Разобранные шаблоны кэшируются в воркере (parse_mask), каталог орфограмм
+хранит шаблон в CatalogEntry.
+
+Здесь же — разбор слова с маской, который нужен и моделям при сохранении
+(first_letter, is_single_mask_valid), и генераторам (extract_correct_letter).
+"""
+import re
+from functools import lru_cache
+
+MASK_RE = re.compile(r'\*([^*]+)\*')
+# Слово с одной маской *цифры* (алфавитные задания ФИПИ)
+SINGLE_MASK_RE = re.compile(r'^[^*]*\*\d+\*[^*]*$')
+
+
+class MaskTemplate:
+    """literals[0] slot[0] literals[1] slot[1] ... literals[-1]"""
+    __slots__ = ('literals', 'slots')
+
+    def __init__(self, masked):
+        pieces = MASK_RE.split(masked or '')
+        self.literals = tuple(pieces[0::2])
+        self.slots = tuple(pieces[1::2])
+
+    def __len__(self):
+        return len(self.slots)
+
+    def count(self, slot_id=None):
+        """Число слотов (только с указанным ID, если он задан)."""
+        if slot_id is None:
+            return len(self.slots)
+        return self.slots.count(str(slot_id))
+
+    def _join(self, fills):
+        out = [self.literals[0]]
+        for fill, literal in zip(fills, self.literals[1:]):
+            out.append(fill)
+            out.append(literal)
+        return ''.join(out)
+
+    def render(self, slot_ids):
+        """Подставляет новые ID во все слоты по порядку."""
+        return self._join(f'*{slot_id}*' for slot_id in slot_ids)
+
+    def fill_all(self, slot_id):
+        """Все слоты -> *slot_id*."""
+        return self._join([f'*{slot_id}*'] * len(self.slots))
+
+    def fill_first(self, slot_id):
+        """Первый слот -> *slot_id*, остальные без изменений."""
+        return self._join(f'*{slot_id if i == 0 else old}*' for i, old in enumerate(self.slots))
+
+    def renumber(self, slot_id, new_ids):
+        """
+        Слоты с ID slot_id получают по очереди ID из new_ids
+        (их должно быть count(slot_id)), остальные не меняются.
+        """
+        slot_id = str(slot_id)
+        new_ids = iter(new_ids)
+        return self._join(f'*{next(new_ids) if old == slot_id else old}*' for old in self.slots)
+
+    def plain(self, fill):
+        """Слоты заменяются символом fill без звёздочек (например, '😊')."""
+        return fill.join(self.literals)
+
+    def slot_offsets(self):
+        """Позиции слотов в тексте, если каждый слот занимает один символ."""
+        offsets = []
+        position = 0
+        for literal in self.literals[:-1]:
+            position += len(literal)
+            offsets.append(position)
+            position += 1
+        return offsets
+
+
+@lru_cache(maxsize=16384)
+def parse_mask(masked):
+    """Разобранный шаблон строки (кэшируется в воркере)."""
+    return MaskTemplate(masked)
+
+
+# === Разбор слова с маской ===
+
+def extract_correct_letter(text, masked_word, orth_id=None):
+    """
+    Извлекает правильную букву/буквы из оригинального текста.
+    Маска *N* в masked_word может заменять одну или несколько букв.
+    """
+    try:
+        # Находим позицию открывающей скобки маски в masked_word
+        mask_start = masked_word.find('*')
+        if mask_start == -1:
+            return ''
+        
+        # Находим позицию закрывающей скобки маски
+        mask_end = masked_word.find('*', mask_start + 1)
+        if mask_end == -1:
+            return ''
+        
+        # В оригинальном text на той же позиции стоит правильная буква/буквы
+        if mask_start >= len(text):
+            return ''
+        
+        # Смотрим, что идёт после маски в masked_word
+        after_mask = masked_word[mask_end + 1:]
+        
+        # Ищем эту же последовательность в оригинальном тексте, начиная с позиции маски
+        text_from_mask = text[mask_start:]
+        
+        # Если after_mask не пустой, ищем его вхождение
+        if after_mask and after_mask in text_from_mask:
+            # Всё, что до after_mask - это искомая буква/буквы
+            pos = text_from_mask.find(after_mask)
+            return text_from_mask[:pos]
+        else:
+            # Если after_mask не найден, берём один символ
+            char = text[mask_start]
+            return '|' if char == '\\' else char
+        
+    except Exception:
+        return ''
+
+
+def first_letter(masked_word):
+    """Первая кириллическая буква в верхнем регистре (Ё -> Е) или ''."""
+    for char in (masked_word or '').upper():
+        if 'А' <= char <= 'Я':
+            return char
+        if char == 'Ё':
+            return 'Е'
+    return ''
+
+
+def is_single_mask_valid(text, masked_word):
+    """
+    Пригодно ли слово для алфавитных заданий: ровно одна маска *цифры*,
+    без двойных пробелов и смайликов, и правильная буква извлекается.
+    """
+    masked = (masked_word or '').strip()
+    return (
+        len(masked) >= 3
+        and masked.count('*') == 2
+        and SINGLE_MASK_RE.match(masked) is not None
+        and '  ' not in masked
+        and '😊' not in masked
+        and bool(extract_correct_letter(text or '', masked_word or ''))
+    )
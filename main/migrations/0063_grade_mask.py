@@ -0,0 +1,96 @@
+# Generated by Django 5.2 on 2026-10-18 12:40
+
+import main.models
+from django.db import migrations, models
+
+
+GRADED_MODELS = [
+    'orthogramexample', 'punktumexample', 'orthoepyword', 'correctionexercise',
+    'ogepunktumexample', 'ogeorthogramexample', 'ogecorrectionexercise',
+]
+
+
+def fill_grade_mask(apps, schema_editor):
+    """Заполняет grade_mask из CSV-поля grades."""
+    for model_name in GRADED_MODELS:
+        Model = apps.get_model('main', model_name)
+        batch = []
+        for obj in Model.objects.exclude(grades='').exclude(grades__isnull=True).only('id', 'grades'):
+            obj.grade_mask = main.models.grades_to_mask(obj.grades)
+            batch.append(obj)
+        Model.objects.bulk_update(batch, ['grade_mask'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0056_add_choices_per_mask'),
+        ('main', '0062_userprofile_link_code_userprofile_link_code_expires_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='correctionexercise',
+            name='grade_mask',
+            field=main.models.GradeMaskField(default=0, editable=False, verbose_name='Классы (битовая маска)'),
+        ),
+        migrations.AddField(
+            model_name='ogecorrectionexercise',
+            name='grade_mask',
+            field=main.models.GradeMaskField(default=0, editable=False, verbose_name='Классы (битовая маска)'),
+        ),
+        migrations.AddField(
+            model_name='ogeorthogramexample',
+            name='grade_mask',
+            field=main.models.GradeMaskField(default=0, editable=False, verbose_name='Классы (битовая маска)'),
+        ),
+        migrations.AddField(
+            model_name='ogepunktumexample',
+            name='grade_mask',
+            field=main.models.GradeMaskField(default=0, editable=False, verbose_name='Классы (битовая маска)'),
+        ),
+        migrations.AddField(
+            model_name='orthoepyword',
+            name='grade_mask',
+            field=main.models.GradeMaskField(default=0, editable=False, verbose_name='Классы (битовая маска)'),
+        ),
+        migrations.AddField(
+            model_name='orthogramexample',
+            name='grade_mask',
+            field=main.models.GradeMaskField(default=0, editable=False, verbose_name='Классы (битовая маска)'),
+        ),
+        migrations.AddField(
+            model_name='punktumexample',
+            name='grade_mask',
+            field=main.models.GradeMaskField(default=0, editable=False, verbose_name='Классы (битовая маска)'),
+        ),
+        migrations.RunPython(fill_grade_mask, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='correctionexercise',
+            index=models.Index(fields=['is_active', 'grade_mask'], name='main_correc_is_acti_a4a763_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ogecorrectionexercise',
+            index=models.Index(fields=['is_active', 'grade_mask'], name='main_ogecor_is_acti_e16588_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ogeorthogramexample',
+            index=models.Index(fields=['orthogram', 'is_active', 'grade_mask'], name='main_ogeort_orthogr_43fe62_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ogepunktumexample',
+            index=models.Index(fields=['punktum', 'is_active', 'grade_mask'], name='main_ogepun_punktum_f31fb9_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='orthoepyword',
+            index=models.Index(fields=['is_active', 'is_correct', 'grade_mask'], name='main_orthoe_is_acti_4e51c7_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='orthogramexample',
+            index=models.Index(fields=['orthogram', 'is_active', 'grade_mask'], name='main_orthog_orthogr_46f894_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='punktumexample',
+            index=models.Index(fields=['punktum', 'is_active', 'grade_mask'], name='main_punktu_punktum_57913f_idx'),
+        ),
+    ]
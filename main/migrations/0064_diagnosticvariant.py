@@ -0,0 +1,29 @@
+# Generated by Django 5.2 on 2026-10-18 12:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0063_grade_mask'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DiagnosticVariant',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('ege', 'ЕГЭ'), ('oge', 'ОГЭ')], max_length=3, verbose_name='Экзамен')),
+                ('grade', models.CharField(blank=True, max_length=2, verbose_name='Класс')),
+                ('html', models.TextField(verbose_name='HTML варианта')),
+                ('answers', models.JSONField(default=dict, verbose_name='Ключ ответов')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'Вариант диагностики',
+                'verbose_name_plural': 'Пул вариантов диагностики',
+                'indexes': [models.Index(fields=['kind', 'grade', 'created_at'], name='main_diagno_kind_c964a4_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.2 on 2026-10-18 13:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0064_diagnosticvariant'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AnswerKey',
+            fields=[
+                ('token', models.CharField(max_length=32, primary_key=True, serialize=False)),
+                ('name', models.CharField(max_length=50, verbose_name='Упражнение')),
+                ('data', models.JSONField(default=dict, verbose_name='Ключ ответов')),
+                ('expires_at', models.DateTimeField(db_index=True, verbose_name='Действует до')),
+            ],
+            options={
+                'verbose_name': 'Ключ ответов',
+                'verbose_name_plural': 'Ключи ответов',
+            },
+        ),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 5.2 on 2026-10-18 13:20
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0065_answerkey'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='QuizDailyStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('correct', models.PositiveIntegerField(default=0)),
+                ('last_error', models.DateTimeField(blank=True, null=True)),
+                ('orthogram', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='main.orthogram')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='quiz_daily_stats', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Статистика квизов по дням',
+                'verbose_name_plural': 'Статистика квизов по дням',
+                'constraints': [models.UniqueConstraint(fields=('user', 'day', 'orthogram'), name='unique_quiz_daily_stat')],
+            },
+        ),
+        migrations.CreateModel(
+            name='QuizWordStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('correct', models.PositiveIntegerField(default=0)),
+                ('last_answer', models.DateTimeField(blank=True, null=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='quiz_word_stats', to=settings.AUTH_USER_MODEL)),
+                ('word', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='main.orthogramexample')),
+            ],
+            options={
+                'verbose_name': 'Статистика квизов по словам',
+                'verbose_name_plural': 'Статистика квизов по словам',
+                'indexes': [models.Index(fields=['user', 'day'], name='main_quizwo_user_id_a4d439_idx')],
+                'constraints': [models.UniqueConstraint(fields=('user', 'word', 'day'), name='unique_quiz_word_stat')],
+            },
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2 on 2026-10-18 13:40
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0066_quiz_stat_rollups'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userword',
+            name='ease',
+            field=models.FloatField(default=2.5, help_text='Коэффициент лёгкости SM-2'),
+        ),
+        migrations.AddField(
+            model_name='userword',
+            name='interval',
+            field=models.FloatField(default=0, help_text='Текущий интервал повторения (дни)'),
+        ),
+        migrations.AddField(
+            model_name='userword',
+            name='next_due',
+            field=models.DateTimeField(default=django.utils.timezone.now, help_text='Когда слово снова пора показать'),
+        ),
+        migrations.AddField(
+            model_name='userword',
+            name='repetitions',
+            field=models.PositiveIntegerField(default=0, help_text='Правильных ответов подряд'),
+        ),
+        migrations.AddIndex(
+            model_name='userword',
+            index=models.Index(fields=['user', 'is_active', 'next_due'], name='main_userwo_user_id_7513dd_idx'),
+        ),
+    ]
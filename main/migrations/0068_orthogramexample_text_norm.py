@@ -0,0 +1,30 @@
+# Generated by Django 5.2 on 2026-10-18 14:10
+
+import main.models
+from django.db import migrations, models
+
+
+def fill_text_norm(apps, schema_editor):
+    """Заполняет text_norm по text для уже существующих примеров."""
+    OrthogramExample = apps.get_model('main', 'OrthogramExample')
+    batch = []
+    for obj in OrthogramExample.objects.only('id', 'text').iterator(chunk_size=2000):
+        obj.text_norm = main.models.normalize_word(obj.text)
+        batch.append(obj)
+    OrthogramExample.objects.bulk_update(batch, ['text_norm'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0067_userword_spaced_repetition'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='orthogramexample',
+            name='text_norm',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=300, verbose_name='Нормализованный текст'),
+        ),
+        migrations.RunPython(fill_text_norm, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.2 on 2026-10-18 15:05
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0068_orthogramexample_text_norm'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='quizhistory',
+            name='answer_time',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.CreateModel(
+            name='PendingQuizAnswer',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('was_correct', models.BooleanField()),
+                ('answered_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+                ('user_word', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='main.userword')),
+                ('word', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='main.orthogramexample')),
+            ],
+            options={
+                'verbose_name': 'Ответ в очереди',
+                'verbose_name_plural': 'Ответы в очереди',
+            },
+        ),
+    ]
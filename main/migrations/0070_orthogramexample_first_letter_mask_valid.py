@@ -0,0 +1,40 @@
+# Generated by Django 5.2 on 2026-10-18 13:09
+
+import main.masks
+from django.db import migrations, models
+
+
+def fill_mask_fields(apps, schema_editor):
+    """Заполняет first_letter и mask_valid для уже существующих примеров."""
+    OrthogramExample = apps.get_model('main', 'OrthogramExample')
+    batch = []
+    for obj in OrthogramExample.objects.only('id', 'text', 'masked_word').iterator(chunk_size=2000):
+        obj.first_letter = main.masks.first_letter(obj.masked_word)
+        obj.mask_valid = main.masks.is_single_mask_valid(obj.text, obj.masked_word)
+        batch.append(obj)
+    OrthogramExample.objects.bulk_update(batch, ['first_letter', 'mask_valid'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0069_pendingquizanswer'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='orthogramexample',
+            name='first_letter',
+            field=models.CharField(blank=True, editable=False, max_length=1, verbose_name='Первая буква (Ё -> Е)'),
+        ),
+        migrations.AddField(
+            model_name='orthogramexample',
+            name='mask_valid',
+            field=models.BooleanField(default=False, editable=False, verbose_name='Одна корректная маска'),
+        ),
+        migrations.RunPython(fill_mask_fields, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='orthogramexample',
+            index=models.Index(condition=models.Q(('is_active', True), ('mask_valid', True)), fields=['orthogram', 'first_letter'], name='orthexample_alphabet_idx'),
+        ),
+    ]
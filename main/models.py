@@ -1,10 +1,62 @@
 from django.db import models
+from django.utils import timezone
+from datetime import timedelta
 import random
 from django.db.models import Q
 from django.contrib.auth.models import User
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, post_delete, pre_save
 from django.dispatch import receiver
 
+from .masks import first_letter, is_single_mask_valid
+
+
+# === Классы как битовая маска (бит N = класс N) ===
+
+def grades_to_mask(grades):
+    """
+    '5,6,7' / 11 / [10, 11] -> битовая маска классов.
+    Пустое значение -> 0 (пример подходит для всех классов).
+    """
+    if grades is None or grades == '':
+        return 0
+    if isinstance(grades, int):
+        items = [grades]
+    elif isinstance(grades, str):
+        items = grades.split(',')
+    else:
+        items = grades
+    mask = 0
+    for g in items:
+        g = str(g).strip()
+        if g.isdigit() and 0 < int(g) < 31:
+            mask |= 1 << int(g)
+    return mask
+
+
+# === Нормализованный текст слова (поиск эталона для планинга) ===
+
+def normalize_word(text):
+    """' Ёлка ' -> 'елка': без пробелов по краям, нижний регистр, ё -> е."""
+    return (text or '').strip().lower().replace('ё', 'е')
+
+
+class GradeMaskField(models.PositiveIntegerField):
+    """Битовая маска классов, вычисляется из CSV-поля grades при сохранении."""
+
+
+@GradeMaskField.register_lookup
+class HasGrade(models.Lookup):
+    """grade_mask__has_grade=11 или grade_mask__has_grade=[10, 11] (любой из)."""
+    lookup_name = 'has_grade'
+
+    def get_prep_lookup(self):
+        return grades_to_mask(self.rhs)
+
+    def as_sql(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        rhs, rhs_params = self.process_rhs(compiler, connection)
+        return f'({lhs} & {rhs}) != 0', list(lhs_params) + list(rhs_params)
+
 
 class UserProfile(models.Model):
     user = models.OneToOneField(
@@ -162,7 +214,14 @@ class Orthogram(models.Model):
 class OrthogramExample(models.Model):
     orthogram = models.ForeignKey(Orthogram, on_delete=models.CASCADE)
     text = models.CharField(max_length=300)                    # например: "вода"
+    text_norm = models.CharField(max_length=300, blank=True, db_index=True, editable=False,
+                                 verbose_name="Нормализованный текст")  # см. normalize_word
     masked_word = models.CharField(max_length=300)             # например: "в*1*да"
+    # Вычисляются из masked_word при сохранении (main/masks.py)
+    first_letter = models.CharField(max_length=1, blank=True, editable=False,
+                                    verbose_name="Первая буква (Ё -> Е)")
+    mask_valid = models.BooleanField(default=False, editable=False,
+                                     verbose_name="Одна корректная маска")
     incorrect_variant = models.CharField(max_length=300, blank=True, null=True)
     explanation = models.TextField(blank=True)
     correct_letters = models.CharField(
@@ -194,6 +253,7 @@ class OrthogramExample(models.Model):
         blank=True,
         help_text="Через запятую: 5,6,7"
     )
+    grade_mask = GradeMaskField(default=0, editable=False, verbose_name="Классы (битовая маска)")
 
     created_at = models.DateTimeField(auto_now_add=True)
 
@@ -211,6 +271,13 @@ class OrthogramExample(models.Model):
         grades_display = self.grades or 'все'
         return f"{self.text} (орф. {self.orthogram.id}, классы: {grades_display})"
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['orthogram', 'is_active', 'grade_mask']),
+            models.Index(fields=['orthogram', 'first_letter'], condition=Q(is_active=True, mask_valid=True),
+                         name='orthexample_alphabet_idx'),
+        ]
+
 
 
 class Punktum(models.Model):
@@ -278,6 +345,7 @@ class PunktumExample(models.Model):
         blank=True,
         help_text="Через запятую: 5,6,7"
     )
+    grade_mask = GradeMaskField(default=0, editable=False, verbose_name="Классы (битовая маска)")
 
     created_at = models.DateTimeField(auto_now_add=True)
 
@@ -294,6 +362,11 @@ class PunktumExample(models.Model):
         grades_display = self.grades or 'все'
         return f"{self.text} (пунктограмма {self.punktum.id}, классы: {grades_display})"
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['punktum', 'is_active', 'grade_mask']),
+        ]
+
 
 class UserWord(models.Model):
     """Слова из планинга пользователя"""
@@ -318,10 +391,21 @@ class UserWord(models.Model):
     success_count = models.IntegerField(default=0, help_text="Сколько раз ответили правильно")
     last_shown = models.DateTimeField(null=True, blank=True)
     last_error = models.DateTimeField(null=True, blank=True)
+
+    # 👇 ИНТЕРВАЛЬНОЕ ПОВТОРЕНИЕ (SM-2)
+    next_due = models.DateTimeField(default=timezone.now, help_text="Когда слово снова пора показать")
+    interval = models.FloatField(default=0, help_text="Текущий интервал повторения (дни)")
+    ease = models.FloatField(default=2.5, help_text="Коэффициент лёгкости SM-2")
+    repetitions = models.PositiveIntegerField(default=0, help_text="Правильных ответов подряд")
     
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)  # для отслеживания изменений
 
+    # Параметры SM-2
+    MIN_EASE = 1.3
+    RETRY_DELAY = timedelta(minutes=10)   # после ошибки слово возвращается быстро
+    SHOW_DELAY = timedelta(minutes=10)    # показанное слово не повторяется сразу
+
     class Meta:
         verbose_name = "Слово пользователя"
         verbose_name_plural = "Слова пользователей"
@@ -329,6 +413,7 @@ class UserWord(models.Model):
         indexes = [
             models.Index(fields=['user', 'in_master', 'is_active']),
             models.Index(fields=['user', 'weight']),  # для сортировки по весу
+            models.Index(fields=['user', 'is_active', 'next_due']),  # очередь повторения
         ]
 
     def update_weight(self):
@@ -339,6 +424,78 @@ class UserWord(models.Model):
         self.weight = max(0.5, min(10.0, new_weight))  # ограничиваем от 0.5 до 10
         self.save(update_fields=['weight', 'updated_at'])
 
+        from .planning_sampler import update_planning_weight
+        update_planning_weight(self.user_id, self.id, self.weight)
+
+    def schedule_review(self, was_correct, now=None):
+        """
+        Пересчитывает интервал по SM-2 (ответ оценивается как 4 — верно, 1 — ошибка).
+        Не сохраняет модель.
+        """
+        now = now or timezone.now()
+        quality = 4 if was_correct else 1
+
+        if was_correct:
+            self.repetitions += 1
+            if self.repetitions == 1:
+                self.interval = 1
+            elif self.repetitions == 2:
+                self.interval = 6
+            else:
+                self.interval = round(self.interval * self.ease, 1)
+            self.next_due = now + timedelta(days=self.interval)
+        else:
+            self.repetitions = 0
+            self.interval = 0
+            self.next_due = now + self.RETRY_DELAY
+
+        self.ease = max(self.MIN_EASE, self.ease + 0.1 - (5 - quality) * (0.08 + (5 - quality) * 0.02))
+
+    def register_answer(self, was_correct):
+        """Учитывает ответ: счётчики, расписание повторения и вес."""
+        now = timezone.now()
+        if was_correct:
+            self.success_count += 1
+        else:
+            self.error_count += 1
+            self.last_error = now
+        self.schedule_review(was_correct, now)
+        self.save(update_fields=[
+            'success_count', 'error_count', 'last_error',
+            'next_due', 'interval', 'ease', 'repetitions', 'updated_at',
+        ])
+        self.update_weight()
+
+    @classmethod
+    def quiz_ready(cls, user):
+        """Слова планинга, пригодные для квиза (есть эталон с объяснением и ошибочным вариантом)"""
+        return cls.objects.filter(
+            user=user,
+            is_active=True,
+            reference_word__is_active=True,
+            reference_word__is_user_added=False,
+        ).exclude(
+            reference_word__explanation__isnull=True,
+        ).exclude(
+            reference_word__explanation='',
+        ).exclude(
+            reference_word__incorrect_variant__isnull=True,
+        ).exclude(
+            reference_word__incorrect_variant='',
+        )
+
+    @classmethod
+    def next_due_word(cls, user):
+        """Слово с самым ранним сроком повторения — один запрос по индексу (user, is_active, next_due)"""
+        return cls.quiz_ready(user).select_related('reference_word__orthogram').order_by('next_due', 'id').first()
+
+    def mark_shown(self, now=None):
+        """Откладывает показанное слово, чтобы очередь шла дальше до ответа"""
+        now = now or timezone.now()
+        self.last_shown = now
+        self.next_due = max(self.next_due, now) + self.SHOW_DELAY
+        UserWord.objects.filter(pk=self.pk).update(last_shown=self.last_shown, next_due=self.next_due)
+
     def __str__(self):
         return f"{self.user.username}: {self.text} (вес={self.weight:.1f})"
     
@@ -349,7 +506,7 @@ class QuizHistory(models.Model):
     word = models.ForeignKey('OrthogramExample', on_delete=models.CASCADE)
     user_word = models.ForeignKey('UserWord', null=True, blank=True, on_delete=models.SET_NULL)
     was_correct = models.BooleanField()
-    answer_time = models.DateTimeField(auto_now_add=True)
+    answer_time = models.DateTimeField(default=timezone.now)  # из буфера приходит время ответа
     
     class Meta:
         verbose_name = "История квизов"
@@ -364,6 +521,68 @@ class QuizHistory(models.Model):
         return f"{self.user.username} - {self.word.text} - {'✅' if self.was_correct else '❌'}"
 
 
+class PendingQuizAnswer(models.Model):
+    """
+    Буфер ответов ботов (main/answer_buffer.py): строка пишется при ответе,
+    а в QuizHistory, свёртки и UserWord переносится пачкой.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    word = models.ForeignKey('OrthogramExample', on_delete=models.CASCADE)
+    user_word = models.ForeignKey('UserWord', null=True, blank=True, on_delete=models.SET_NULL)
+    was_correct = models.BooleanField()
+    answered_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        verbose_name = "Ответ в очереди"
+        verbose_name_plural = "Ответы в очереди"
+
+    def __str__(self):
+        return f"{self.user_id} слово {self.word_id}: {'✅' if self.was_correct else '❌'}"
+
+
+class QuizDailyStat(models.Model):
+    """Свёртка QuizHistory: попытки по (пользователь, день, орфограмма)"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='quiz_daily_stats')
+    day = models.DateField()
+    orthogram = models.ForeignKey('Orthogram', on_delete=models.CASCADE)
+    attempts = models.PositiveIntegerField(default=0)
+    correct = models.PositiveIntegerField(default=0)
+    last_error = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = "Статистика квизов по дням"
+        verbose_name_plural = "Статистика квизов по дням"
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'day', 'orthogram'], name='unique_quiz_daily_stat'),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} {self.day} орф. {self.orthogram_id}: {self.correct}/{self.attempts}"
+
+
+class QuizWordStat(models.Model):
+    """Свёртка QuizHistory: попытки по (пользователь, слово) с разбивкой по дням"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='quiz_word_stats')
+    word = models.ForeignKey('OrthogramExample', on_delete=models.CASCADE)
+    day = models.DateField()
+    attempts = models.PositiveIntegerField(default=0)
+    correct = models.PositiveIntegerField(default=0)
+    last_answer = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = "Статистика квизов по словам"
+        verbose_name_plural = "Статистика квизов по словам"
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'word', 'day'], name='unique_quiz_word_stat'),
+        ]
+        indexes = [
+            models.Index(fields=['user', 'day']),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} {self.day} слово {self.word_id}: {self.correct}/{self.attempts}"
+
+
 class StudentAnswer(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, verbose_name="Пользователь")
     orthogram = models.ForeignKey(Orthogram, on_delete=models.CASCADE, verbose_name="Орфограмма")
@@ -464,11 +683,15 @@ class OrthoepyWord(models.Model):
         verbose_name="Классы",
         help_text="Например: 5,6,7"
     )
+    grade_mask = GradeMaskField(default=0, editable=False, verbose_name="Классы (битовая маска)")
 
     class Meta:
         verbose_name = "Слово для орфоэпии"
         verbose_name_plural = "Слова для орфоэпии"
         ordering = ['word']
+        indexes = [
+            models.Index(fields=['is_active', 'is_correct', 'grade_mask']),
+        ]
 
     def __str__(self):
         status = "✓" if self.is_correct else "✗"
@@ -487,77 +710,12 @@ class OrthoepyWord(models.Model):
         - 2-4 правильных варианта
         - 1-3 неправильных варианта
         - НЕТ повторений лемм в одном тесте
+        
+        Слова берутся из корзин лемм воркера (main/orthoepy_pairs.py).
         """
-        from django.db.models import Q
-        import random
+        from .orthoepy_pairs import generate_orthoepy_test
 
-        # Фильтруем только активные слова
-        queryset = OrthoepyWord.objects.filter(is_active=True)
-        
-        # Фильтрация по классам
-        if user_grade:
-            queryset = queryset.filter(
-                Q(grades__contains=str(user_grade)) | 
-                Q(grades='') | 
-                Q(grades__isnull=True)
-            )
-        
-        # Разделяем на правильные и неправильные
-        correct_words = list(queryset.filter(is_correct=True))
-        incorrect_words = list(queryset.filter(is_correct=False))
-        
-        # Проверяем, достаточно ли слов
-        if len(correct_words) < correct_min or len(incorrect_words) < 1:
-            return None
-        
-        # Случайное количество правильных ответов (2-4)
-        num_correct = random.randint(correct_min, correct_max)
-        num_incorrect = num_options - num_correct
-        
-        # Если неправильных слов меньше, чем нужно — корректируем
-        if len(incorrect_words) < num_incorrect:
-            num_incorrect = len(incorrect_words)
-            num_correct = num_options - num_incorrect
-        
-        # === ВЫБИРАЕМ УНИКАЛЬНЫЕ ЛЕММЫ ===
-        selected_correct = []
-        used_lemmas = set()
-        
-        # Выбираем правильные варианты с уникальными леммами
-        random.shuffle(correct_words)
-        for word in correct_words:
-            if len(selected_correct) >= num_correct:
-                break
-            if word.lemma not in used_lemmas:
-                selected_correct.append(word)
-                used_lemmas.add(word.lemma)
-        
-        # Выбираем неправильные варианты с уникальными леммами
-        selected_incorrect = []
-        random.shuffle(incorrect_words)
-        for word in incorrect_words:
-            if len(selected_incorrect) >= num_incorrect:
-                break
-            if word.lemma not in used_lemmas:
-                selected_incorrect.append(word)
-                used_lemmas.add(word.lemma)
-        
-        # Проверяем, что набрали достаточно вариантов
-        if len(selected_correct) < num_correct or len(selected_incorrect) < num_incorrect:
-            return None
-        
-        # Объединяем и перемешиваем
-        all_variants = selected_correct + selected_incorrect
-        random.shuffle(all_variants)
-        
-        # Формируем результат
-        variants = [word.word for word in all_variants]
-        correct_answers = [word.word for word in selected_correct]
-        
-        return {
-            'variants': variants,
-            'correct_answers': correct_answers,
-        }
+        return generate_orthoepy_test(num_options, correct_min, correct_max, grade=user_grade)
 
 # ===== ЗАДАНИЕ 5 ==============================================================
 class TaskPaponim(models.Model):
@@ -670,6 +828,7 @@ class CorrectionExercise(models.Model):
         blank=True,
         verbose_name="Классы (через запятую)"
     )
+    grade_mask = GradeMaskField(default=0, editable=False, verbose_name="Классы (битовая маска)")
     is_active = models.BooleanField(default=True, verbose_name="Активно")
     is_for_quiz = models.BooleanField(
         default=False,
@@ -681,6 +840,9 @@ class CorrectionExercise(models.Model):
     class Meta:
         verbose_name = "ЗАДАНИЕ 7: исправь ошибку"
         verbose_name_plural = "ЗАДАНИЕ 7: исправь ошибку"
+        indexes = [
+            models.Index(fields=['is_active', 'grade_mask']),
+        ]
 
     def __str__(self):
         return f"{self.incorrect_text} → {self.correct_text}"
@@ -697,7 +859,7 @@ class CorrectionExercise(models.Model):
         exercises = CorrectionExercise.objects.filter(is_active=True)
         if user_grade:
             exercises = exercises.filter(
-                Q(grades__contains=user_grade) | Q(grades='') | Q(grades__isnull=True)
+                Q(grade_mask__has_grade=user_grade) | Q(grade_mask=0)
             )
         exercises = list(exercises)
         if len(exercises) < num_options:
@@ -1097,6 +1259,7 @@ class OgePunktumExample(models.Model):
         blank=True,
         help_text="Через запятую: 5,6,7"
     )
+    grade_mask = GradeMaskField(default=0, editable=False, verbose_name="Классы (битовая маска)")
     created_at = models.DateTimeField(auto_now_add=True)
 
     def get_grades_list(self):
@@ -1115,6 +1278,9 @@ class OgePunktumExample(models.Model):
     class Meta:
         verbose_name = "ОГЭ: Пример пунктуации (задание 5)"
         verbose_name_plural = "ОГЭ: Примеры пунктуации (задание 5)"
+        indexes = [
+            models.Index(fields=['punktum', 'is_active', 'grade_mask']),
+        ]
 
 
 # ===== ЗАДАНИЕ ОГЭ 7: Орфография (смайлики букв) =======================
@@ -1178,6 +1344,7 @@ class OgeOrthogramExample(models.Model):
         blank=True,
         help_text="Через запятую: 5,6,7"
     )
+    grade_mask = GradeMaskField(default=0, editable=False, verbose_name="Классы (битовая маска)")
     created_at = models.DateTimeField(auto_now_add=True)
 
     def get_grades_list(self):
@@ -1196,6 +1363,9 @@ class OgeOrthogramExample(models.Model):
     class Meta:
         verbose_name = "ОГЭ: Пример орфограммы (задание 7)"
         verbose_name_plural = "ОГЭ: Примеры орфограмм (задание 7)"
+        indexes = [
+            models.Index(fields=['orthogram', 'is_active', 'grade_mask']),
+        ]
 
 
 # ===== ЗАДАНИЯ ОГЭ 8, 9: Инпуты ========================================
@@ -1225,6 +1395,7 @@ class OgeCorrectionExercise(models.Model):
         blank=True,
         verbose_name="Классы (через запятую)"
     )
+    grade_mask = GradeMaskField(default=0, editable=False, verbose_name="Классы (битовая маска)")
     is_active = models.BooleanField(default=True, verbose_name="Активно")
     is_for_quiz = models.BooleanField(default=False, verbose_name="Для квизов")
     created_at = models.DateTimeField(auto_now_add=True)
@@ -1232,6 +1403,9 @@ class OgeCorrectionExercise(models.Model):
     class Meta:
         verbose_name = "ОГЭ: Задание 8 — исправь ошибку"
         verbose_name_plural = "ОГЭ: Задание 8 — исправь ошибку"
+        indexes = [
+            models.Index(fields=['is_active', 'grade_mask']),
+        ]
 
     def __str__(self):
         return f"{self.incorrect_text} → {self.correct_text}"
@@ -1243,7 +1417,7 @@ class OgeCorrectionExercise(models.Model):
         exercises = OgeCorrectionExercise.objects.filter(is_active=True)
         if user_grade:
             exercises = exercises.filter(
-                Q(grades__contains=user_grade) | Q(grades='') | Q(grades__isnull=True)
+                Q(grade_mask__has_grade=user_grade) | Q(grade_mask=0)
             )
         exercises = list(exercises)
         if len(exercises) < num_options:
@@ -1292,3 +1466,139 @@ class OgeWordOk(models.Model):
     class Meta:
         verbose_name = "ОГЭ: Задание 9 — лексические нормы"
         verbose_name_plural = "ОГЭ: Задание 9 — лексические нормы"
+
+
+class DiagnosticVariant(models.Model):
+    """
+    Готовый вариант диагностики: отрендеренный HTML и ключ ответов.
+    Пул пополняется командой refill_diagnostic_pool, view забирает вариант
+    вместо сборки на лету.
+    """
+    KIND_CHOICES = [
+        ('ege', 'ЕГЭ'),
+        ('oge', 'ОГЭ'),
+    ]
+
+    kind = models.CharField(max_length=3, choices=KIND_CHOICES, verbose_name="Экзамен")
+    grade = models.CharField(max_length=2, blank=True, verbose_name="Класс")
+    html = models.TextField(verbose_name="HTML варианта")
+    answers = models.JSONField(default=dict, verbose_name="Ключ ответов")
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    @classmethod
+    def pop(cls, kind, grade='', max_age=None):
+        """
+        Забирает самый старый вариант из пула и удаляет его.
+        Параллельные запросы не получают один и тот же вариант (skip_locked).
+        """
+        from django.db import transaction
+        from django.utils import timezone
+
+        qs = cls.objects.filter(kind=kind, grade=grade or '')
+        if max_age:
+            qs = qs.filter(created_at__gte=timezone.now() - max_age)
+
+        with transaction.atomic():
+            variant = qs.select_for_update(skip_locked=True).order_by('created_at').first()
+            if variant:
+                variant.delete()
+        return variant
+
+    def __str__(self):
+        return f"{self.get_kind_display()} ({self.grade or 'без класса'}) от {self.created_at:%d.%m.%Y %H:%M}"
+
+    class Meta:
+        verbose_name = "Вариант диагностики"
+        verbose_name_plural = "Пул вариантов диагностики"
+        indexes = [
+            models.Index(fields=['kind', 'grade', 'created_at']),
+        ]
+
+
+class AnswerKey(models.Model):
+    """
+    Ключ ответов сгенерированного упражнения (см. main/answer_keys.py).
+    В сессии хранится только токен, сам ключ — здесь.
+    """
+    token = models.CharField(max_length=32, primary_key=True)
+    name = models.CharField(max_length=50, verbose_name="Упражнение")
+    data = models.JSONField(default=dict, verbose_name="Ключ ответов")
+    expires_at = models.DateTimeField(db_index=True, verbose_name="Действует до")
+
+    def __str__(self):
+        return f"{self.name}: {self.token}"
+
+    class Meta:
+        verbose_name = "Ключ ответов"
+        verbose_name_plural = "Ключи ответов"
+
+
+# === Сброс индексов случайной выборки (main/sampling.py) ===
+SAMPLED_MODELS = (
+    OrthogramExample, PunktumExample, OrthoepyWord, TaskPaponim, WordOk,
+    CorrectionExercise, OgeTextAnalysisTask, OgePunktumExample,
+    OgeOrthogramExample, OgeCorrectionExercise, OgeWordOk,
+)
+
+
+def invalidate_sampling_index(sender, **kwargs):
+    from .sampling import bump_sampling_version
+    bump_sampling_version(sender)
+
+
+for _model in SAMPLED_MODELS:
+    post_save.connect(invalidate_sampling_index, sender=_model, dispatch_uid=f'sampling_save_{_model.__name__}')
+    post_delete.connect(invalidate_sampling_index, sender=_model, dispatch_uid=f'sampling_delete_{_model.__name__}')
+
+
+# === Нормализованный текст эталонных слов ===
+
+def sync_text_norm(sender, instance, **kwargs):
+    instance.text_norm = normalize_word(instance.text)
+
+
+pre_save.connect(sync_text_norm, sender=OrthogramExample, dispatch_uid='text_norm_orthogramexample')
+
+
+# === Первая буква и валидность маски (алфавитные задания) ===
+
+def sync_mask_fields(sender, instance, **kwargs):
+    instance.first_letter = first_letter(instance.masked_word)
+    instance.mask_valid = is_single_mask_valid(instance.text, instance.masked_word)
+
+
+pre_save.connect(sync_mask_fields, sender=OrthogramExample, dispatch_uid='mask_fields_orthogramexample')
+
+
+# === Сброс дерева весов планинга (main/planning_sampler.py) ===
+# Поля, которые меняет ответ в квизе: вес обновляется в дереве точечно
+ANSWER_FIELDS = frozenset({
+    'weight', 'success_count', 'error_count', 'last_error',
+    'next_due', 'interval', 'ease', 'repetitions', 'updated_at',
+})
+
+
+def invalidate_user_planning(sender, instance, update_fields=None, **kwargs):
+    if update_fields and set(update_fields) <= ANSWER_FIELDS:
+        return
+    from .planning_sampler import invalidate_planning_sampler
+    invalidate_planning_sampler(instance.user_id)
+
+
+post_save.connect(invalidate_user_planning, sender=UserWord, dispatch_uid='planning_sampler_save')
+post_delete.connect(invalidate_user_planning, sender=UserWord, dispatch_uid='planning_sampler_delete')
+
+
+# === Синхронизация grade_mask с CSV-полем grades ===
+GRADED_MODELS = (
+    OrthogramExample, PunktumExample, OrthoepyWord, CorrectionExercise,
+    OgePunktumExample, OgeOrthogramExample, OgeCorrectionExercise,
+)
+
+
+def sync_grade_mask(sender, instance, **kwargs):
+    instance.grade_mask = grades_to_mask(instance.grades)
+
+
+for _model in GRADED_MODELS:
+    pre_save.connect(sync_grade_mask, sender=_model, dispatch_uid=f'grade_mask_{_model.__name__}')
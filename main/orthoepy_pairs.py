@@ -0,0 +1,180 @@
+# main/orthoepy_pairs.py
+"""
+Готовые пары «правильное / неправильное ударение» для квизов по орфоэпии.
+
+Все активные OrthoepyWord загружаются одним запросом и группируются
+по лемме: каждое слово с правильным ударением получает в пару первое
+(по алфавиту) неправильное слово той же леммы. Пары хранятся в памяти
+воркера и перестраиваются, когда меняется версия индекса выборки
+OrthoepyWord (см. main/sampling.py), поэтому выбор пары — O(1).
+
+Тот же проход строит корзины лемм: лемма -> (правильные слова,
+неправильные слова), по классу — отдельный кэш. generate_orthoepy_test
+(задание 4 в тренажёре и в диагностиках) выбирает сразу разные леммы,
+не загружая таблицу на каждый запрос.
+"""
+import random
+import threading
+from itertools import groupby
+
+from .models import OrthoepyWord
+from .sampling import get_sampling_version, shuffled_stream
+
+
+class OrthoepyPair:
+    """Пара вариантов одной леммы."""
+    __slots__ = ('lemma', 'correct_id', 'correct_word', 'incorrect_id', 'incorrect_word', 'grade_mask')
+
+    def __init__(self, correct, incorrect):
+        self.lemma = correct['lemma']
+        self.correct_id = correct['id']
+        self.correct_word = correct['word']
+        self.incorrect_id = incorrect['id']
+        self.incorrect_word = incorrect['word']
+        self.grade_mask = correct['grade_mask']
+
+    def has_grade(self, grade):
+        """Слова без классов подходят всем."""
+        return not self.grade_mask or bool(self.grade_mask & (1 << int(grade)))
+
+
+class LemmaBuckets:
+    """Леммы, доступные классу: (лемма, правильные слова, неправильные слова)."""
+
+    def __init__(self, lemmas):
+        self.with_correct = [lemma for lemma in lemmas if lemma[1]]
+        self.with_incorrect = [lemma for lemma in lemmas if lemma[2]]
+        self.correct_words = sum(len(lemma[1]) for lemma in self.with_correct)
+
+
+def _grade_filter(grade):
+    """Слова без классов (grade_mask=0) подходят всем."""
+    bit = 1 << grade
+    return lambda grade_mask: not grade_mask or bool(grade_mask & bit)
+
+
+class OrthoepyPairIndex:
+    def __init__(self, version):
+        self.version = version
+        self.pairs = []
+        self.lemmas = []  # (лемма, [(слово, grade_mask)], [(слово, grade_mask)])
+        self._by_grade = {}
+        self._lemmas_by_grade = {}
+
+        rows = (
+            OrthoepyWord.objects.filter(is_active=True)
+            .order_by('lemma', 'word')
+            .values('id', 'word', 'lemma', 'is_correct', 'grade_mask')
+        )
+        for lemma, group in groupby(rows, key=lambda row: row['lemma']):
+            group = list(group)
+            self.lemmas.append((
+                lemma,
+                [(row['word'], row['grade_mask']) for row in group if row['is_correct']],
+                [(row['word'], row['grade_mask']) for row in group if not row['is_correct']],
+            ))
+            incorrect = next((row for row in group if not row['is_correct']), None)
+            if incorrect is None:
+                continue
+            for row in group:
+                if row['is_correct']:
+                    self.pairs.append(OrthoepyPair(row, incorrect))
+
+    def for_grade(self, grade=None):
+        if not grade:
+            return self.pairs
+        try:
+            grade = int(grade)
+        except (TypeError, ValueError):
+            return self.pairs
+        if grade not in self._by_grade:
+            self._by_grade[grade] = [pair for pair in self.pairs if pair.has_grade(grade)]
+        return self._by_grade[grade]
+
+    def random_pair(self, grade=None):
+        pairs = self.for_grade(grade)
+        return random.choice(pairs) if pairs else None
+
+    def lemma_buckets(self, grade=None):
+        """Корзины лемм для класса (без класса — все слова)."""
+        try:
+            grade = int(grade) if grade else 0
+        except (TypeError, ValueError):
+            grade = 0
+        if grade not in self._lemmas_by_grade:
+            if grade:
+                fits = _grade_filter(grade)
+                lemmas = [
+                    (lemma,
+                     [word for word, mask in correct if fits(mask)],
+                     [word for word, mask in incorrect if fits(mask)])
+                    for lemma, correct, incorrect in self.lemmas
+                ]
+            else:
+                lemmas = [
+                    (lemma, [word for word, _ in correct], [word for word, _ in incorrect])
+                    for lemma, correct, incorrect in self.lemmas
+                ]
+            self._lemmas_by_grade[grade] = LemmaBuckets(lemmas)
+        return self._lemmas_by_grade[grade]
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_orthoepy_pairs():
+    """Возвращает индекс пар текущего воркера, перестраивая его при смене версии."""
+    global _index
+    version = get_sampling_version(OrthoepyWord)
+    index = _index
+    if index is not None and index.version == version:
+        return index
+    with _index_lock:
+        if _index is None or _index.version != version:
+            _index = OrthoepyPairIndex(version)
+        return _index
+
+
+def generate_orthoepy_test(num_options=5, correct_min=2, correct_max=4, grade=None):
+    """
+    Тест по орфоэпии: correct_min..correct_max правильных вариантов,
+    остальные — неправильные, все из разных лемм.
+    Возвращает {'variants': [...], 'correct_answers': [...]} или None.
+    """
+    buckets = get_orthoepy_pairs().lemma_buckets(grade)
+    if buckets.correct_words < correct_min or not buckets.with_incorrect:
+        return None
+
+    # Случайное количество правильных ответов (2-4)
+    num_correct = random.randint(correct_min, correct_max)
+    num_incorrect = num_options - num_correct
+
+    # Если лемм с неправильными словами меньше, чем нужно — корректируем
+    if len(buckets.with_incorrect) < num_incorrect:
+        num_incorrect = len(buckets.with_incorrect)
+        num_correct = num_options - num_incorrect
+    if len(buckets.with_correct) < num_correct:
+        return None
+
+    chosen = random.sample(buckets.with_correct, num_correct)
+    used_lemmas = {lemma for lemma, _, _ in chosen}
+    correct_answers = [random.choice(correct) for _, correct, _ in chosen]
+
+    incorrect_answers = []
+    for lemma, _, incorrect in shuffled_stream(buckets.with_incorrect):
+        if len(incorrect_answers) >= num_incorrect:
+            break
+        if lemma not in used_lemmas:
+            incorrect_answers.append(random.choice(incorrect))
+            used_lemmas.add(lemma)
+
+    if len(incorrect_answers) < num_incorrect:
+        return None
+
+    variants = correct_answers + incorrect_answers
+    random.shuffle(variants)
+    return {
+        'variants': variants,
+        'correct_answers': correct_answers,
+    }
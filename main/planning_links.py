@@ -0,0 +1,86 @@
+# main/planning_links.py
+"""
+Привязка слов планинга к эталонной базе (UserWord.reference_word).
+
+Слова сравниваются по нормализованному тексту (normalize_word: нижний
+регистр, ё -> е), который хранится в индексированной колонке
+OrthogramExample.text_norm. Привязка пачки слов — два запроса на чтение
+и один bulk_update, сколько бы слов ни было.
+
+Для существующих планингов: manage.py link_planning_words
+"""
+from django.db.models import Count, Exists, OuterRef, Value
+from django.db.models.functions import Lower, Replace, Trim
+
+from .models import OrthogramExample, UserWord, normalize_word
+
+FIELD_PREFIX = 'user-input-orf-'
+
+
+def normalized_text(field):
+    """SQL-аналог normalize_word для колонки field."""
+    return Replace(Lower(Trim(field)), Value('ё'), Value('е'))
+
+
+def _field_orthogram(field_name):
+    if field_name and field_name.startswith(FIELD_PREFIX):
+        return field_name[len(FIELD_PREFIX):]
+    return None
+
+
+def _rank(example, orthogram_id):
+    """Лучший эталон: орфограмма поля планинга, затем пригодный для квиза, затем старший."""
+    quiz_ready = bool(example['explanation'] and (example['incorrect_variant'] or '').strip())
+    return (example['orthogram_id'] != orthogram_id, not quiz_ready, example['id'])
+
+
+def link_planning_words(user_words, batch_size=500):
+    """
+    Проставляет reference_word словам без эталона из queryset user_words.
+    Возвращает число привязанных слов.
+    """
+    from .planning_sampler import invalidate_planning_sampler
+
+    words = list(user_words.filter(reference_word__isnull=True).only('id', 'user_id', 'text', 'field_name'))
+    if not words:
+        return 0
+
+    norms = {normalize_word(word.text) for word in words}
+    candidates = {}
+    for example in OrthogramExample.objects.filter(
+        text_norm__in=norms, is_active=True, is_user_added=False,
+    ).values('id', 'text_norm', 'orthogram_id', 'explanation', 'incorrect_variant'):
+        candidates.setdefault(example['text_norm'], []).append(example)
+
+    linked = []
+    for word in words:
+        examples = candidates.get(normalize_word(word.text))
+        if not examples:
+            continue
+        orthogram_id = _field_orthogram(word.field_name)
+        word.reference_word_id = min(examples, key=lambda ex: _rank(ex, orthogram_id))['id']
+        linked.append(word)
+
+    UserWord.objects.bulk_update(linked, ['reference_word'], batch_size=batch_size)
+    # bulk_update не шлёт сигналы — сбрасываем деревья весов сами
+    for user_id in {word.user_id for word in linked}:
+        invalidate_planning_sampler(user_id)
+    return len(linked)
+
+
+def missing_planning_words():
+    """
+    Тексты активных слов планинга, которых нет в эталонной базе, с числом
+    пользователей — один запрос (анти-join через NOT EXISTS).
+    """
+    in_reference = OrthogramExample.objects.filter(
+        text_norm=OuterRef('norm'), is_user_added=False,
+    )
+    return (
+        UserWord.objects.filter(is_active=True)
+        .alias(norm=normalized_text('text'))
+        .filter(~Exists(in_reference))
+        .values('text')
+        .annotate(user_count=Count('user', distinct=True))
+        .order_by('-user_count')
+    )
@@ -0,0 +1,125 @@
+# main/planning_sampler.py
+"""
+Взвешенная выборка слов планинга по UserWord.weight.
+
+Для каждого пользователя строится дерево Фенвика (дерево префиксных сумм)
+по весам его слов, пригодных для квиза. Выбор слова пропорционально весу
+и изменение одного веса — O(log n), поэтому длинный планинг обходится
+так же дёшево, как короткий.
+
+Дерево хранится в общем кэше (см. main/cache_keys.py), чтобы сайт и боты
+видели одни веса. UserWord.update_weight обновляет его точечно;
+добавление, удаление и прочие изменения слов сбрасывают его целиком
+(сигналы в main/models.py), и при следующем запросе оно строится заново.
+"""
+import random
+
+from django.core.cache import cache
+
+from .cache_keys import PLANNING_SAMPLER_TTL, planning_sampler_key
+from .models import UserWord
+
+
+class FenwickSampler:
+    """Выборка ID пропорционально весам на дереве Фенвика."""
+
+    def __init__(self, items):
+        self.ids = []
+        self.weights = []
+        self.positions = {}
+        for item_id, weight in items:
+            self.positions[item_id] = len(self.ids)
+            self.ids.append(item_id)
+            self.weights.append(max(0.0, float(weight)))
+
+        # Построение за O(n): каждый узел добавляет свою сумму родителю
+        size = len(self.ids)
+        self.tree = [0.0] + self.weights
+        for i in range(1, size + 1):
+            parent = i + (i & -i)
+            if parent <= size:
+                self.tree[parent] += self.tree[i]
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __contains__(self, item_id):
+        return item_id in self.positions
+
+    @property
+    def total(self):
+        i, result = len(self.ids), 0.0
+        while i > 0:
+            result += self.tree[i]
+            i -= i & -i
+        return result
+
+    def update(self, item_id, weight):
+        """Меняет вес одного элемента. Возвращает False, если его нет в дереве."""
+        pos = self.positions.get(item_id)
+        if pos is None:
+            return False
+        weight = max(0.0, float(weight))
+        delta = weight - self.weights[pos]
+        self.weights[pos] = weight
+        i = pos + 1
+        while i <= len(self.ids):
+            self.tree[i] += delta
+            i += i & -i
+        return True
+
+    def sample(self, rng=random):
+        """Случайный ID с вероятностью, пропорциональной весу (None — если пусто)."""
+        size = len(self.ids)
+        total = self.total
+        if not size or total <= 0:
+            return None
+
+        target = rng.random() * total
+        pos = 0
+        step = 1 << (size.bit_length() - 1)
+        while step:
+            nxt = pos + step
+            if nxt <= size and self.tree[nxt] <= target:
+                pos = nxt
+                target -= self.tree[nxt]
+            step >>= 1
+        # pos — число элементов с префиксной суммой <= target
+        return self.ids[min(pos, size - 1)]
+
+
+def build_planning_sampler(user_id):
+    rows = UserWord.quiz_ready(user_id).order_by('id').values_list('id', 'weight')
+    return FenwickSampler(rows)
+
+
+def get_planning_sampler(user_id):
+    """Дерево весов пользователя из кэша (строится при промахе)."""
+    key = planning_sampler_key(user_id)
+    sampler = cache.get(key)
+    if sampler is None:
+        sampler = build_planning_sampler(user_id)
+        cache.set(key, sampler, PLANNING_SAMPLER_TTL)
+    return sampler
+
+
+def draw_planning_word_id(user_id):
+    """ID слова планинга, выбранного пропорционально весу."""
+    return get_planning_sampler(user_id).sample()
+
+
+def update_planning_weight(user_id, user_word_id, weight):
+    """
+    Точечно обновляет вес в закэшированном дереве.
+    Если дерева ещё нет — ничего не делает: оно построится с актуальными весами.
+    """
+    key = planning_sampler_key(user_id)
+    sampler = cache.get(key)
+    if sampler is None:
+        return
+    if sampler.update(user_word_id, weight):
+        cache.set(key, sampler, PLANNING_SAMPLER_TTL)
+
+
+def invalidate_planning_sampler(user_id):
+    cache.delete(planning_sampler_key(user_id))
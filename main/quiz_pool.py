@@ -0,0 +1,166 @@
+# main/quiz_pool.py
+"""
+Пул вопросов ежедневного квиза бота.
+
+Все активные OrthogramExample с ошибочным вариантом загружаются одним
+запросом в компактные записи QuizCandidate и хранятся в памяти воркера.
+Пул перестраивается при смене версии индекса выборки OrthogramExample
+(см. main/sampling.py), как и пары в main/orthoepy_pairs.py.
+
+Какие слова пользователь уже видел сегодня, хранится в общем кэше
+множеством ID (ключи в main/cache_keys.py); при первом обращении за день
+оно заполняется из QuizHistory (последнее показанное слово — за всё время).
+Для рассылки вопросы подбираются сразу пачке пользователей
+(pick_daily_quiz_words). Выбор вопроса — случайный ID вне этого множества,
+без загрузки таблицы на каждый клик в Telegram/VK.
+"""
+import random
+import threading
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db.models import OuterRef, Subquery
+from django.utils import timezone
+
+from .cache_keys import DAILY_QUIZ_TTL, daily_quiz_last_key, daily_quiz_shown_key
+from .models import OrthogramExample, QuizHistory
+from .sampling import get_sampling_version
+
+# Сколько раз пробуем случайный ID, прежде чем считать разность множеств
+RANDOM_TRIES = 8
+
+
+class QuizCandidate:
+    """Всё, что нужно для вопроса, без модели и связанных объектов."""
+    __slots__ = ('id', 'text', 'masked', 'incorrect', 'explanation', 'orthogram_id')
+
+    def __init__(self, row):
+        self.id = row['id']
+        self.text = row['text']
+        self.masked = row['masked_word'] or row['text']
+        self.incorrect = row['incorrect_variant']
+        self.explanation = row['explanation'] or row['orthogram__rule'] or "Правило не указано"
+        self.orthogram_id = row['orthogram_id'] or 0
+
+
+class QuizCandidatePool:
+    def __init__(self, version):
+        self.version = version
+        rows = (
+            OrthogramExample.objects.filter(is_active=True)
+            .exclude(incorrect_variant__isnull=True)
+            .exclude(incorrect_variant='')
+            .order_by('id')
+            .values('id', 'text', 'masked_word', 'incorrect_variant', 'explanation',
+                    'orthogram_id', 'orthogram__rule')
+        )
+        self.candidates = [QuizCandidate(row) for row in rows]
+        self.by_id = {candidate.id: candidate for candidate in self.candidates}
+
+    def __len__(self):
+        return len(self.candidates)
+
+    def pick(self, shown_ids=(), last_id=None):
+        """
+        Случайный вопрос вне shown_ids и не равный last_id.
+        Возвращает (кандидат, сброшен ли круг): если всё показано, круг начинается заново.
+        """
+        if not self.candidates:
+            return None, False
+
+        excluded = set(shown_ids)
+        if last_id is not None and len(self.candidates) > 1:
+            excluded.add(last_id)
+
+        # Обычно показано мало — хватает нескольких случайных попыток
+        for _ in range(RANDOM_TRIES):
+            candidate = random.choice(self.candidates)
+            if candidate.id not in excluded:
+                return candidate, False
+
+        available = self.by_id.keys() - excluded
+        if available:
+            return self.by_id[random.choice(tuple(available))], False
+
+        # Все слова показаны — начинаем заново (кроме последнего)
+        rest = [c for c in self.candidates if c.id != last_id] or self.candidates
+        return random.choice(rest), True
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_quiz_pool():
+    """Возвращает пул текущего воркера, перестраивая его при смене версии."""
+    global _pool
+    version = get_sampling_version(OrthogramExample)
+    pool = _pool
+    if pool is not None and pool.version == version:
+        return pool
+    with _pool_lock:
+        if _pool is None or _pool.version != version:
+            _pool = QuizCandidatePool(version)
+        return _pool
+
+
+# === Показанные сегодня ===
+
+def _load_today_history(user_ids, today):
+    """
+    ID слов, отвеченных сегодня, и последнее слово каждого пользователя
+    за всё время (чтобы новый день не начинался с вчерашнего вопроса).
+    Два запроса на всю пачку пользователей.
+    """
+    shown = {user_id: set() for user_id in user_ids}
+    rows = QuizHistory.objects.filter(
+        user_id__in=user_ids, answer_time__date=today,
+    ).values_list('user_id', 'word_id')
+    for user_id, word_id in rows:
+        shown[user_id].add(word_id)
+
+    latest = QuizHistory.objects.filter(user_id=OuterRef('pk')).order_by('-answer_time')
+    last = {
+        user_id: word_id
+        for user_id, word_id in User.objects.filter(id__in=user_ids).annotate(
+            last_word_id=Subquery(latest.values('word_id')[:1]),
+        ).values_list('id', 'last_word_id')
+        if word_id is not None
+    }
+    return shown, last
+
+
+def pick_daily_quiz_words(user_ids):
+    """
+    Следующий вопрос ежедневного квиза для каждого пользователя: {user_id: QuizCandidate}.
+    Состояние всех пользователей читается одним get_many и пишется одним set_many.
+    """
+    pool = get_quiz_pool()
+    if not len(pool) or not user_ids:
+        return {}
+
+    today = timezone.localdate()
+    shown_keys = {user_id: daily_quiz_shown_key(user_id, today) for user_id in user_ids}
+    last_keys = {user_id: daily_quiz_last_key(user_id) for user_id in user_ids}
+    cached = cache.get_many([*shown_keys.values(), *last_keys.values()])
+
+    missing = [user_id for user_id in user_ids if shown_keys[user_id] not in cached]
+    history_shown, history_last = _load_today_history(missing, today) if missing else ({}, {})
+
+    picked = {}
+    updates = {}
+    for user_id in user_ids:
+        shown = cached.get(shown_keys[user_id])
+        if shown is None:
+            shown = history_shown.get(user_id, set())
+        last_id = cached.get(last_keys[user_id], history_last.get(user_id))
+
+        candidate, restarted = pool.pick(shown, last_id)
+        shown = {candidate.id} if restarted else shown | {candidate.id}
+        picked[user_id] = candidate
+        updates[shown_keys[user_id]] = shown
+        updates[last_keys[user_id]] = candidate.id
+
+    cache.set_many(updates, DAILY_QUIZ_TTL)
+    return picked
+
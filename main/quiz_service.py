@@ -0,0 +1,84 @@
+# main/quiz_service.py
+"""
+Квизы и отчёты для ботов и сайта без HTTP.
+
+bot.py вызывает django.setup() и работает с ORM напрямую, поэтому вопросы,
+отчёты и запись ответов берёт отсюда (через sync_to_async), а не POST-ом
+на собственный сервер. API-view (/api/daily-quiz/, /api/weekly-report/,
+/api/log-quiz-answer/ и т.д.) — тонкие обёртки над теми же функциями
+для внешних клиентов (VK-бот, сайт).
+"""
+from .answer_buffer import enqueue_answer
+from .masks import parse_mask
+from .quiz_pool import pick_daily_quiz_words
+from .stats import praise_stats, weak_words_stats, weekly_stats
+
+DAILY_QUIZ_FALLBACK = {
+    'question': "Как пишется правильно:\nв**а",
+    'options': [
+        {'text': "вода", 'is_correct': True},
+        {'text': "вада", 'is_correct': False}
+    ],
+    'explanation': "Проверяемая гласная в корне слова",
+    'orthogram_id': 1,
+    'example_id': 0,
+    'user_word_id': None,
+}
+
+
+# === Вопросы ===
+
+def daily_quiz_payload(word):
+    """Вопрос ежедневного квиза для слова из пула (или заглушка)."""
+    if word is None:
+        return {**DAILY_QUIZ_FALLBACK, 'source': 'fallback'}
+
+    masked = parse_mask(word.masked).plain('😊')
+    return {
+        'question': f"Как пишется правильно:\n{masked}",
+        'options': [
+            {'text': word.text, 'is_correct': True},
+            {'text': word.incorrect, 'is_correct': False}
+        ],
+        'explanation': word.explanation,
+        'orthogram_id': word.orthogram_id,
+        'example_id': word.id,
+        'user_word_id': None,
+        'source': 'general'
+    }
+
+
+def daily_quizzes(user_ids):
+    """Вопросы для многих пользователей: {user_id: вопрос}."""
+    words = pick_daily_quiz_words(user_ids)
+    return {user_id: daily_quiz_payload(words.get(user_id)) for user_id in user_ids}
+
+
+def daily_quiz(user_id):
+    """Вопрос ежедневного квиза: случайное слово из пула, не показанное сегодня."""
+    return daily_quizzes([user_id])[user_id]
+
+
+# === Ответы ===
+
+def log_answer(user_id, word_id, was_correct, user_word_id=None):
+    """
+    Принимает ответ в буфер (main/answer_buffer.py). История, свёртки
+    статистики и вес/расписание слова планинга обновляются при переносе буфера.
+    """
+    return enqueue_answer(user_id, word_id, was_correct, user_word_id)
+
+
+# === Отчёты ===
+
+def weekly_report(user_id):
+    """Статистика за неделю (сложные темы — только 3 последних)."""
+    return weekly_stats(user_id, weak_limit=3)
+
+
+def praise_report(user_id):
+    return praise_stats(user_id)
+
+
+def weak_words_report(user_id):
+    return weak_words_stats(user_id)
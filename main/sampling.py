@@ -0,0 +1,119 @@
+# main/sampling.py
+"""
+Случайная выборка записей без ORDER BY RANDOM().
+
+Для каждого набора фильтров (орфограмма, класс, is_active и т.д.) в кэше
+хранится список ID подходящих записей. Выборка k случайных ID делается
+в памяти, а сами записи загружаются одним запросом id__in.
+
+Индексы версионируются по модели: при сохранении/удалении записи
+(в том числе через админку) версия увеличивается, и старые списки
+перестают использоваться.
+"""
+import hashlib
+import random
+
+from django.core.cache import cache
+from django.core.exceptions import EmptyResultSet
+
+# Страховочный срок жизни индекса (на случай queryset.update() без сигналов)
+SAMPLING_INDEX_TTL = 60 * 60
+
+
+def _model_label(model):
+    return model._meta.label_lower
+
+
+def _version_key(model):
+    return f"sampling:version:{_model_label(model)}"
+
+
+def get_sampling_version(model):
+    """Текущая версия индексов модели."""
+    return cache.get_or_set(_version_key(model), 1, None)
+
+
+def bump_sampling_version(model):
+    """Сбрасывает все индексы модели (вызывается из сигналов)."""
+    key = _version_key(model)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, 2, None)
+
+
+def get_candidate_ids(queryset):
+    """
+    Возвращает список ID всех записей queryset.
+    Результат кэшируется по тексту SQL-запроса и версии модели.
+    """
+    model = queryset.model
+    try:
+        sql = str(queryset.order_by().query)
+    except EmptyResultSet:
+        return []
+
+    digest = hashlib.md5(sql.encode('utf-8')).hexdigest()
+    key = f"sampling:ids:{_model_label(model)}:v{get_sampling_version(model)}:{digest}"
+
+    ids = cache.get(key)
+    if ids is None:
+        ids = list(queryset.order_by().values_list('pk', flat=True))
+        cache.set(key, ids, SAMPLING_INDEX_TTL)
+    return ids
+
+
+def sample_ids(queryset, k, exclude_ids=None):
+    """Выбирает до k случайных уникальных ID из queryset."""
+    ids = get_candidate_ids(queryset)
+    if exclude_ids:
+        exclude_ids = set(exclude_ids)
+        ids = [pk for pk in ids if pk not in exclude_ids]
+    if k is None or k >= len(ids):
+        ids = list(ids)
+        random.shuffle(ids)
+        return ids
+    return random.sample(ids, k)
+
+
+def random_sample(queryset, k, exclude_ids=None):
+    """
+    Замена queryset.order_by('?')[:k].
+    Возвращает список объектов в случайном порядке (один запрос id__in).
+    """
+    ids = sample_ids(queryset, k, exclude_ids)
+    if not ids:
+        return []
+    objects = queryset.order_by().in_bulk(ids)
+    return [objects[pk] for pk in ids if pk in objects]
+
+
+def random_first(queryset, exclude_ids=None):
+    """Замена queryset.order_by('?').first()."""
+    sample = random_sample(queryset, 1, exclude_ids)
+    return sample[0] if sample else None
+
+
+def iter_random(queryset, chunk_size=10):
+    """
+    Замена перебора queryset.order_by('?'): отдаёт все объекты
+    в случайном порядке, подгружая их порциями.
+    """
+    ids = sample_ids(queryset, None)
+    for start in range(0, len(ids), chunk_size):
+        chunk = ids[start:start + chunk_size]
+        objects = queryset.order_by().in_bulk(chunk)
+        for pk in chunk:
+            if pk in objects:
+                yield objects[pk]
+
+
+def shuffled_stream(items):
+    """Ленивое перемешивание Фишера–Йейтса: O(1) на элемент, список не копируется."""
+    swapped = {}
+    size = len(items)
+    for i in range(size):
+        j = random.randrange(i, size)
+        pick = swapped.get(j, j)
+        swapped[j] = swapped.get(i, i)
+        yield items[pick]
@@ -0,0 +1,436 @@
+# main/scoring.py
+"""
+Декларативная проверка ответов диагностик и тренажёров.
+
+Каждое задание описывается спецификацией: откуда в ключе ответов берётся
+правильный ответ, каким режимом сравнивать и сколько баллов дать.
+Спецификации ЕГЭ и ОГЭ собираются в Scorer один раз при импорте.
+
+Правильные ответы нормализуются при генерации варианта
+(Scorer.prepare -> ключ 'scoring' в данных AnswerKey/DiagnosticVariant),
+поэтому при проверке нормализуется только ответ ученика, а сравнение —
+это проверка вхождения в множество или равенство строк.
+Для ключей, сохранённых до появления 'scoring', prepare вызывается при проверке.
+"""
+import re
+
+# Меняется при изменении формата эталонов: старые ключи пересчитываются при проверке
+SCORING_VERSION = 2
+
+EMPTY_MASK = '😊'
+LETTERS_5 = ('А', 'Б', 'В', 'Г', 'Д')
+LETTERS_3 = ('А', 'Б', 'В')
+
+
+# === Нормализация ===
+
+def text_norm(value):
+    """Нижний регистр, без пробелов по краям."""
+    return str(value).strip().lower()
+
+
+def joined(raw):
+    """Ответ-чекбоксы (список) склеиваются в строку, текст обрезается."""
+    if isinstance(raw, list):
+        return ''.join(str(x) for x in raw)
+    return str(raw).strip()
+
+
+def digits_only(value):
+    return re.sub(r'\D', '', str(value).strip())
+
+
+def free_text(value):
+    """Нижний регистр, пробелы схлопнуты до одного."""
+    return re.sub(r'\s+', ' ', str(value).strip().lower())
+
+
+def split_variants(correct, separators=('/',)):
+    """Варианты ответа через первый найденный разделитель."""
+    correct = str(correct)
+    for sep in separators:
+        if sep in correct:
+            return [v.strip() for v in correct.split(sep)]
+    return [correct.strip()]
+
+
+# Символы в масках пунктуации: запятая — '!', «нет запятой» — '?'
+PUNCT_ALIASES = {',': '!', 'х': '?', 'x': '?'}
+
+SYMBOL_NORMALIZERS = {
+    'exact': lambda s: str(s).strip(),
+    'lower': lambda s: str(s).strip().lower(),
+    'slash': lambda s: '|' if str(s).strip().lower() == '\\' else str(s).strip().lower(),
+    'punct': lambda s: PUNCT_ALIASES.get(str(s).strip(), str(s).strip()),
+}
+
+
+# === Режимы сравнения одного ответа ===
+
+class Mode:
+    """prepare(правильный) -> эталон; normalize(ответ) -> значение для сравнения с эталоном."""
+
+    def __init__(self, prepare, normalize, many=False, display=None):
+        self.prepare = prepare
+        self.normalize = normalize
+        self.many = many  # эталон — список допустимых вариантов
+        self.display = display or (lambda correct: correct)
+
+    def matches(self, answer, expected):
+        value = self.normalize(answer)
+        return value in expected if self.many else value == expected
+
+
+def _last_word(answer):
+    words = text_norm(answer).split()
+    return words[-1] if words else ''
+
+
+MODES = {
+    # Точное совпадение без учёта регистра
+    'exact': Mode(text_norm, lambda a: text_norm(joined(a))),
+    # Последнее слово ответа (задание 7 ЕГЭ / 8 ОГЭ)
+    'last_word': Mode(text_norm, _last_word, display=text_norm),
+    # Варианты через '/'
+    'slash_variants': Mode(
+        lambda c: [v.lower() for v in split_variants(c)],
+        lambda a: joined(a).lower(), many=True,
+        display=lambda c: split_variants(c)[0],
+    ),
+    # Варианты через ','
+    'comma_variants': Mode(
+        lambda c: [text_norm(v) for v in str(c).split(',') if v.strip()],
+        lambda a: text_norm(joined(a)), many=True,
+        display=lambda c: next((v.strip() for v in str(c).split(',') if v.strip()), c),
+    ),
+    # Варианты через '/' или '|', без учёта пробелов (фразеологизм)
+    'phrase_variants': Mode(
+        lambda c: [v.lower().replace(' ', '') for v in split_variants(c, ('/', '|'))],
+        lambda a: joined(a).lower().replace(' ', ''), many=True,
+    ),
+    # Варианты через '|' или '/', точное совпадение (номера предложений)
+    'number_variants': Mode(
+        lambda c: split_variants(c, ('|', '/')),
+        joined, many=True,
+    ),
+    # Набор цифр в любом порядке (чекбоксы)
+    'sorted': Mode(
+        lambda c: ''.join(sorted(str(c))),
+        lambda a: ''.join(sorted(joined(a))),
+    ),
+    # Набор цифр в любом порядке, прочие символы отбрасываются
+    'sorted_digits': Mode(
+        lambda c: ''.join(sorted(digits_only(c))),
+        lambda a: ''.join(sorted(digits_only(joined(a)))),
+    ),
+    # Варианты через '|', пробелы схлопнуты
+    'free_variants': Mode(
+        lambda c: [free_text(v) for v in str(c).split('|')],
+        lambda a: free_text(joined(a)), many=True,
+    ),
+    # Варианты через '|', только цифры, порядок важен
+    'digit_variants': Mode(
+        lambda c: [digits_only(v) for v in str(c).split('|')],
+        lambda a: digits_only(joined(a)), many=True,
+    ),
+}
+
+
+def answer_matches(mode, answer, correct):
+    """Разовая проверка для тренажёров одного задания."""
+    mode = MODES[mode]
+    return mode.matches(answer, mode.prepare(correct))
+
+
+# === Спецификации заданий ===
+
+def _result(ok, score, max_score, correct_answer, show_answers, **extra):
+    """Результат задания: баллы и правильный ответ — только если их показывают (ОГЭ)."""
+    if not show_answers:
+        return {'is_correct': ok}
+    return {'is_correct': ok, 'score': score, 'max_score': max_score,
+            'correct_answer': correct_answer, **extra}
+
+
+class Task:
+    """Одно поле ответа (ключ answer_key) против session[source]."""
+
+    def __init__(self, number, source, mode, answer_key=None, skip_empty=False):
+        self.number = str(number)
+        self.source = source
+        self.mode = MODES[mode]
+        self.answer_key = answer_key or self.number
+        self.skip_empty = skip_empty
+
+    def prepare(self, session):
+        if session.get(self.source) is None:
+            return None
+        correct = session[self.source]
+        return {'expected': self.mode.prepare(correct), 'display': self.mode.display(correct)}
+
+    def score(self, answers, prepared, results, show_answers):
+        raw = answers.get(self.answer_key, '')
+        if self.skip_empty and not joined(raw):
+            return []
+        ok = self.mode.matches(raw, prepared['expected'])
+        results[self.number] = _result(ok, int(ok), 1, prepared['display'], show_answers)
+        return [(self.number, int(ok), 1)]
+
+
+class TaskGroup:
+    """
+    Словарь {номер: правильный ответ} в session[source]; режим — по номеру.
+    extras — {номер: функция подсказки}; если задан (хотя бы пустым),
+    в результат добавляется поле 'extras'.
+    """
+
+    def __init__(self, source, modes, default=None, numbers=None, skip_empty=False, extras=None):
+        self.source = source
+        self.modes = {str(k): MODES[v] for k, v in modes.items()}
+        self.default = MODES[default] if default else None
+        self.numbers = {str(n) for n in numbers} if numbers else None
+        self.skip_empty = skip_empty
+        self.extras = extras
+
+    def prepare(self, session):
+        group = session.get(self.source)
+        if not group:
+            return None
+        prepared = {}
+        for number, correct in group.items():
+            if self.numbers is not None and number not in self.numbers:
+                continue
+            mode = self.modes.get(number, self.default)
+            prepared[number] = {
+                'expected': mode.prepare(correct) if mode else None,
+                'display': mode.display(correct) if mode else correct,
+            }
+            if self.extras is not None:
+                extras = self.extras.get(number)
+                prepared[number]['extras'] = extras() if extras else ''
+        return prepared
+
+    def score(self, answers, prepared, results, show_answers):
+        entries = []
+        for number, item in prepared.items():
+            raw = answers.get(number, '')
+            if self.skip_empty and not joined(raw):
+                continue
+            mode = self.modes.get(number, self.default)
+            ok = bool(mode) and mode.matches(raw, item['expected'])
+            extras = {'extras': item['extras']} if 'extras' in item else {}
+            results[number] = _result(ok, int(ok), 1, item['display'], show_answers, **extras)
+            entries.append((number, int(ok), 1))
+        return entries
+
+
+class MaskTask:
+    """
+    Маски-смайлики: поля '<prefix>-1', '<prefix>-2', ... (или ключи словаря
+    session[source]). Балл — если верны все маски (или required(верных, всего)).
+    """
+
+    def __init__(self, number, source, prefix=None, symbol='lower', required=None):
+        self.number = str(number)
+        self.source = source
+        self.prefix = prefix or self.number
+        self.normalize = SYMBOL_NORMALIZERS[symbol]
+        self.required = required
+
+    def prepare(self, session):
+        expected = session.get(self.source)
+        if expected is None:
+            return None
+        if isinstance(expected, dict):
+            items = expected.items()
+        else:
+            items = ((f"{self.prefix}-{i}", symbol) for i, symbol in enumerate(expected, 1))
+        return [[key, self.normalize(symbol)] for key, symbol in items]
+
+    def score(self, answers, prepared, results, show_answers):
+        correct_count = 0
+        for key, expected in prepared:
+            value = self.normalize(answers.get(key, EMPTY_MASK))
+            ok = value not in (EMPTY_MASK, '') and value == expected
+            results[key] = {'is_correct': ok}
+            correct_count += ok
+
+        total = len(prepared)
+        ok = self.required(correct_count, total) if self.required else correct_count == total
+        results[self.number] = _result(ok, int(ok), 1, '', show_answers)
+        return [(self.number, int(ok), 1)]
+
+
+class LetterTask:
+    """
+    Соответствие «буква — ответ» (выпадающие списки): поля '<number>-А', ...
+    thresholds — ((верных, баллы), ...) по убыванию.
+    """
+
+    def __init__(self, number, source, letters=LETTERS_5, thresholds=((5, 2), (3, 1))):
+        self.number = str(number)
+        self.source = source
+        self.letters = letters
+        self.thresholds = thresholds
+        self.max_score = max(points for _, points in thresholds)
+
+    def prepare(self, session):
+        expected = session.get(self.source)
+        if not expected:
+            return None
+        return {letter: str(expected.get(letter, '')).strip() for letter in self.letters}
+
+    def score(self, answers, prepared, results, show_answers):
+        details = {}
+        correct_count = 0
+        for letter, correct in prepared.items():
+            key = f"{self.number}-{letter}"
+            user_answer = answers.get(key, '-')
+            value = str(user_answer).strip()
+            ok = value != '-' and value == correct
+            details[key] = {'is_correct': ok, 'user_answer': user_answer, 'correct_answer': correct}
+            correct_count += ok
+
+        score = next((points for needed, points in self.thresholds if correct_count >= needed), 0)
+        if show_answers:
+            results[self.number] = _result(score > 0, score, self.max_score, '', show_answers)
+        else:
+            # ЕГЭ: разбор по буквам для подсветки выпадающих списков
+            results[self.number] = {
+                'is_correct': score > 0,
+                'score': score,
+                'correct_count': correct_count,
+                'max_score': self.max_score,
+                'details': details,
+            }
+        results.update({key: {'is_correct': d['is_correct']} for key, d in details.items()})
+        return [(self.number, score, self.max_score)]
+
+
+class ChoiceSetTask:
+    """Выбор нескольких вариантов: балл, если выбраны ровно все правильные."""
+
+    def __init__(self, number, source, variants_source):
+        self.number = str(number)
+        self.source = source
+        self.variants_source = variants_source
+
+    def prepare(self, session):
+        if self.source not in session:
+            return None
+        return {
+            'correct': sorted({text_norm(x) for x in session[self.source]}),
+            'variants': [[variant, text_norm(variant)] for variant in session.get(self.variants_source, [])],
+        }
+
+    def score(self, answers, prepared, results, show_answers):
+        correct = set(prepared['correct'])
+        selected = {text_norm(x) for x in answers.get(self.number, [])}
+        variant_results = {
+            f'{self.number}-{i}': {
+                'variant_text': variant,
+                'is_correct': normalized in correct,
+                'was_selected': normalized in selected,
+            }
+            for i, (variant, normalized) in enumerate(prepared['variants'], 1)
+        }
+        ok = selected == correct
+        results[self.number] = {'is_correct': ok, 'score': int(ok), 'variant_results': variant_results}
+        return [(self.number, int(ok), 1)]
+
+
+class Scorer:
+    """
+    Набор спецификаций заданий; prepare — при генерации, score — при проверке.
+    show_answers — отдавать ли в результатах баллы и правильные ответы
+    (ОГЭ показывает их после проверки, ЕГЭ — только верно/неверно).
+    """
+
+    def __init__(self, name, tasks, show_answers=False):
+        self.name = name
+        self.tasks = tasks
+        self.show_answers = show_answers
+
+    def prepare(self, session):
+        prepared = {str(i): task.prepare(session) for i, task in enumerate(self.tasks)}
+        prepared['version'] = f"{self.name}:{SCORING_VERSION}"
+        return prepared
+
+    def score(self, answers, session):
+        """
+        Возвращает (results, total_score, max_score, [(номер, верно), ...]).
+        Берёт эталоны из session['scoring'], если они есть.
+        """
+        prepared = session.get('scoring')
+        if not prepared or prepared.get('version') != f"{self.name}:{SCORING_VERSION}":
+            prepared = self.prepare(session)
+        results = {}
+        total_score = max_score = 0
+        summary = []
+        for i, task in enumerate(self.tasks):
+            item = prepared.get(str(i))
+            if item is None:
+                continue
+            for number, score, points in task.score(answers, item, results, self.show_answers):
+                total_score += score
+                max_score += points
+                summary.append((int(number), score > 0))
+        return results, total_score, max_score, summary
+
+
+# === ЕГЭ: стартовая диагностика ===
+
+def _task9_required(correct_count, total):
+    """15 масок — все верные; иначе достаточно 12 (или всех, если масок меньше)."""
+    if total == 15:
+        return correct_count == 15
+    return correct_count >= min(12, total)
+
+
+EGE_SCORER = Scorer('ege', [
+    TaskGroup('answers_1_3', {'1': 'slash_variants'}, default='sorted', skip_empty=True),
+    ChoiceSetTask(4, 'answer_4', 'variants_4'),
+    Task(5, 'answer_5', 'exact', skip_empty=True),
+    Task(6, 'answer_6', 'comma_variants', skip_empty=True),
+    Task(7, 'answer_7', 'last_word'),
+    LetterTask(8, 'task8_correct'),
+    MaskTask(9, 'task9_correct', required=_task9_required),
+    MaskTask(10, 'task10_expected_map'),
+    MaskTask(11, 'task11_correct', symbol='exact'),
+    MaskTask(12, 'task12_correct'),
+    MaskTask(13, 'task13_correct'),
+    MaskTask(14, 'task14_correct', symbol='slash'),
+    MaskTask(15, 'task15_correct'),
+    *[MaskTask(n, f'task{n}_correct', symbol='punct') for n in range(16, 22)],
+    LetterTask(22, 'task22_correct'),
+    TaskGroup('answers_23_26', {'23': 'sorted', '24': 'sorted', '25': 'phrase_variants', '26': 'number_variants'},
+              skip_empty=True),
+])
+
+
+# === ОГЭ: диагностика ===
+
+def _oge_orthogram_extras():
+    """Подсказка к заданию 6: номера орфограмм у каждого варианта."""
+    from .models import OgeQuestionOption
+    parts = [
+        f"{option_number} - {numbers}"
+        for option_number, numbers in OgeQuestionOption.objects.filter(
+            question__question_number=6
+        ).order_by('option_number').values_list('option_number', 'orthogram_numbers')
+        if numbers
+    ]
+    return "ОРФОГРАММЫ:<br>" + "<br>".join(parts) if parts else ''
+
+
+OGE_SCORER = Scorer('oge', [
+    TaskGroup('answers_1_2', {}, default='sorted', numbers=[2, 3], extras={}),
+    TaskGroup('answers_5', {}, default='sorted', numbers=[6], extras={'6': _oge_orthogram_extras}),
+    TaskGroup('answers_9_10', {}, default='sorted', numbers=[10, 11], extras={}),
+    LetterTask(4, 'task3_correct', letters=LETTERS_3, thresholds=((3, 1),)),
+    MaskTask(5, 'task4_correct', symbol='exact'),
+    MaskTask(7, 'task6_correct', prefix='6'),
+    Task(8, 'answer_7', 'last_word'),
+    Task(9, 'answer_8', 'comma_variants'),
+    TaskGroup('answers_11', {}, default='slash_variants'),
+], show_answers=True)
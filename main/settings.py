@@ -192,9 +192,41 @@ LOGGING = {
     },
 }
 
-CACHES = {
-    'default': {
+# Кэш общий для воркеров gunicorn и процессов ботов (bot.py, vk_bot*.py):
+# ссылки привязки Telegram, состояние квизов, индексы выборки.
+# CACHE_BACKEND=file  — каталог на диске (по умолчанию, без доп. зависимостей)
+# CACHE_BACKEND=redis — Redis или совместимый сервер (нужен пакет redis),
+#                       CACHE_LOCATION=redis://127.0.0.1:6379/1
+# CACHE_BACKEND=db    — таблица в основной БД (python manage.py createcachetable)
+# CACHE_BACKEND=locmem — память процесса (только для runserver/тестов)
+CACHE_BACKEND = config('CACHE_BACKEND', default='file')
+
+if CACHE_BACKEND == 'redis':
+    _cache = {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': config('CACHE_LOCATION', default='redis://127.0.0.1:6379/1'),
+    }
+elif CACHE_BACKEND == 'db':
+    _cache = {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': config('CACHE_LOCATION', default='webtable_cache'),
+    }
+elif CACHE_BACKEND == 'locmem':
+    _cache = {
         'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
         'LOCATION': 'bot-cache',
     }
+else:
+    _cache = {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': config('CACHE_LOCATION', default=os.path.join(BASE_DIR, '.django_cache')),
+        'OPTIONS': {'MAX_ENTRIES': 20000},
+    }
+
+CACHES = {
+    'default': {
+        **_cache,
+        'KEY_PREFIX': 'webtable',
+        'TIMEOUT': 300,
+    }
 }
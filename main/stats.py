@@ -0,0 +1,334 @@
+# main/stats.py
+"""
+Статистика квизов для отчётов бота и ЛК.
+
+Каждый ответ записывается через record_quiz_answer (или пачкой из буфера
+main/answer_buffer.py): строка QuizHistory и инкремент свёрток
+QuizDailyStat (пользователь, день, орфограмма) и QuizWordStat
+(пользователь, слово, день) в одной транзакции.
+Отчёты читают только свёртки — несколько строк на день/слово вместо
+всей истории ученика. Текст слова и орфограмма подтягиваются тем же
+запросом через JOIN.
+
+Заполнить свёртки по существующей истории: manage.py backfill_quiz_stats
+"""
+from datetime import timedelta
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, DateTimeField, F, Max, Q, Sum, Value
+from django.db.models.functions import Coalesce, Greatest, TruncDate
+from django.utils import timezone
+
+from .models import OrthogramExample, QuizDailyStat, QuizHistory, QuizWordStat, UserWord
+
+WEEK = timedelta(days=7)
+
+
+def _week_ago():
+    return timezone.now().date() - WEEK
+
+
+def _rate(part, total):
+    return round(part / total * 100, 1) if total else 0
+
+
+# === Запись ответа ===
+
+def latest_time(field, value):
+    """SQL: max(field, value) с учётом пустого field."""
+    value = Value(value, output_field=DateTimeField())
+    return Greatest(Coalesce(F(field), value), value)
+
+
+def _bump(model, keys, attempts, correct, last_time, time_field):
+    """Инкремент строки свёртки (создаёт её при первом ответе)."""
+    updates = {
+        'attempts': F('attempts') + attempts,
+        'correct': F('correct') + correct,
+    }
+    if last_time is not None:
+        updates[time_field] = latest_time(time_field, last_time)
+
+    if model.objects.filter(**keys).update(**updates):
+        return
+    try:
+        with transaction.atomic():
+            model.objects.create(**keys, attempts=attempts, correct=correct, **{time_field: last_time})
+    except IntegrityError:
+        # Строку успел создать параллельный запрос
+        model.objects.filter(**keys).update(**updates)
+
+
+def bump_quiz_rollups(answers):
+    """
+    Добавляет ответы в свёртки: answers — кортежи
+    (user_id, word_id, orthogram_id, was_correct, answer_time).
+    Ответы с одинаковым ключом складываются, так что на ключ — один UPDATE.
+    """
+    daily = {}
+    words = {}
+    for user_id, word_id, orthogram_id, was_correct, answer_time in answers:
+        day = timezone.localdate(answer_time)
+        if orthogram_id is not None:
+            row = daily.setdefault((user_id, day, orthogram_id), [0, 0, None])
+            row[0] += 1
+            if was_correct:
+                row[1] += 1
+            elif row[2] is None or answer_time > row[2]:
+                row[2] = answer_time
+        row = words.setdefault((user_id, word_id, day), [0, 0, None])
+        row[0] += 1
+        row[1] += 1 if was_correct else 0
+        if row[2] is None or answer_time > row[2]:
+            row[2] = answer_time
+
+    for (user_id, day, orthogram_id), (attempts, correct, last_error) in daily.items():
+        _bump(QuizDailyStat, {'user_id': user_id, 'day': day, 'orthogram_id': orthogram_id},
+              attempts, correct, last_error, 'last_error')
+    for (user_id, word_id, day), (attempts, correct, last_answer) in words.items():
+        _bump(QuizWordStat, {'user_id': user_id, 'word_id': word_id, 'day': day},
+              attempts, correct, last_answer, 'last_answer')
+
+
+def record_quiz_answer(user_id, word_id, was_correct, user_word_id=None):
+    """Сохраняет ответ в QuizHistory и обновляет свёртки в той же транзакции."""
+    orthogram_id = OrthogramExample.objects.filter(id=word_id).values_list('orthogram_id', flat=True).first()
+
+    with transaction.atomic():
+        history = QuizHistory.objects.create(
+            user_id=user_id,
+            word_id=word_id,
+            user_word_id=user_word_id,
+            was_correct=was_correct,
+        )
+        bump_quiz_rollups([(user_id, word_id, orthogram_id, was_correct, history.answer_time)])
+    return history
+
+
+def rebuild_quiz_rollups(user_ids=None, batch_size=1000):
+    """Пересчитывает свёртки по QuizHistory (все пользователи или указанные)."""
+    history = QuizHistory.objects.all()
+    if user_ids:
+        history = history.filter(user_id__in=user_ids)
+
+    daily_rows = (
+        history.annotate(day=TruncDate('answer_time'))
+        .values('user_id', 'day', 'word__orthogram_id')
+        .annotate(
+            attempts=Count('id'),
+            correct=Count('id', filter=Q(was_correct=True)),
+            last_error=Max('answer_time', filter=Q(was_correct=False)),
+        )
+        .order_by()
+    )
+    word_rows = (
+        history.annotate(day=TruncDate('answer_time'))
+        .values('user_id', 'word_id', 'day')
+        .annotate(
+            attempts=Count('id'),
+            correct=Count('id', filter=Q(was_correct=True)),
+            last_answer=Max('answer_time'),
+        )
+        .order_by()
+    )
+
+    with transaction.atomic():
+        daily = QuizDailyStat.objects.all()
+        words = QuizWordStat.objects.all()
+        if user_ids:
+            daily = daily.filter(user_id__in=user_ids)
+            words = words.filter(user_id__in=user_ids)
+        daily.delete()
+        words.delete()
+
+        QuizDailyStat.objects.bulk_create([
+            QuizDailyStat(
+                user_id=row['user_id'], day=row['day'], orthogram_id=row['word__orthogram_id'],
+                attempts=row['attempts'], correct=row['correct'], last_error=row['last_error'],
+            )
+            for row in daily_rows
+        ], batch_size=batch_size)
+        QuizWordStat.objects.bulk_create([
+            QuizWordStat(
+                user_id=row['user_id'], word_id=row['word_id'], day=row['day'],
+                attempts=row['attempts'], correct=row['correct'], last_answer=row['last_answer'],
+            )
+            for row in word_rows
+        ], batch_size=batch_size)
+
+
+# === Чтение свёрток ===
+
+def _summary(daily):
+    """Всего попыток и правильных — одним запросом."""
+    totals = daily.aggregate(total=Sum('attempts'), correct=Sum('correct'))
+    return totals['total'] or 0, totals['correct'] or 0
+
+
+def _orthogram_rows(daily):
+    """Попытки, ошибки и время последней ошибки по каждой орфограмме."""
+    return (
+        daily.values('orthogram_id', 'orthogram__name')
+        .annotate(
+            total=Sum('attempts'),
+            errors=Sum('attempts') - Sum('correct'),
+            last_error=Max('last_error'),
+        )
+        .order_by()
+    )
+
+
+def _word_rows(words):
+    """Попытки и правильные ответы по каждому слову (с текстом слова)."""
+    return (
+        words.values('word_id', 'word__text', 'word__orthogram_id')
+        .annotate(
+            total=Sum('attempts'),
+            correct=Sum('correct'),
+            last_answer=Max('last_answer'),
+        )
+        .order_by('-last_answer')
+    )
+
+
+def _week_daily(user_id):
+    return QuizDailyStat.objects.filter(user_id=user_id, day__gte=_week_ago())
+
+
+def _week_words(user_id):
+    return QuizWordStat.objects.filter(user_id=user_id, day__gte=_week_ago())
+
+
+def weekly_stats(user_id, weak_limit=3):
+    """
+    Отчёт за неделю для бота: слова в планинге, попытки, успешность
+    и орфограммы с ошибками (сначала с самой свежей ошибкой).
+    """
+    week_daily = _week_daily(user_id)
+    total_attempts, correct_attempts = _summary(week_daily)
+
+    weak_list = []
+    for row in _orthogram_rows(week_daily):
+        if row['errors'] == 0:
+            continue
+        weak_list.append({
+            'name': row['orthogram__name'],
+            'errors': row['errors'],
+            'total': row['total'],
+            'error_rate': _rate(row['errors'], row['total']),
+            'orthogram_id': row['orthogram_id'],
+            'last_error': row['last_error'].isoformat() if row['last_error'] else None,
+        })
+    weak_list.sort(key=lambda x: x['last_error'] or '', reverse=True)
+
+    return {
+        'total_words': UserWord.objects.filter(user_id=user_id, is_active=True).count(),
+        'total_attempts': total_attempts,
+        'correct_answers': correct_attempts,
+        'success_rate': _rate(correct_attempts, total_attempts),
+        'weak_orthograms': weak_list[:weak_limit],
+    }
+
+
+def quiz_stats(user_id, weak_limit=5):
+    """
+    Сводка за неделю: сложные темы — орфограммы минимум с 2 попытками,
+    по убыванию числа ошибок.
+    """
+    week_daily = _week_daily(user_id)
+    total_attempts, correct_attempts = _summary(week_daily)
+
+    weak_list = []
+    for row in _orthogram_rows(week_daily):
+        if row['total'] < 2:
+            continue
+        ortho_id = row['orthogram_id']
+        weak_list.append({
+            'name': row['orthogram__name'],
+            'errors': row['errors'],
+            'total': row['total'],
+            'error_rate': _rate(row['errors'], row['total']),
+            'orthogram_id': ortho_id,
+            'field_name': f"user-input-orf-{ortho_id}",
+            'repeat_message': f"повтори орфограмму {ortho_id}",
+        })
+    weak_list.sort(key=lambda x: x['errors'], reverse=True)
+
+    return {
+        'total_words': UserWord.objects.filter(user_id=user_id, is_active=True).count(),
+        'total_attempts': total_attempts,
+        'correct_answers': correct_attempts,
+        'success_rate': _rate(correct_attempts, total_attempts),
+        'weak_orthograms': weak_list[:weak_limit],
+    }
+
+
+def mastered_words(words, min_total=3, min_rate=80):
+    """Слова с успешностью не ниже min_rate при минимум min_total попытках."""
+    mastered = []
+    for row in _word_rows(words):
+        if row['total'] < min_total:
+            continue
+        rate = row['correct'] / row['total'] * 100
+        if rate >= min_rate:
+            mastered.append({
+                'text': row['word__text'],
+                'success_rate': round(rate, 1),
+                'orthogram_id': row['word__orthogram_id'],
+            })
+    return mastered
+
+
+def weak_words(words, min_total=2):
+    """Слова, где ошибок не меньше, чем правильных ответов."""
+    result = []
+    for row in _word_rows(words):
+        errors = row['total'] - row['correct']
+        if row['total'] >= min_total and errors >= row['correct']:
+            result.append({
+                'text': row['word__text'],
+                'errors': errors,
+                'total': row['total'],
+                'orthogram_id': row['word__orthogram_id'],
+            })
+    result.sort(key=lambda x: x['errors'], reverse=True)
+    return result
+
+
+def progress_stats(user_id):
+    """Выученные слова за всё время и изменение успешности к прошлой неделе."""
+    week_ago = _week_ago()
+
+    mastered = [
+        {'text': word['text'], 'success_rate': word['success_rate']}
+        for word in mastered_words(QuizWordStat.objects.filter(user_id=user_id))
+    ]
+
+    weeks = QuizDailyStat.objects.filter(user_id=user_id, day__gte=week_ago - WEEK).aggregate(
+        week_total=Sum('attempts', filter=Q(day__gte=week_ago)),
+        week_correct=Sum('correct', filter=Q(day__gte=week_ago)),
+        prev_total=Sum('attempts', filter=Q(day__lt=week_ago)),
+        prev_correct=Sum('correct', filter=Q(day__lt=week_ago)),
+    )
+    week_rate = (weeks['week_correct'] or 0) / weeks['week_total'] * 100 if weeks['week_total'] else 0
+    prev_rate = (weeks['prev_correct'] or 0) / weeks['prev_total'] * 100 if weeks['prev_total'] else 0
+
+    return {
+        'mastered_words': mastered[:10],
+        'weekly_progress': round(week_rate - prev_rate, 1),
+    }
+
+
+def praise_stats(user_id):
+    """Слова для похвалы за неделю."""
+    mastered = mastered_words(_week_words(user_id))
+    mastered.sort(key=lambda x: x['success_rate'], reverse=True)
+    return {
+        'mastered_words': mastered[:5],
+        'total_mastered': len(mastered),
+    }
+
+
+def weak_words_stats(user_id):
+    """Слова для повторения за неделю."""
+    return {'weak_words': weak_words(_week_words(user_id))[:10]}
@@ -0,0 +1,77 @@
+import json
+from types import SimpleNamespace
+
+from django.contrib.auth.models import User
+from django.test import TestCase
+
+from .answer_keys import save_answer_key
+from .models import OgeCorrectionExercise, Orthogram, OrthogramExample, PendingQuizAnswer
+from .scoring import OGE_SCORER
+
+
+# === API: логирование ответа бота / квиза ===
+
+class LogQuizAnswerTests(TestCase):
+    url = '/api/log-quiz-answer/'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='quiz_user', password='pass')
+        orthogram = Orthogram.objects.create(id='1', name='Безударная гласная', rule='-')
+        cls.word = OrthogramExample.objects.create(
+            orthogram=orthogram, text='вода', masked_word='в*1*да',
+        )
+
+    def post(self, payload):
+        return self.client.post(self.url, data=json.dumps(payload), content_type='application/json')
+
+    def test_answer_goes_to_buffer(self):
+        response = self.post({'user_id': self.user.id, 'word_id': self.word.id, 'was_correct': True})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {'status': 'ok'})
+        pending = PendingQuizAnswer.objects.get()
+        self.assertEqual(pending.user_id, self.user.id)
+        self.assertEqual(pending.word_id, self.word.id)
+        self.assertTrue(pending.was_correct)
+        self.assertIsNone(pending.user_word_id)
+
+    def test_missing_fields(self):
+        response = self.post({'user_id': self.user.id})
+
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(PendingQuizAnswer.objects.exists())
+
+    def test_get_not_allowed(self):
+        response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, 405)
+
+
+# === ОГЭ: отдельное задание после полной диагностики ===
+
+class OgeSingleTaskTests(TestCase):
+
+    def setUp(self):
+        OgeCorrectionExercise.objects.create(incorrect_text='яблоком', correct_text='Яблоком')
+
+        # Ключ полной диагностики с уже посчитанными эталонами
+        session = self.client.session
+        diagnostic = {'answer_7': 'вишней'}
+        diagnostic['scoring'] = OGE_SCORER.prepare(diagnostic)
+        save_answer_key(SimpleNamespace(session=session), 'oge_diagnostic', diagnostic)
+        session.save()
+
+    def post(self, url, payload):
+        return self.client.post(url, data=json.dumps(payload), content_type='application/json')
+
+    def test_single_task_checked_against_new_answer(self):
+        response = self.post('/api/generate-oge-single-task/', {'task_number': '8'})
+        self.assertEqual(response.status_code, 200)
+
+        response = self.post('/api/check-oge-diagnostic/', {'answers': {'8': 'яблоком'}})
+
+        self.assertEqual(response.status_code, 200)
+        result = response.json()['results']['8']
+        self.assertTrue(result['is_correct'])
+        self.assertEqual(result['correct_answer'], 'яблоком')
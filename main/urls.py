@@ -72,6 +72,7 @@ urlpatterns = [
     path('api/generate-task9-exercise/', views.generate_task9_exercise, name='generate_task9_exercise'),
     path('api/generate-chered-exercise/', views.generate_chered_exercise, name='generate_chered_exercise'),
     path('api/daily-quiz/', views.get_daily_quiz, name='daily_quiz'),
+    path('api/daily-quiz-batch/', views.get_daily_quiz_batch, name='daily_quiz_batch'),
     path('api/save-example/', views.save_example, name='save_example'),
     path('api/load-examples/', views.load_examples, name='load_examples'),
     path('api/update-example/', views.update_example, name='update_example'),
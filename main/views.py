@@ -33,6 +33,19 @@ from .models import (
     OgeCorrectionExercise, OgeWordOk,
 )
 from .assistant import NeuroAssistant
+from .sampling import random_sample, random_first, iter_random
+from .catalog import get_orthogram_catalog, get_subgroup_key, SUBGROUPS, SUBGROUP_ORTH_IDS
+from .diagnostic import DiagnosticPools, DiagnosticTimer, pop_diagnostic_variant
+from .answer_keys import save_answer_key, load_answer_key
+from .cache_keys import tg_link_key
+from .stats import quiz_stats, progress_stats, record_quiz_answer
+from .scoring import EGE_SCORER, OGE_SCORER, answer_matches, text_norm
+from .masks import parse_mask, extract_correct_letter
+from .quiz_service import (
+    DAILY_QUIZ_FALLBACK, daily_quiz, daily_quizzes, log_answer as log_quiz_answer_service,
+    weekly_report as build_weekly_report,
+    praise_report, weak_words_report,
+)
 import random
 from random import sample, choice, sample, randint, shuffle
 from django.db.models import Q
@@ -43,46 +56,6 @@ logger = logging.getLogger('django')
 
 # === Утилиты ===
 
-def extract_correct_letter(text, masked_word, orth_id=None):
-    """
-    Извлекает правильную букву/буквы из оригинального текста.
-    Маска *N* в masked_word может заменять одну или несколько букв.
-    """
-    try:
-        # Находим позицию открывающей скобки маски в masked_word
-        mask_start = masked_word.find('*')
-        if mask_start == -1:
-            return ''
-        
-        # Находим позицию закрывающей скобки маски
-        mask_end = masked_word.find('*', mask_start + 1)
-        if mask_end == -1:
-            return ''
-        
-        # В оригинальном text на той же позиции стоит правильная буква/буквы
-        if mask_start >= len(text):
-            return ''
-        
-        # Смотрим, что идёт после маски в masked_word
-        after_mask = masked_word[mask_end + 1:]
-        
-        # Ищем эту же последовательность в оригинальном тексте, начиная с позиции маски
-        text_from_mask = text[mask_start:]
-        
-        # Если after_mask не пустой, ищем его вхождение
-        if after_mask and after_mask in text_from_mask:
-            # Всё, что до after_mask - это искомая буква/буквы
-            pos = text_from_mask.find(after_mask)
-            return text_from_mask[:pos]
-        else:
-            # Если after_mask не найден, берём один символ
-            char = text[mask_start]
-            return '|' if char == '\\' else char
-        
-    except Exception:
-        return ''
-
-
 def validate_orthogram_ids(ids):
     """Преобразует строковые/списочные ID орфограмм в список целых чисел."""
     if not isinstance(ids, list):
@@ -330,7 +303,7 @@ def format_orthogram_masks(examples, is_multi_line=False):
             
             # Создаём маску
             new_mask = f"10_{ex.orthogram_id}-{mask_index}"
-            masked = re.sub(r'\*\d+(?:_\d+)?\*', f'*{new_mask}*', masked, count=1)
+            masked = parse_mask(masked).fill_first(new_mask)
             
             if subgroup_key:
                 task10_letter_groups[new_mask] = subgroup_key
@@ -352,124 +325,81 @@ def format_orthogram_masks(examples, is_multi_line=False):
 def get_examples_with_subgroups(orthogram_ids, total_needed, grade_suffix=None):
     """
     Получает примеры с фильтрацией по подгруппам (как в диагностике) и по классу.
+    Примеры берутся потоком из каталога (main/catalog.py): буквы уже извлечены,
+    каждый пример проверяется не больше одного раза, запросов к БД нет.
     """
-    # Конфигурация подгрупп для задания 10
-    SUBGROUPS = [
-        {'key': 'sz', 'letters': ['з', 'с'], 'orth_ids': [10, 11]},
-        {'key': 'ao', 'letters': ['а', 'о'], 'orth_ids': [10]},
-        {'key': 'dt', 'letters': ['д', 'т'], 'orth_ids': [10]},
-        {'key': 'ыи', 'letters': ['и', 'ы'], 'orth_ids': [28]},
-        {'key': 'еи', 'letters': ['е', 'и'], 'orth_ids': [29]},
-        {'key': 'ъь', 'letters': ['ъ', 'ь', '/'], 'orth_ids': [6]},
-    ]
+    catalog = get_orthogram_catalog()
     
     all_examples = []
     taken_ids = set()  # отслеживаем взятые ID
 
+    def take(stream, limit, letters=None, orth_id=None):
+        taken = 0
+        for entry in stream:
+            if taken >= limit:
+                break
+            if entry.id in taken_ids or (letters and entry.letter not in letters):
+                continue
+            all_examples.append((entry.example, entry.letter, orth_id or entry.orthogram_id))
+            taken_ids.add(entry.id)
+            taken += 1
+
     # === 1. ПОДГРУППЫ (10,11,28,29,6) ===
     for group in SUBGROUPS:
         for orth_id in group['orth_ids']:
-            if orth_id not in orthogram_ids:
-                continue
-                
-            qs = OrthogramExample.objects.filter(
-                orthogram_id=orth_id,
-                is_active=True
-            )
-            
-            if grade_suffix:
-                qs = qs.filter(grades__contains=str(grade_suffix))
-            
-            for ex in qs.order_by('?')[:50]:
-                if ex.id in taken_ids:
-                    continue
-                    
-                correct = extract_correct_letter(ex.text, ex.masked_word)
-                if not correct:
-                    continue
-                    
-                if orth_id == 6:
-                    letter = '/' if correct == '' else correct
-                else:
-                    letter = correct.lower()
-                
-                if letter in group['letters']:
-                    all_examples.append((ex, letter, orth_id))
-                    taken_ids.add(ex.id)
+            if orth_id in orthogram_ids:
+                take(catalog.stream([orth_id], grade_suffix), total_needed, group['letters'], orth_id)
     
     # === 2. ОРФОГРАММЫ НЕ ИЗ ПОДГРУПП (1, 2, 21, 22, 23, 24 и т.д.) ===
     orth_ids_regular = [
         oid for oid in orthogram_ids 
-        if not any(oid in group['orth_ids'] for group in SUBGROUPS)
+        if oid not in SUBGROUP_ORTH_IDS
     ]
     
     if orth_ids_regular:
-        qs = OrthogramExample.objects.filter(
-            orthogram_id__in=orth_ids_regular,
-            is_active=True
-        ).exclude(id__in=taken_ids)
-        
-        if grade_suffix:
-            qs = qs.filter(grades__contains=str(grade_suffix))
-        
-        for ex in qs.order_by('?')[:total_needed * 2]:
-            if ex.id in taken_ids:
-                continue
-                
-            # Для орфограмм Н/НН передаём orth_id для правильной экстракции
-            letter = extract_correct_letter(ex.text, ex.masked_word, orth_id)
-            
-            # Добавляем логирование для орфограммы 38
-            if ex.orthogram_id == 38:
-                print(f"\n--- Обработка примера для орфограммы 38 ---")
-                print(f"ex.id: {ex.id}")
-                print(f"ex.text: '{ex.text}'")
-                print(f"ex.masked_word: '{ex.masked_word}'")
-                print(f"extracted letter: '{letter}'")
-                
-            if letter:
-                all_examples.append((ex, letter.lower(), ex.orthogram_id))
-                taken_ids.add(ex.id)
+        take(catalog.stream(orth_ids_regular, grade_suffix), total_needed * 2)
 
     # === ОРФОГРАММЫ 35 И 37 (Ё/О/Е) ===
     for orth_id in [35, 37]:
         if orth_id in orthogram_ids:
-            qs = OrthogramExample.objects.filter(
-                orthogram_id=orth_id,
-                is_active=True
-            )
-            
-            if grade_suffix:
-                qs = qs.filter(grades__contains=str(grade_suffix))
-            
-            for ex in qs.order_by('?')[:total_needed]:
-                correct = extract_correct_letter(ex.text, ex.masked_word)
-                if correct:
-                    all_examples.append((ex, correct.lower(), orth_id))
+            take(catalog.stream([orth_id], grade_suffix), total_needed, orth_id=orth_id)
     
     # === 3. ДОБИРАЕМ ПРИ НЕОБХОДИМОСТИ ===
     if len(all_examples) < total_needed:
-        remaining = total_needed - len(all_examples)
-        
-        extra = OrthogramExample.objects.filter(
-            orthogram_id__in=orthogram_ids,
-            is_active=True
-        ).exclude(id__in=taken_ids)
-        
-        if grade_suffix:
-            extra = extra.filter(grades__contains=str(grade_suffix))
-        
-        for ex in extra.order_by('?')[:remaining]:
-            # Для орфограмм Н/НН передаём orth_id для правильной экстракции
-            letter = extract_correct_letter(ex.text, ex.masked_word, orth_id)
-            if letter:
-                all_examples.append((ex, letter.lower(), ex.orthogram_id))
-                taken_ids.add(ex.id)
+        take(catalog.stream(orthogram_ids, grade_suffix), total_needed - len(all_examples))
     
     random.shuffle(all_examples)
     return all_examples
 
 
+def get_controlled_examples(orth_id, combined_count, separate_count):
+    """
+    Примеры орфограмм 21/32/36 с заданным соотношением слитных ('/' в
+    explanation) и раздельных ('|') написаний — из того же каталога.
+    Возвращает None, если примеров какого-то вида не хватает.
+    """
+    catalog = get_orthogram_catalog()
+    combined, separate = [], []
+
+    for entry in catalog.stream([orth_id]):
+        explanation = entry.example.explanation or ''
+        if len(combined) < combined_count and '/' in explanation:
+            combined.append(entry)
+        elif len(separate) < separate_count and '|' in explanation:
+            separate.append(entry)
+        if len(combined) == combined_count and len(separate) == separate_count:
+            break
+    else:
+        return None
+
+    selected = combined + separate
+    random.shuffle(selected)
+    return [(entry.example, entry.letter, orth_id) for entry in selected]
+
+
+# Бюджет SQL-запросов на подбор примеров generate_exercise (перестройка каталога)
+EXERCISE_SELECT_QUERY_BUDGET = 1
+
 
 @login_required
 def generate_exercise(request):
@@ -527,97 +457,36 @@ def generate_exercise(request):
         is_task_14 = orthogram_ids == [1400]
         total_needed = 5 if (is_task_13 or is_task_14) else 16
         
-        # === Получаем примеры С ФИЛЬТРАЦИЕЙ ПО КЛАССУ ===
-        examples_with_data = get_examples_with_subgroups(
-            orthogram_ids, 
-            total_needed * 2,  # Берем с запасом
-            grade_suffix=grade_suffix or grade_filter
-        )
-
-        if not examples_with_data:
-            return JsonResponse({'error': 'Нет доступных слов'}, status=404)
-        
         # === СПЕЦИАЛЬНАЯ ОБРАБОТКА ДЛЯ ОРФОГРАММ 21, 32, 36 (НЕ с разными частями речи) ===
         # Орфограммы, где нужно контролировать соотношение слитных/раздельных примеров
         CONTROLLED_ORTHOGRAMS = {21, 32, 36}
 
-        if len(orthogram_ids) == 1 and orthogram_ids[0] in CONTROLLED_ORTHOGRAMS:
-            orth_id = orthogram_ids[0]
-            total_needed = 5
-            
-            # Случайно выбираем соотношение: 2/3 или 3/2
-            if random.choice([True, False]):
-                # Вариант А: 2 слитных, 3 раздельных
-                combined_count = 2
-                separate_count = 3
-            else:
-                # Вариант Б: 3 слитных, 2 раздельных
-                combined_count = 3
-                separate_count = 2
-            
-            logger.info(f"Орфограмма {orth_id}: генерируем {combined_count} слитных, {separate_count} раздельных")
-            
-            # Получаем примеры со слитным написанием
-            combined_examples = list(OrthogramExample.objects.filter(
-                orthogram_id=orth_id,
-                is_active=True,
-                explanation__icontains='/'
-            ).order_by('?')[:10])
-            
-            # Получаем примеры с раздельным написанием
-            separate_examples = list(OrthogramExample.objects.filter(
-                orthogram_id=orth_id,
-                is_active=True,
-                explanation__icontains='|'
-            ).order_by('?')[:10])
-            
-            # Проверяем, хватает ли примеров
-            if len(combined_examples) < combined_count or len(separate_examples) < separate_count:
-                logger.warning(f"Недостаточно примеров для орфограммы {orth_id} с контролируемым соотношением")
-                # Если не хватает, используем обычную логику
+        timer = DiagnosticTimer()
+        with timer.step('select'):
+            examples_with_data = None
+            if len(orthogram_ids) == 1 and orthogram_ids[0] in CONTROLLED_ORTHOGRAMS:
+                orth_id = orthogram_ids[0]
+                total_needed = 5
+                
+                # Случайно выбираем соотношение: 2 слитных / 3 раздельных или 3 / 2
+                combined_count = random.choice([2, 3])
+                separate_count = total_needed - combined_count
+                logger.info(f"Орфограмма {orth_id}: генерируем {combined_count} слитных, {separate_count} раздельных")
+                
+                examples_with_data = get_controlled_examples(orth_id, combined_count, separate_count)
+                if examples_with_data is None:
+                    # Если не хватает, используем обычную логику
+                    logger.warning(f"Недостаточно примеров для орфограммы {orth_id} с контролируемым соотношением")
+
+            if examples_with_data is None:
+                # === Получаем примеры С ФИЛЬТРАЦИЕЙ ПО КЛАССУ (берём с запасом) ===
                 examples_with_data = get_examples_with_subgroups(
                     orthogram_ids, total_needed * 2,
                     grade_suffix=grade_suffix or grade_filter
                 )
-            else:
-                # Выбираем нужное количество примеров
-                selected_combined = random.sample(combined_examples, combined_count)
-                selected_separate = random.sample(separate_examples, separate_count)
-                
-                # Объединяем и перемешиваем
-                all_examples = selected_separate + selected_combined
-                random.shuffle(all_examples)
-                
-                # Формируем результат
-                examples_with_data = []
-                used_ids = set()
-                
-                for ex in all_examples:
-                    if ex.id in used_ids:
-                        continue
-                    letter = extract_correct_letter(ex.text, ex.masked_word, orth_id)
-                    if letter:
-                        examples_with_data.append((ex, letter, orth_id))
-                        used_ids.add(ex.id)
-                
-                # Если не хватило, добираем
-                if len(examples_with_data) < total_needed:
-                    remaining = total_needed - len(examples_with_data)
-                    extra = OrthogramExample.objects.filter(
-                        orthogram_id=orth_id,
-                        is_active=True
-                    ).exclude(id__in=used_ids).order_by('?')[:remaining]
-                    
-                    for ex in extra:
-                        letter = extract_correct_letter(ex.text, ex.masked_word, orth_id)
-                        if letter:
-                            examples_with_data.append((ex, letter, orth_id))
-        else:
-            # Обычная логика для всех остальных орфограмм
-            examples_with_data = get_examples_with_subgroups(
-                orthogram_ids, total_needed * 2,
-                grade_suffix=grade_suffix or grade_filter
-            )
+
+        if not examples_with_data:
+            return JsonResponse({'error': 'Нет доступных слов'}, status=404)
 
         # Обрезаем до нужного количества
         examples_with_data = examples_with_data[:total_needed]
@@ -679,8 +548,11 @@ def generate_exercise(request):
         # ← ОПРЕДЕЛЯЕМ is_ege ОДИН РАЗ
         is_ege = (grade_suffix in ['10', '11']) or (grade_filter in [10, 11])
 
+        catalog = get_orthogram_catalog()
+
         for ex, correct_letter, orth_id in examples_with_data:
-            masked = ex.masked_word.strip()
+            entry = catalog.get(ex.id)
+            masked = entry.masked if entry else ex.masked_word.strip()
             
             # === ВАЛИДАЦИЯ ===
             if '*' not in masked:
@@ -690,23 +562,22 @@ def generate_exercise(request):
                 continue
             
             # === ОПРЕДЕЛЯЕМ ПОДГРУППУ ===
-            subgroup_key = None
-            for group in SUBGROUPS_CONFIG:
-                if orth_id in group['orth_ids'] and correct_letter in group['letters']:
-                    subgroup_key = group['key']
-                    break
+            subgroup_key = get_subgroup_key(orth_id, correct_letter)
             
             # === ФОРМИРУЕМ МАСКУ ===
             if orth_id in {10, 11, 28, 29, 6}:
                 # ВСЕГДА используем формат 10_ORTHID-INDEX
                 new_mask = f"10_{orth_id}-{mask_index}"
-                masked = re.sub(r'\*\d+(?:_\d+)?\*', f'*{new_mask}*', masked, count=1)
+                masked = parse_mask(masked).fill_first(new_mask)
                 if subgroup_key:
                     task10_letter_groups[new_mask] = subgroup_key
                 mask_index += 1
+            elif entry and entry.orthogram_id == orth_id:
+                # Обычная маска: *ID* (уже нормализована в каталоге)
+                masked = entry.mask
             else:
                 # Обычная маска: *ID*
-                masked = re.sub(r'\*[^*]+\*', f'*{orth_id}*', masked)
+                masked = parse_mask(masked).fill_all(orth_id)
             
             # ← СОХРАНЯЕМ ТОЛЬКО ВАЛИДНЫЕ СЛОВА
             formatted_items.append(masked)
@@ -737,32 +608,42 @@ def generate_exercise(request):
             words_text = ', '.join(formatted_items)
             words_lines = None
         
-        # Сохраняем в сессию
-        request.session['current_exercise'] = {
-            'exercise_id': f'dynamic_{",".join(map(str, orthogram_ids))}',
-            'example_ids': [ex.id for ex in examples],
-            'correct_letters': letters,
-            'orthogram_ids': orthogram_ids,
-        }
+        # Сохраняем ключ ответов
+        exercise_id = f'dynamic_{",".join(map(str, orthogram_ids))}'
+        with timer.step('answer_key'):
+            save_answer_key(request, 'current_exercise', {
+                'exercise_id': exercise_id,
+                'example_ids': [ex.id for ex in examples],
+                'correct_letters': letters,
+                'orthogram_ids': orthogram_ids,
+            })
         
         # Рендерим шаблон
-        html = render_to_string('exercise_snippet.html', {
-            'words_text': words_text,
-            'words_lines': words_lines,
-            'is_orth21_lines': is_ne_split_lines,
-            'exercise_id': request.session['current_exercise']['exercise_id'],
-            'exercise_title': exercise_title,
-            'show_next_button': True,
-            'orthogram_ids': orthogram_ids,
-            'task10_letter_groups': json.dumps(task10_letter_groups),
-            'task10_subgroup_letters': json.dumps(task10_subgroup_letters),
-        })
+        with timer.step('render'):
+            html = render_to_string('exercise_snippet.html', {
+                'words_text': words_text,
+                'words_lines': words_lines,
+                'is_orth21_lines': is_ne_split_lines,
+                'exercise_id': exercise_id,
+                'exercise_title': exercise_title,
+                'show_next_button': True,
+                'orthogram_ids': orthogram_ids,
+                'task10_letter_groups': json.dumps(task10_letter_groups),
+                'task10_subgroup_letters': json.dumps(task10_subgroup_letters),
+            })
         
-        return JsonResponse({
+        select_queries = timer.timings[0][2]
+        if select_queries > EXERCISE_SELECT_QUERY_BUDGET:
+            logger.warning(f"generate_exercise: подбор примеров занял {select_queries} запросов "
+                           f"(бюджет {EXERCISE_SELECT_QUERY_BUDGET})")
+        
+        response = JsonResponse({
             'html': html,
             'task10_letter_groups': task10_letter_groups,
             'task10_subgroup_letters': task10_subgroup_letters,
         })
+        response['Server-Timing'] = timer.server_timing_header()
+        return response
         
     except Exception as e:
         logger.error(f"Ошибка в generate_exercise: {e}", exc_info=True)
@@ -806,10 +687,10 @@ def generate_exercise_multi(request):
             total_needed = 1
         
         # Берем нужное количество примеров
-        examples = OrthogramExample.objects.filter(
+        examples = random_sample(OrthogramExample.objects.filter(
             orthogram_id=orthogram_id,
             is_active=True
-        ).order_by('?')[:total_needed * 3]  # Берем с запасом
+        ), total_needed * 3)  # Берем с запасом
         
         correct_letters = []
         valid_examples = []
@@ -835,7 +716,7 @@ def generate_exercise_multi(request):
                 
                 if parts:
                     # Проверяем, что количество частей совпадает с количеством масок
-                    mask_count = ex.masked_word.count(f'*{orthogram_id}*')
+                    mask_count = parse_mask(ex.masked_word).count(orthogram_id)
                     if len(parts) >= mask_count and mask_count > 0:
                         correct_letters.append(parts[:mask_count])
                         valid_examples.append(ex)
@@ -856,7 +737,7 @@ def generate_exercise_multi(request):
                             parts.append(part)
                 
                 if parts:
-                    mask_count = ex.masked_word.count(f'*{orthogram_id}*')
+                    mask_count = parse_mask(ex.masked_word).count(orthogram_id)
                     if len(parts) >= mask_count and mask_count > 0:
                         correct_letters.append(parts[:mask_count])
                         valid_examples.append(ex)
@@ -872,12 +753,12 @@ def generate_exercise_multi(request):
         exercise_id = f'multi_{orthogram_id}'
         title = 'Задание 14' if orthogram_id == 1400 else 'Задание 15'
         
-        request.session['current_exercise'] = {
+        save_answer_key(request, 'current_exercise', {
             'exercise_id': exercise_id,
             'example_ids': [ex.id for ex in valid_examples],
             'correct_letters': correct_letters,
             'orthogram_ids': [orthogram_id],
-        }
+        })
         
         # === ПОДГОТОВКА ДАННЫХ ДЛЯ ШАБЛОНА ===
         words_lines = []
@@ -902,17 +783,17 @@ def generate_exercise_multi(request):
             # ИЛИ маски *1500* на *15-1*, *15-2* и т.д.
             prefix = '14-' if orthogram_id == 1400 else '15-'
             
-            while f'*{orthogram_id}*' in masked_word:
-                mask_id = f"{prefix}{mask_counter}"
-                masked_word = masked_word.replace(f'*{orthogram_id}*', f'*{mask_id}*', 1)
-                
-                # === ЗАПОЛНЯЕМ ГРУППЫ БУКВ ===
+            template = parse_mask(masked_word)
+            mask_ids = [f"{prefix}{mask_counter + i}" for i in range(template.count(orthogram_id))]
+            masked_word = template.renumber(orthogram_id, mask_ids)
+            mask_counter += len(mask_ids)
+            
+            # === ЗАПОЛНЯЕМ ГРУППЫ БУКВ ===
+            for mask_id in mask_ids:
                 if orthogram_id == 1400:
                     task14_letter_groups[mask_id] = 'preposition'
                 else:  # orthogram_id == 1500
                     task15_letter_groups[mask_id] = 'nn'
-                
-                mask_counter += 1
             
             words_lines.append(masked_word)
         
@@ -952,13 +833,10 @@ def extract_from_text_and_masks(text, masked_word, orthogram_id):
     Для орфограммы 1400 нормализует \ в |.
     """
     parts = []
-    masked = masked_word
+    template = parse_mask(masked_word)
     
-    while f'*{orthogram_id}*' in masked:
-        mask_start = masked.find('*')
-        if mask_start == -1:
-            break
-            
+    # Каждая маска соответствует одному символу text
+    for mask_start in template.slot_offsets()[:template.count(orthogram_id)]:
         if mask_start >= len(text):
             break
             
@@ -969,9 +847,6 @@ def extract_from_text_and_masks(text, masked_word, orthogram_id):
             char = '|'  # Заменяем обратный слеш на вертикальную черту
         
         parts.append(char)
-        
-        # Заменяем маску для продолжения поиска
-        masked = masked.replace(f'*{orthogram_id}*', 'X', 1)
     
     return parts
 
@@ -1001,10 +876,10 @@ def generate_punktum_exercise_multi(request):
         total_needed = 5 if punktum_id == '1600' else 1
         
         # Получаем активные примеры
-        examples = PunktumExample.objects.filter(
+        examples = random_sample(PunktumExample.objects.filter(
             punktum__id=punktum_id,
             is_active=True
-        ).order_by('?')[:total_needed * 3]
+        ), total_needed * 3)
         
         valid_examples = []
         correct_letters = []
@@ -1016,18 +891,8 @@ def generate_punktum_exercise_multi(request):
             
             parts = [p.strip() for p in explanation_text.split(',') if p.strip()]
             
-            # Для задания 21 используем формат 21-XXXX
-            if punktum_id.startswith('21'):
-                mask_pattern = f"*21-{punktum_id}*"
-                # Проверяем, есть ли в тексте исходная маска
-                if f"*{punktum_id}*" not in ex.masked_word:
-                    continue
-            else:
-                mask_pattern = f"*{punktum_id}*"
-                if mask_pattern not in ex.masked_word:
-                    continue
-            
-            mask_count = ex.masked_word.count(f"*{punktum_id}*")
+            # Масок *punktum_id* столько же, сколько ответов (и хотя бы одна)
+            mask_count = parse_mask(ex.masked_word).count(punktum_id)
             if mask_count != len(parts) or mask_count == 0:
                 continue
             
@@ -1069,12 +934,12 @@ def generate_punktum_exercise_multi(request):
             task21_subgroup_letters = {'punktum_21': ['2', '4.0', '4.1', '4.2', '5', '6', '7', '11', '12', '13', '14', '15', '16', '17']}
         
         # Сохраняем в сессию
-        request.session['current_exercise'] = {
+        save_answer_key(request, 'current_exercise', {
             'exercise_id': f'punktum_multi_{punktum_id}',
             'example_ids': [ex.id for ex in valid_examples],
             'correct_letters': correct_letters,
             'orthogram_ids': [punktum_id],
-        }
+        })
         
         # Формируем слова для отображения
         words_lines = []
@@ -1082,7 +947,8 @@ def generate_punktum_exercise_multi(request):
             masked = ex.masked_word.strip()
             if punktum_id.startswith('21'):
                 # Заменяем *2100* на *21-2100* для фронтенда
-                masked = masked.replace(f"*{punktum_id}*", f"*21-{punktum_id}*")
+                template = parse_mask(masked)
+                masked = template.renumber(punktum_id, [f"21-{punktum_id}"] * template.count(punktum_id))
             words_lines.append(masked)
         
         structured_examples = [
@@ -1148,73 +1014,34 @@ def generate_alphabetical_exercise(request):
         
         logger.info(f"Алфавитное задание: орфограмма {orthogram_id}, диапазон {range_code} ({start_letter}-{end_letter})")
 
-        # === ШАГ 1: Берем ВСЕ активные примеры для этой орфограммы (ТОЛЬКО 10-11 классы) ===
-        from django.db.models import Q
-        
-        all_examples = OrthogramExample.objects.filter(
-            Q(orthogram_id=orthogram_id_int) &
-            Q(is_active=True) &
-            (Q(grades__contains='10') | Q(grades__contains='11'))
-        ).distinct()
-        
-        logger.info(f"Найдено примеров в базе: {all_examples.count()}")
-        
-        # === ШАГ 2: Функция проверки первой буквы ===
-        def check_first_letter(word, start, end):
-            word_upper = word.upper()
-            for char in word_upper:
-                if ('А' <= char <= 'Я') or char == 'Ё':
-                    if char == 'Ё':
-                        char = 'Е'
-                    return start <= char <= end
-            return False
+        # === ШАГ 1: Один запрос по индексу (орфограмма, первая буква) ===
+        # first_letter и mask_valid вычисляются при сохранении примера (main/masks.py):
+        # в выборку попадают только слова с одной корректной маской и буквой в диапазоне
+        examples = OrthogramExample.objects.filter(
+            orthogram_id=orthogram_id_int,
+            is_active=True,
+            mask_valid=True,
+            first_letter__range=(start_letter, end_letter),
+            grade_mask__has_grade=[10, 11],
+        ).only('id', 'text', 'masked_word').order_by('id')
         
-        # === ШАГ 3: СТРОГАЯ ВАЛИДАЦИЯ И ФИЛЬТРАЦИЯ ===
+        # === ШАГ 2: Дубликаты и замена маски ===
         filtered_examples = []
         seen_words = set()  # для отслеживания дубликатов
         
-        for ex in all_examples:
-            # 1. Проверка первой буквы
-            if not check_first_letter(ex.masked_word, start_letter, end_letter):
-                continue
-            
-            # 2. Извлекаем правильную букву
-            letter = extract_correct_letter(ex.text, ex.masked_word)
-            if not letter:
-                continue
-            
-            # 3. СТРОГАЯ ВАЛИДАЦИЯ masked_word:
+        for ex in examples:
             masked = ex.masked_word.strip()
             
-            # === КРИТИЧЕСКАЯ ВАЛИДАЦИЯ ===
-            # Проверяем, что в слове ровно ДВА символа *
-            if masked.count('*') != 2:
-                continue
-            
-            # Проверяем формат: должно быть *цифра*
-            if not re.match(r'^[^*]*\*\d+\*[^*]*$', masked):
-                continue
-            
-            # Проверяем, что нет двойных пробелов
-            if '  ' in masked:
-                continue
-            
-            # Проверяем, что нет смайликов в исходных данных
-            if '😊' in masked:
-                continue
-            
-            # Минимальная длина слова
-            if len(masked) < 3:
-                continue
-            
             # Проверяем дубликаты
             word_key = masked.lower().replace('*', '')
             if word_key in seen_words:
                 continue
             seen_words.add(word_key)
             
-            # 4. ЗАМЕНА МАСКИ (ТОЛЬКО ОДИН РАЗ!)
-            masked = re.sub(r'\*\d+\*', f'*{orthogram_id_int}*', masked, count=1)
+            letter = extract_correct_letter(ex.text, ex.masked_word)
+            
+            # Замена маски (ТОЛЬКО ОДИН РАЗ!)
+            masked = parse_mask(masked).fill_first(orthogram_id_int)
             
             filtered_examples.append((ex, letter.lower(), masked))
         
@@ -1223,22 +1050,23 @@ def generate_alphabetical_exercise(request):
         if not filtered_examples:
             return JsonResponse({'error': f'Нет качественных слов в диапазоне {start_letter}-{end_letter} для 10-11 классов'}, status=404)
         
-        # === ШАГ 4: Формируем слова ===
+        # === ШАГ 3: Формируем слова ===
         words = [item[2] for item in filtered_examples]  # masked words
         correct_letters = [item[1] for item in filtered_examples]
         
-        # === ШАГ 5: Формируем текст и сессию ===
+        # === ШАГ 4: Формируем текст и сессию ===
         words_text = ', '.join(words)
         
-        request.session['current_exercise'] = {
-            'exercise_id': f'alphabetical_{orthogram_id}_{range_code}',
+        exercise_id = f'alphabetical_{orthogram_id}_{range_code}'
+        save_answer_key(request, 'current_exercise', {
+            'exercise_id': exercise_id,
             'correct_words': words,
             'correct_letters': correct_letters,
             'orthogram_id': orthogram_id,
             'range_code': range_code,
-        }
+        })
 
-        # === ШАГ 6: Название упражнения ===
+        # === ШАГ 5: Название упражнения ===
         prefix = config[orthogram_id]['title_prefix']
         range_labels = {
             'A-O': 'А-О', 'P-S': 'П-С', 'T-YA': 'Т-Я',
@@ -1247,10 +1075,10 @@ def generate_alphabetical_exercise(request):
         range_label = range_labels.get(range_code, range_code)
         exercise_title = f"{prefix} ({range_label})"
 
-        # === ШАГ 7: Рендерим HTML ===
+        # === ШАГ 6: Рендерим HTML ===
         html = render_to_string('exercise_snippet.html', {
             'words_text': words_text,
-            'exercise_id': request.session['current_exercise']['exercise_id'],
+            'exercise_id': exercise_id,
             'exercise_title': exercise_title,
             'show_next_button': False,
         })
@@ -1283,50 +1111,30 @@ def generate_task9_exercise(request):
         
         examples_data = []
         
+        catalog = get_orthogram_catalog()
+        
         # 1. Орфограммы 1 и 2 (только 11 класс)
         for orth_id in ORTH_CLASS_FILTERED:
-            qs = OrthogramExample.objects.filter(
-                orthogram_id=orth_id,
-                is_active=True,
-                grades__contains='11'
-            ).order_by('?')[:WORDS_PER_ORTH]
-            
-            for ex in qs:
-                letter = extract_correct_letter(ex.text, ex.masked_word)
-                if letter:
-                    examples_data.append((ex, letter.lower(), orth_id))
+            for entry in catalog.sample([orth_id], WORDS_PER_ORTH, grade='11'):
+                examples_data.append((entry.example, entry.letter, orth_id))
         
         # 2. Остальные орфограммы (любые классы)
         for orth_id in ORTH_REGULAR:
             if len(examples_data) >= TOTAL_NEEDED:
                 break
-                
-            qs = OrthogramExample.objects.filter(
-                orthogram_id=orth_id,
-                is_active=True
-            ).order_by('?')[:WORDS_PER_ORTH]
             
-            for ex in qs:
+            for entry in catalog.sample([orth_id], WORDS_PER_ORTH):
                 if len(examples_data) >= TOTAL_NEEDED:
                     break
-                letter = extract_correct_letter(ex.text, ex.masked_word)
-                if letter:
-                    examples_data.append((ex, letter.lower(), orth_id))
+                examples_data.append((entry.example, entry.letter, orth_id))
         
         # 3. Добираем при необходимости (из всех орфограмм)
         if len(examples_data) < TOTAL_NEEDED:
-            taken_ids = [ex.id for ex, _, _ in examples_data]
+            taken_ids = {ex.id for ex, _, _ in examples_data}
             remaining = TOTAL_NEEDED - len(examples_data)
             
-            extra = OrthogramExample.objects.filter(
-                orthogram_id__in=ALL_ORTH_IDS,
-                is_active=True
-            ).exclude(id__in=taken_ids).order_by('?')[:remaining]
-            
-            for ex in extra:
-                letter = extract_correct_letter(ex.text, ex.masked_word)
-                if letter:
-                    examples_data.append((ex, letter.lower(), ex.orthogram_id))
+            for entry in catalog.sample(ALL_ORTH_IDS, remaining, exclude_ids=taken_ids):
+                examples_data.append((entry.example, entry.letter, entry.orthogram_id))
         
         if not examples_data:
             return JsonResponse({'error': 'Нет примеров для задания 9'}, status=404)
@@ -1341,7 +1149,7 @@ def generate_task9_exercise(request):
 
         for ex, letter, orth_id in examples_data:
             # Нормализуем маску
-            masked = re.sub(r'\*[^*]+\*', f'*{orth_id}*', ex.masked_word.strip())
+            masked = parse_mask(ex.masked_word.strip()).fill_all(orth_id)
             
             # === ВАЛИДАЦИЯ ДО ДОБАВЛЕНИЯ ===
             if '*' not in masked:
@@ -1365,12 +1173,12 @@ def generate_task9_exercise(request):
             # Пока возвращаем как есть
         
         # 5. Сессия
-        request.session['current_exercise'] = {
+        save_answer_key(request, 'current_exercise', {
             'exercise_id': 'task9_ege',
             'example_ids': example_ids[:len(formatted_items)],
             'correct_letters': correct_letters,
             'orthogram_ids': ALL_ORTH_IDS,
-        }
+        })
         
         # 6. Рендерим
         html = render_to_string('exercise_snippet.html', {
@@ -1401,39 +1209,26 @@ def generate_chered_exercise(request):
         
         examples_data = []
         
+        catalog = get_orthogram_catalog()
+        
         # 1. Берем слова из всех орфограмм чередования (только 10-11 классы)
         for orth_id in ORTH_IDS:
             if len(examples_data) >= TOTAL_NEEDED:
                 break
             
-            qs = OrthogramExample.objects.filter(
-                orthogram_id=orth_id,
-                is_active=True,
-                grades__contains='11'  # только 11 класс для ЕГЭ
-            ).order_by('?')[:WORDS_PER_ORTH]
-            
-            for ex in qs:
+            # только 11 класс для ЕГЭ
+            for entry in catalog.sample([orth_id], WORDS_PER_ORTH, grade='11'):
                 if len(examples_data) >= TOTAL_NEEDED:
                     break
-                letter = extract_correct_letter(ex.text, ex.masked_word)
-                if letter:
-                    examples_data.append((ex, letter.lower(), orth_id))
+                examples_data.append((entry.example, entry.letter, orth_id))
         
         # 2. Добираем при необходимости (из всех орфограмм)
         if len(examples_data) < TOTAL_NEEDED:
-            taken_ids = [ex.id for ex, _, _ in examples_data]
+            taken_ids = {ex.id for ex, _, _ in examples_data}
             remaining = TOTAL_NEEDED - len(examples_data)
             
-            extra = OrthogramExample.objects.filter(
-                orthogram_id__in=ORTH_IDS,
-                is_active=True,
-                grades__contains='11'
-            ).exclude(id__in=taken_ids).order_by('?')[:remaining]
-            
-            for ex in extra:
-                letter = extract_correct_letter(ex.text, ex.masked_word)
-                if letter:
-                    examples_data.append((ex, letter.lower(), ex.orthogram_id))
+            for entry in catalog.sample(ORTH_IDS, remaining, grade='11', exclude_ids=taken_ids):
+                examples_data.append((entry.example, entry.letter, entry.orthogram_id))
         
         if not examples_data:
             return JsonResponse({'error': 'Нет примеров для чередующихся гласных'}, status=404)
@@ -1448,7 +1243,7 @@ def generate_chered_exercise(request):
 
         for ex, letter, orth_id in examples_data:
             # Нормализуем маску
-            masked = re.sub(r'\*[^*]+\*', f'*{orth_id}*', ex.masked_word.strip())
+            masked = parse_mask(ex.masked_word.strip()).fill_all(orth_id)
             
             # === ВАЛИДАЦИЯ ДО ДОБАВЛЕНИЯ ===
             if '*' not in masked:
@@ -1470,12 +1265,12 @@ def generate_chered_exercise(request):
             logger.warning(f"⚠️ Чередование: после валидации осталось {len(formatted_items)} слов")
         
         # 4. Сессия
-        request.session['current_exercise'] = {
+        save_answer_key(request, 'current_exercise', {
             'exercise_id': 'chered_ege',
             'example_ids': example_ids[:len(formatted_items)],
             'correct_letters': correct_letters,
             'orthogram_ids': ORTH_IDS,
-        }
+        })
         
         # 5. Рендерим
         html = render_to_string('exercise_snippet.html', {
@@ -1501,7 +1296,7 @@ def check_alphabetical_exercise(request):
         selected_letters = data.get('selected_letters', [])
         
         # Получаем правильные буквы из сессии
-        exercise_data = request.session.get('current_exercise', {})
+        exercise_data = load_answer_key(request, 'current_exercise', {})
         correct_letters = exercise_data.get('correct_letters', [])
         
         if not correct_letters:
@@ -1561,7 +1356,7 @@ def check_exercise(request):
             return JsonResponse({'error': 'Некорректный формат данных'}, status=400)
 
         # === Получение сессии ===
-        current_exercise = request.session.get('current_exercise')
+        current_exercise = load_answer_key(request, 'current_exercise')
         if not current_exercise:
             logger.error("Нет активного упражнения в сессии")
             return JsonResponse({'error': 'Нет активного упражнения'}, status=400)
@@ -1661,7 +1456,7 @@ def link_telegram(request):
         return HttpResponse("❌ Нет токена", status=400)
     
     # Проверяем токен в кэше
-    telegram_id = cache.get(f"tg_link_{token}")
+    telegram_id = cache.get(tg_link_key(token))
     if not telegram_id:
         return HttpResponse("⏰ Токен устарел (действует 5 мин)", status=400)
     
@@ -1672,29 +1467,11 @@ def link_telegram(request):
     profile.save()
     
     # Очищаем токен (одноразовый)
-    cache.delete(f"tg_link_{token}")
+    cache.delete(tg_link_key(token))
     
     return redirect('profile')  # или JSON-ответ для AJAX
 
 
-@csrf_exempt  # или используй TokenAuthentication
-def log_answer(request):
-    """Логирует ответ пользователя из бота"""
-    if request.method != 'POST':
-        return JsonResponse({'error': 'Method not allowed'}, status=405)
-    
-    data = json.loads(request.body)
-    tg_id = data.get('telegram_id')
-    
-    try:
-        profile = UserProfile.objects.get(telegram_id=tg_id)
-        # Здесь логика сохранения StudentAnswer
-        # StudentAnswer.objects.create(user=profile.user, ...)
-        return JsonResponse({'status': 'ok'})
-    except UserProfile.DoesNotExist:
-        return JsonResponse({'error': 'User not found'}, status=404)
-
-
 # === АВТОРИЗАЦИЯ ВК ===
 # === Эндпоинты для сайта (с авторизацией) ===
 
@@ -1848,10 +1625,10 @@ def get_quiz(request):
             return JsonResponse({'error': f'Нет вопросов для раздела {quiz_type}'})
         
         # Выбираем случайное слово
-        reference = base_query.order_by('?').first()
+        reference = random_first(base_query)
         
         correct = reference.text
-        masked = re.sub(r'\*\d+\*', '😊', reference.masked_word or '') if reference.masked_word else correct
+        masked = parse_mask(reference.masked_word).plain('😊') if reference.masked_word else correct
         incorrect = reference.incorrect_variant.strip()
         explanation = reference.explanation
         
@@ -1881,70 +1658,29 @@ def get_quiz_orthoepy_pair(request):
         return JsonResponse({'error': 'Method not allowed'}, status=400)
     
     import random
-    from .models import OrthoepyWord
-    
-    # Получаем все слова с правильным ударением, у которых есть неправильный вариант
-    correct_words = OrthoepyWord.objects.filter(
-        is_active=True,
-        is_correct=True
-    )
-    
-    all_pairs = []
-    for correct in correct_words:
-        incorrect = OrthoepyWord.objects.filter(
-            lemma=correct.lemma,
-            is_correct=False,
-            is_active=True
-        ).first()
-        
-        if incorrect:
-            all_pairs.append({
-                'correct': correct,
-                'incorrect': incorrect
-            })
-    
-    if not all_pairs:
+    from .orthoepy_pairs import get_orthoepy_pairs
+
+    # Случайная пара из готового индекса (правильное + неправильное ударение)
+    pair = get_orthoepy_pairs().random_pair()
+    if not pair:
         return JsonResponse({'error': 'Нет полных пар'})
     
-    # Выбираем случайную пару
-    pair = random.choice(all_pairs)
-    correct = pair['correct']
-    incorrect = pair['incorrect']
-    
     options = [
-        {'text': correct.word, 'is_correct': True},
-        {'text': incorrect.word, 'is_correct': False}
+        {'text': pair.correct_word, 'is_correct': True},
+        {'text': pair.incorrect_word, 'is_correct': False}
     ]
     random.shuffle(options)
     
     return JsonResponse({
         'question': 'Как правильно поставить ударение?',
         'options': options,
-        'example_id': correct.id,
-        'correct_answer': correct.word
+        'example_id': pair.correct_id,
+        'correct_answer': pair.correct_word
     })
 
-@login_required
-def log_quiz_answer_site(request):
-    """Логирует ответ пользователя на сайте"""
-    if request.method != 'POST':
-        return JsonResponse({'error': 'Method not allowed'}, status=400)
-    
-    import json
-    try:
-        data = json.loads(request.body)
-        print(f"📝 САЙТ: ответ на квиз {data}")
-        
-        # TODO: сохранять в БД
-        
-        return JsonResponse({'status': 'ok'})
-    except Exception as e:
-        print(f"Ошибка в log_quiz_answer_site: {e}")
-        return JsonResponse({'error': str(e)}, status=500)
-
 @login_required
 def get_planning_quiz(request):
-    """Квиз из планинга пользователя — циклический показ слов"""
+    """Квиз из планинга пользователя — очередь интервального повторения, затем выбор по весу"""
     if request.method != 'POST':
         return JsonResponse({'error': 'Method not allowed'}, status=400)
     
@@ -1953,72 +1689,45 @@ def get_planning_quiz(request):
     from .models import UserWord, QuizHistory
     
     try:
-        # Получаем все слова пользователя из планинга
-        user_words = UserWord.objects.filter(
-            user=request.user,
-            is_active=True
-        ).select_related('reference_word__orthogram')
-        
-        if not user_words.exists():
-            return JsonResponse({
-                'error': '📭 Начните заполнять планинг, и эти слова появятся здесь!'
-            })
-        
-        # Отбираем только те, у которых есть эталон с explanation и incorrect_variant
-        valid_words = []
-        for uw in user_words:
-            ref = uw.reference_word
-            if (ref and ref.explanation and ref.incorrect_variant 
-                and ref.is_active and not ref.is_user_added):
-                valid_words.append(uw)
-        
-        if not valid_words:
+        # Следующее слово из очереди повторения (самый ранний next_due)
+        user_word = UserWord.next_due_word(request.user)
+        
+        # Пока ни одно слово не подошло к сроку — тренировка: слово по весу
+        if user_word and user_word.next_due > timezone.now():
+            from .planning_sampler import draw_planning_word_id, invalidate_planning_sampler
+            word_id = draw_planning_word_id(request.user.id)
+            drawn = None
+            if word_id is not None:
+                drawn = UserWord.quiz_ready(request.user).select_related('reference_word__orthogram').filter(id=word_id).first()
+                if drawn is None:
+                    # Эталон слова изменился — дерево устарело
+                    invalidate_planning_sampler(request.user.id)
+            user_word = drawn or user_word
+        
+        if not user_word:
+            if not UserWord.objects.filter(user=request.user, is_active=True).exists():
+                return JsonResponse({
+                    'error': '📭 Начните заполнять планинг, и эти слова появятся здесь!'
+                })
             return JsonResponse({
                 'error': '📝 В вашем планинге пока нет слов для квиза. Добавьте слова, которые хотите запомнить!'
             })
         
-        # Получаем историю показов за сегодня
-        today = timezone.now().date()
-        history = QuizHistory.objects.filter(
-            user=request.user,
-            answer_time__date=today
-        ).order_by('answer_time')
-        
-        # Получаем ID слов, которые уже были показаны сегодня (в порядке показа)
-        shown_ids = list(history.values_list('user_word_id', flat=True))
-        
-        # Определяем следующее слово для показа (циклически)
-        if not shown_ids:
-            # Если история пуста, показываем случайное слово
-            user_word = random.choice(valid_words)
-        else:
-            # Находим последнее показанное слово
-            last_shown_id = shown_ids[-1]
-            
-            # Ищем индекс последнего показанного слова в списке valid_words
-            last_index = -1
-            for i, uw in enumerate(valid_words):
-                if uw.id == last_shown_id:
-                    last_index = i
-                    break
-            
-            # Выбираем следующее слово по кругу
-            next_index = (last_index + 1) % len(valid_words)
-            user_word = valid_words[next_index]
+        # Откладываем показанное слово, чтобы до ответа очередь шла дальше
+        user_word.mark_shown()
         
         ref = user_word.reference_word
         
         # Записываем в историю
-        QuizHistory.objects.create(
-            user=request.user,
+        record_quiz_answer(
+            user_id=request.user.id,
             word_id=ref.id,
             user_word_id=user_word.id,
-            answer_time=timezone.now(),
             was_correct=False
         )
         
         correct = ref.text
-        masked = re.sub(r'\*\d+\*', '😊', ref.masked_word or '') if ref.masked_word else correct
+        masked = parse_mask(ref.masked_word).plain('😊') if ref.masked_word else correct
         incorrect = ref.incorrect_variant.strip()
         explanation = ref.explanation
         
@@ -2047,32 +1756,15 @@ def get_planning_quiz(request):
 def admin_planning_check(request):
     """Проверка слов из планингов прямо в админке"""
     
-    # Получаем все уникальные слова из планингов
-    planning_words = UserWord.objects.filter(
-        is_active=True
-    ).values('text').annotate(
-        user_count=Count('user', distinct=True)
-    ).order_by('-user_count')
-    
-    missing_words = []
-    
-    for item in planning_words:
-        word_text = item['text']
-        # Проверяем, есть ли слово в эталонной БД
-        exists = OrthogramExample.objects.filter(
-            text=word_text,
-            is_user_added=False
-        ).exists()
-        
-        if not exists:
-            missing_words.append({
-                'text': word_text,
-                'user_count': item['user_count']
-            })
+    from .planning_links import missing_planning_words
+    
+    # Слова планингов без эталона — один запрос NOT EXISTS по text_norm
+    missing_words = list(missing_planning_words())
+    total_planning = UserWord.objects.filter(is_active=True).values('text').distinct().count()
     
     return render(request, 'admin/planning_check.html', {
         'missing_words': missing_words,
-        'total_planning': planning_words.count(),
+        'total_planning': total_planning,
         'total_missing': len(missing_words)
     })
 
@@ -2085,24 +1777,29 @@ def log_quiz_answer_site(request):
         return JsonResponse({'error': 'Method not allowed'}, status=400)
     
     import json
-    from .models import QuizHistory
-    from django.utils import timezone
     
     data = json.loads(request.body)
     example_id = data.get('example_id')
+    user_word_id = data.get('user_word_id')
     is_correct = data.get('is_correct', False)
     
     if not example_id:
         return JsonResponse({'error': 'Нет example_id'}, status=400)
     
-    # Сохраняем в историю
-    QuizHistory.objects.create(
-        user=request.user,
-        example_id=example_id,
-        was_correct=is_correct,
-        answer_time=timezone.now()
+    # Сохраняем в историю (и в свёртки статистики)
+    record_quiz_answer(
+        user_id=request.user.id,
+        word_id=example_id,
+        user_word_id=user_word_id,
+        was_correct=is_correct
     )
     
+    # Слово из планинга — обновляем расписание повторения
+    if user_word_id:
+        user_word = UserWord.objects.filter(id=user_word_id, user=request.user).first()
+        if user_word:
+            user_word.register_answer(is_correct)
+    
     return JsonResponse({'status': 'ok'})
 
 # === отчёты для ЛК ===
@@ -2157,6 +1854,50 @@ def parse_words_from_text(text):
 # ✅ API: СОХРАНЕНИЕ ПРИМЕРОВ (ПЛАНИНГ)
 # ========================================================================
 
+def sync_planning_words(user, field_name, words):
+    """
+    Приводит слова поля планинга к списку words по разнице с тем, что уже есть:
+    новые слова — одним bulk_create, убранные — одним UPDATE is_active=False,
+    вернувшиеся — одним UPDATE is_active=True. У оставшихся слов сохраняются
+    вес, счётчики и расписание повторения. Слова без эталона привязываются
+    к OrthogramExample по нормализованному тексту. Число запросов не зависит
+    от длины списка.
+    """
+    from .planning_links import link_planning_words
+    from .planning_sampler import invalidate_planning_sampler
+    
+    words = list(dict.fromkeys(words))  # без повторов, порядок сохраняем
+    wanted = set(words)
+    
+    with transaction.atomic():
+        existing = {
+            row['text']: row
+            for row in UserWord.objects.filter(user=user, field_name=field_name).values('id', 'text', 'is_active')
+        }
+        
+        added = [
+            UserWord(user=user, field_name=field_name, text=text, is_active=True)
+            for text in words if text not in existing
+        ]
+        removed_ids = [row['id'] for text, row in existing.items() if row['is_active'] and text not in wanted]
+        restored_ids = [row['id'] for text, row in existing.items() if not row['is_active'] and text in wanted]
+        
+        if added:
+            UserWord.objects.bulk_create(added, ignore_conflicts=True)
+        if removed_ids:
+            UserWord.objects.filter(id__in=removed_ids).update(is_active=False, updated_at=timezone.now())
+        if restored_ids:
+            UserWord.objects.filter(id__in=restored_ids).update(is_active=True, updated_at=timezone.now())
+        
+        linked = link_planning_words(UserWord.objects.filter(user=user, field_name=field_name, is_active=True))
+    
+    if added or removed_ids or restored_ids:
+        # bulk-операции не шлют сигналы — сбрасываем дерево весов сами
+        invalidate_planning_sampler(user.id)
+    
+    return {'added': len(added), 'removed': len(removed_ids), 'restored': len(restored_ids), 'linked': linked}
+
+
 @login_required
 def save_example(request):
     """Сохраняет ВСЕ слова пользователя в UserWord"""
@@ -2178,25 +1919,9 @@ def save_example(request):
         )
         
         # Сохраняем в UserWord
-        if field_name.startswith('user-input-orf-') and content:
-            orth_id = field_name.replace('user-input-orf-', '')
+        if field_name.startswith('user-input-orf-'):
             words = [w.strip() for w in content.split('\n') if w.strip()]
-            
-            # Удаляем старые
-            UserWord.objects.filter(
-                user=request.user,
-                field_name=field_name
-            ).delete()
-            
-            # Создаем новые (ПРОСТО СОХРАНЯЕМ, без проверки эталона)
-            for word_text in words:
-                UserWord.objects.create(
-                    user=request.user,
-                    field_name=field_name,
-                    text=word_text,
-                    orthogram_id=orth_id,  # добавляем orth_id для быстрого поиска
-                    is_active=True
-                )
+            sync_planning_words(request.user, field_name, words)
         
         return JsonResponse({'status': 'success'})
         
@@ -2224,90 +1949,6 @@ def load_examples(request):
 # ========================================================================
 # ✅ API: КВИЗ ДЛЯ БОТА — ГЛАВНАЯ ФУНКЦИЯ
 # ========================================================================
-def _get_personalized_preposition_quiz(user_id):
-    
-    print(f"\n🔍 Поиск слова для user_id={user_id}")
-    
-    today = timezone.now().date()
-    
-    # ===== 1. Получаем историю показов =====
-    # Все ID, показанные сегодня
-    shown_today_ids = list(QuizHistory.objects.filter(
-        user_id=user_id,
-        answer_time__date=today
-    ).values_list('word_id', flat=True))
-    
-    # Последнее показанное слово
-    last_shown = QuizHistory.objects.filter(
-        user_id=user_id
-    ).order_by('-answer_time').first()
-    
-    last_word_id = last_shown.word_id if last_shown else None
-    
-    print(f"📊 Показано сегодня: {len(shown_today_ids)}")
-    print(f"📊 Последнее слово ID: {last_word_id}")
-    
-    # ===== 2. Берем слова с вариантами =====
-    all_quiz_words = list(OrthogramExample.objects.filter(
-        is_active=True
-    ).exclude(
-        incorrect_variant__isnull=True
-    ).exclude(
-        incorrect_variant=''
-    ).select_related('orthogram'))
-    
-    print(f"📊 Всего слов с вариантами: {len(all_quiz_words)}")
-    
-    if not all_quiz_words:
-        # Заглушка
-        return {
-            'question': "Как пишется правильно:\nв**а",
-            'options': [
-                {'text': "вода", 'is_correct': True},
-                {'text': "вада", 'is_correct': False}
-            ],
-            'explanation': "Проверяемая гласная в корне слова",
-            'orthogram_id': 1,
-            'example_id': 0,
-            'user_word_id': None,
-            'source': 'fallback'
-        }
-    
-    # ===== 3. Фильтруем =====
-    # Убираем показанные сегодня
-    available = [w for w in all_quiz_words if w.id not in shown_today_ids]
-    
-    # Если все показаны - сбрасываем фильтр
-    if not available:
-        print("🔄 Все слова показаны - начинаем заново")
-        available = all_quiz_words.copy()
-    
-    # Если есть последнее слово - исключаем его (чтобы не повторялось подряд)
-    if last_word_id and len(available) > 1:
-        available = [w for w in available if w.id != last_word_id]
-    
-    print(f"📊 Доступно сейчас: {len(available)}")
-    
-    # ===== 4. Выбираем случайное =====
-    word = random.choice(available)
-    print(f"✅ Выбрано: {word.text} (ID: {word.id})")
-    
-    masked = word.masked_word if word.masked_word else word.text
-    
-    return {
-        'question': f"Как пишется правильно:\n{re.sub(r'\*\d+\*', '😊', masked)}",
-        'options': [
-            {'text': word.text, 'is_correct': True},
-            {'text': word.incorrect_variant, 'is_correct': False}
-        ],
-        'explanation': word.explanation or (word.orthogram.rule if word.orthogram else "Правило не указано"),
-        'orthogram_id': word.orthogram_id or 0,
-        'example_id': word.id,
-        'user_word_id': None,
-        'source': 'general'
-    }
-
-
 @csrf_exempt
 def get_daily_quiz(request):
     """API для получения квиза"""
@@ -2324,7 +1965,7 @@ def get_daily_quiz(request):
         print(f"\n🎯 ЗАПРОС КВИЗА для user_id={user_id}")
         
         # Вызываем функцию генерации квиза
-        quiz = _get_personalized_preposition_quiz(user_id)
+        quiz = daily_quiz(user_id)
         
         # Функция гарантированно возвращает вопрос (или создает тестовый)
         print(f"✅ Отправляю вопрос из источника: {quiz.get('source', 'unknown')}")
@@ -2337,18 +1978,36 @@ def get_daily_quiz(request):
         traceback.print_exc()
         
         # В случае любой ошибки возвращаем тестовый вопрос
-        return JsonResponse({
-            'question': "Как пишется правильно:\nв**а",
-            'options': [
-                {'text': "вода", 'is_correct': True},
-                {'text': "вада", 'is_correct': False}
-            ],
-            'explanation': "Проверяемая гласная в корне слова",
-            'orthogram_id': 1,
-            'example_id': 0,
-            'user_word_id': None,
-            'source': 'error_fallback'
-        })
+        return JsonResponse({**DAILY_QUIZ_FALLBACK, 'source': 'error_fallback'})
+
+# Сколько пользователей можно запросить за один вызов пакетного API
+DAILY_QUIZ_BATCH_LIMIT = 500
+
+
+@csrf_exempt
+def get_daily_quiz_batch(request):
+    """API для рассылки: вопросы для многих пользователей одним запросом"""
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Method not allowed'}, status=405)
+    
+    try:
+        data = json.loads(request.body)
+        user_ids = [int(user_id) for user_id in data.get('user_ids', [])]
+    except (ValueError, TypeError):
+        return JsonResponse({'error': 'Invalid user_ids'}, status=400)
+    
+    if not user_ids:
+        return JsonResponse({'error': 'No user_ids'}, status=400)
+    if len(user_ids) > DAILY_QUIZ_BATCH_LIMIT:
+        return JsonResponse({'error': f'Не больше {DAILY_QUIZ_BATCH_LIMIT} пользователей за запрос'}, status=400)
+    
+    try:
+        quizzes = {str(user_id): quiz for user_id, quiz in daily_quizzes(user_ids).items()}
+    except Exception as e:
+        logger.error(f"Ошибка в get_daily_quiz_batch: {e}", exc_info=True)
+        return JsonResponse({'error': str(e)}, status=500)
+    
+    return JsonResponse({'quizzes': quizzes})
 
 # ========================================================================
 # ✅ API: ЛОГИРОВАНИЕ ОТВЕТА БОТА
@@ -2366,48 +2025,11 @@ def log_quiz_answer(request):
         user_word_id = data.get('user_word_id')
         was_correct = data.get('was_correct', False)
         
-        print(f"\n📝 ЛОГИРОВАНИЕ ОТВЕТА:")
-        print(f"   user_id: {user_id}")
-        print(f"   word_id: {word_id}")
-        print(f"   user_word_id: {user_word_id}")
-        print(f"   was_correct: {was_correct}")
-        
         if not user_id or not word_id:
             return JsonResponse({'error': 'Missing required fields'}, status=400)
         
-        from .models import QuizHistory, UserWord
-        from django.utils import timezone
-        
-        # 1. Сохраняем в историю
-        history = QuizHistory.objects.create(
-            user_id=user_id,
-            word_id=word_id,
-            user_word_id=user_word_id,
-            was_correct=was_correct,
-            answer_time=timezone.now()
-        )
-        print(f"✅ История сохранена ID={history.id}")
-        
-        # 2. Если слово из планинга - обновляем статистику
-        if user_word_id:
-            try:
-                user_word = UserWord.objects.get(id=user_word_id)
-                
-                if was_correct:
-                    user_word.success_count += 1
-                    print(f"   +1 успех для {user_word.text}")
-                else:
-                    user_word.error_count += 1
-                    user_word.last_error = timezone.now()
-                    print(f"   +1 ошибка для {user_word.text}")
-                
-                # Пересчитываем вес
-                old_weight = user_word.weight
-                user_word.update_weight()
-                print(f"   Вес: {old_weight:.1f} → {user_word.weight:.1f}")
-                
-            except UserWord.DoesNotExist:
-                print(f"⚠️ UserWord {user_word_id} не найден")
+        # Ответ ложится в буфер; история, статистика и вес слова обновятся при переносе
+        log_quiz_answer_service(user_id, word_id, was_correct, user_word_id)
         
         return JsonResponse({'status': 'ok'})
         
@@ -2421,73 +2043,6 @@ def log_quiz_answer(request):
 # ✅ API: СТАТИСТИКА, КОТОРУЮ СОБИРАЕТ БОТ
 # ========================================================================
 
-def get_user_quiz_stats(user_id):
-    """Собирает статистику пользователя для отчета"""
-    
-    today = timezone.now().date()
-    week_ago = today - timedelta(days=7)
-    
-    # 1. Слова в планинге
-    total_words = UserWord.objects.filter(
-        user_id=user_id,
-        is_active=True
-    ).count()
-    
-    # 2. Статистика квизов за неделю
-    weekly_history = QuizHistory.objects.filter(
-        user_id=user_id,
-        answer_time__date__gte=week_ago
-    )
-    
-    total_attempts = weekly_history.count()
-    correct_attempts = weekly_history.filter(was_correct=True).count()
-    success_rate = round((correct_attempts / total_attempts * 100) if total_attempts > 0 else 0, 1)
-    
-    # 3. Сложные темы (орфограммы с наибольшим количеством ошибок)
-    # Группируем ошибки по орфограммам
-    ortho_errors = {}
-    
-    # Берем все неправильные ответы за неделю
-    wrong_answers = weekly_history.filter(was_correct=False).select_related('word__orthogram')
-    
-    for answer in wrong_answers:
-        orthogram = answer.word.orthogram
-        if orthogram:
-            ortho_id = orthogram.id
-            if ortho_id not in ortho_errors:
-                ortho_errors[ortho_id] = {
-                    'name': orthogram.name,
-                    'errors': 0,
-                    'field_name': f"user-input-orf-{ortho_id}"  # формируем имя поля
-                }
-            ortho_errors[ortho_id]['errors'] += 1
-    
-    # Сортируем по количеству ошибок (от большего к меньшему)
-    sorted_ortho = sorted(ortho_errors.values(), key=lambda x: x['errors'], reverse=True)
-    
-    # Формируем результат
-    result = {
-        'total_words': total_words,
-        'total_attempts': total_attempts,
-        'correct_answers': correct_attempts,
-        'success_rate': success_rate,
-        'weak_orthograms': []
-    }
-    
-    # Добавляем топ-5 сложных тем
-    for ortho in sorted_ortho[:5]:
-        ortho_id = ortho['field_name'].replace('user-input-orf-', '')
-        result['weak_orthograms'].append({
-            'name': ortho['name'],
-            'errors': ortho['errors'],
-            'orthogram_id': ortho_id,
-            'field_name': ortho['field_name'],
-            'repeat_message': f"повтори орфограмму {ortho_id}"
-        })
-    
-    return result
-
-
 def format_quiz_report(stats):
     """Форматирует статистику в читаемый текст"""
     report = "📊 **Ваша статистика**\n\n"
@@ -2525,78 +2080,12 @@ def weekly_report(request):
         if not user_id:
             return JsonResponse({'error': 'No user_id'}, status=400)
         
-        # Получаем статистику
-        from django.utils import timezone
-        from datetime import timedelta
-        from .models import UserWord, QuizHistory, Orthogram
+        # Получаем статистику (сложные темы — только 3 последних)
+        stats = build_weekly_report(user_id)
         
-        today = timezone.now().date()
-        week_ago = today - timedelta(days=7)
+        print(f"✅ Статистика собрана: total_words={stats['total_words']}, attempts={stats['total_attempts']}, weak={len(stats['weak_orthograms'])}")
         
-        # 1. Слова в планинге
-        total_words = UserWord.objects.filter(
-            user_id=user_id,
-            is_active=True
-        ).count()
-        
-        # 2. Статистика квизов за неделю
-        weekly_history = QuizHistory.objects.filter(
-            user_id=user_id,
-            answer_time__date__gte=week_ago
-        )
-        
-        total_attempts = weekly_history.count()
-        correct_attempts = weekly_history.filter(was_correct=True).count()
-        success_rate = round((correct_attempts / total_attempts * 100) if total_attempts > 0 else 0, 1)
-        
-        # 3. Сложные темы - ТОЛЬКО 3 ПОСЛЕДНИХ
-        ortho_errors = {}
-        
-        for answer in weekly_history.select_related('word__orthogram'):
-            if answer.word and answer.word.orthogram:
-                orthogram = answer.word.orthogram
-                ortho_id = orthogram.id
-                
-                if ortho_id not in ortho_errors:
-                    ortho_errors[ortho_id] = {
-                        'name': orthogram.name,
-                        'total': 0,
-                        'errors': 0,
-                        'orthogram_id': ortho_id,
-                        'last_error': answer.answer_time  # запоминаем время последней ошибки
-                    }
-                
-                ortho_errors[ortho_id]['total'] += 1
-                if not answer.was_correct:
-                    ortho_errors[ortho_id]['errors'] += 1
-                    ortho_errors[ortho_id]['last_error'] = answer.answer_time  # обновляем время
-        
-        # Преобразуем в список и сортируем по времени последней ошибки (сначала новые)
-        weak_list = []
-        for ortho_id, data in ortho_errors.items():
-            if data['errors'] > 0:  # только те, где есть ошибки
-                weak_list.append({
-                    'name': data['name'],
-                    'errors': data['errors'],
-                    'total': data['total'],
-                    'error_rate': round((data['errors'] / data['total'] * 100), 1) if data['total'] > 0 else 0,
-                    'orthogram_id': ortho_id,
-                    'last_error': data['last_error'].isoformat() if data['last_error'] else None
-                })
-        
-        # Сортируем по времени последней ошибки (сначала новые) и берем 3
-        weak_list.sort(key=lambda x: x['last_error'] or '', reverse=True)
-        weak_orthograms = weak_list[:3]
-        
-        print(f"✅ Статистика собрана: total_words={total_words}, attempts={total_attempts}, weak={len(weak_orthograms)}")
-        
-        return JsonResponse({
-            'total_words': total_words,
-            'total_attempts': total_attempts,
-            'correct_answers': correct_attempts,
-            'success_rate': success_rate,
-            'weak_orthograms': weak_orthograms  # только 3 последних
-        })
+        return JsonResponse(stats)
         
     except Exception as e:
         print(f"❌ Ошибка в weekly_report: {e}")
@@ -2606,73 +2095,8 @@ def weekly_report(request):
 
 
 def get_user_quiz_stats(user_id):
-    """Собирает статистику пользователя без дубликатов"""
-    
-    today = timezone.now().date()
-    week_ago = today - timedelta(days=7)
-    
-    # 1. Слова в планинге
-    total_words = UserWord.objects.filter(
-        user_id=user_id,
-        is_active=True
-    ).count()
-    
-    # 2. Статистика квизов за неделю
-    weekly_history = QuizHistory.objects.filter(
-        user_id=user_id,
-        answer_time__date__gte=week_ago
-    )
-    
-    total_attempts = weekly_history.count()
-    correct_attempts = weekly_history.filter(was_correct=True).count()
-    success_rate = round((correct_attempts / total_attempts * 100) if total_attempts > 0 else 0, 1)
-    
-    # 3. Сложные темы - используем словарь для уникальности
-    ortho_errors = {}
-    
-    # Берем все ответы за неделю
-    for answer in weekly_history.select_related('word__orthogram'):
-        if answer.word and answer.word.orthogram:
-            orthogram = answer.word.orthogram
-            ortho_id = orthogram.id
-            
-            # Если орфограмма еще не в словаре - добавляем
-            if ortho_id not in ortho_errors:
-                ortho_errors[ortho_id] = {
-                    'name': orthogram.name,
-                    'total': 0,
-                    'errors': 0,
-                    'orthogram_id': ortho_id
-                }
-            
-            # Увеличиваем счетчики
-            ortho_errors[ortho_id]['total'] += 1
-            if not answer.was_correct:
-                ortho_errors[ortho_id]['errors'] += 1
-    
-    # Преобразуем в список и считаем процент ошибок
-    weak_list = []
-    for ortho_id, data in ortho_errors.items():
-        if data['total'] >= 2:  # минимум 2 попытки
-            error_rate = (data['errors'] / data['total'] * 100)
-            weak_list.append({
-                'name': data['name'],
-                'errors': data['errors'],
-                'total': data['total'],
-                'error_rate': round(error_rate, 1),
-                'orthogram_id': ortho_id
-            })
-    
-    # Сортируем по количеству ошибок
-    weak_list.sort(key=lambda x: x['errors'], reverse=True)
-    
-    return {
-        'total_words': total_words,
-        'total_attempts': total_attempts,
-        'correct_answers': correct_attempts,
-        'success_rate': success_rate,
-        'weak_orthograms': weak_list[:5]  # топ-5
-    }
+    """Собирает статистику пользователя без дубликатов (см. main/stats.py)"""
+    return quiz_stats(user_id)
 
 @csrf_exempt
 def user_progress(request):
@@ -2683,46 +2107,7 @@ def user_progress(request):
     data = json.loads(request.body)
     user_id = data.get('user_id')
     
-    today = timezone.now().date()
-    week_ago = today - timedelta(days=7)
-    
-    # Слова с высокой успешностью (минимум 3 попытки)
-    mastered = []
-    history = QuizHistory.objects.filter(user_id=user_id)
-    
-    word_stats = {}
-    for h in history:
-        if h.word_id not in word_stats:
-            word_stats[h.word_id] = {'total': 0, 'correct': 0}
-        word_stats[h.word_id]['total'] += 1
-        if h.was_correct:
-            word_stats[h.word_id]['correct'] += 1
-    
-    for word_id, stats in word_stats.items():
-        if stats['total'] >= 3:
-            rate = (stats['correct'] / stats['total'] * 100)
-            if rate >= 80:
-                word = OrthogramExample.objects.get(id=word_id)
-                mastered.append({
-                    'text': word.text,
-                    'success_rate': round(rate, 1)
-                })
-    
-    # Прогресс за неделю
-    week_history = history.filter(answer_time__date__gte=week_ago)
-    prev_week = history.filter(
-        answer_time__date__gte=week_ago - timedelta(days=7),
-        answer_time__date__lt=week_ago
-    )
-    
-    week_rate = week_history.filter(was_correct=True).count() / week_history.count() * 100 if week_history.count() > 0 else 0
-    prev_rate = prev_week.filter(was_correct=True).count() / prev_week.count() * 100 if prev_week.count() > 0 else 0
-    progress = round(week_rate - prev_rate, 1)
-    
-    return JsonResponse({
-        'mastered_words': mastered[:10],
-        'weekly_progress': progress
-    })
+    return JsonResponse(progress_stats(user_id))
 
 @csrf_exempt
 def user_praise(request):
@@ -2737,46 +2122,7 @@ def user_praise(request):
         if not user_id:
             return JsonResponse({'error': 'No user_id'}, status=400)
         
-        week_ago = timezone.now().date() - timedelta(days=7)
-        
-        # Берем все ответы за неделю
-        history = QuizHistory.objects.filter(
-            user_id=user_id,
-            answer_time__date__gte=week_ago
-        )
-        
-        # Считаем статистику по каждому слову
-        word_stats = {}
-        for h in history:
-            if h.word_id not in word_stats:
-                word_stats[h.word_id] = {'total': 0, 'correct': 0}
-            word_stats[h.word_id]['total'] += 1
-            if h.was_correct:
-                word_stats[h.word_id]['correct'] += 1
-        
-        # Отбираем слова с высокой успешностью (>=80% при минимум 3 попытках)
-        mastered = []
-        for word_id, stats in word_stats.items():
-            if stats['total'] >= 3:
-                rate = (stats['correct'] / stats['total'] * 100)
-                if rate >= 80:
-                    try:
-                        word = OrthogramExample.objects.get(id=word_id)
-                        mastered.append({
-                            'text': word.text,
-                            'success_rate': round(rate, 1),
-                            'orthogram_id': word.orthogram_id
-                        })
-                    except OrthogramExample.DoesNotExist:
-                        continue
-        
-        # Сортируем по убыванию успешности
-        mastered.sort(key=lambda x: x['success_rate'], reverse=True)
-        
-        return JsonResponse({
-            'mastered_words': mastered[:5],  # топ-5
-            'total_mastered': len(mastered)
-        })
+        return JsonResponse(praise_report(user_id))
         
     except Exception as e:
         print(f"❌ Ошибка в user_praise: {e}")
@@ -2796,44 +2142,7 @@ def user_weak_words(request):
         if not user_id:
             return JsonResponse({'error': 'No user_id'}, status=400)
         
-        week_ago = timezone.now().date() - timedelta(days=7)
-        
-        # Слова с ошибками за неделю (где ошибок больше чем правильных ответов)
-        history = QuizHistory.objects.filter(
-            user_id=user_id,
-            answer_time__date__gte=week_ago
-        )
-        
-        # Считаем статистику по каждому слову
-        word_stats = {}
-        for h in history:
-            if h.word_id not in word_stats:
-                word_stats[h.word_id] = {'total': 0, 'correct': 0, 'errors': 0}
-            word_stats[h.word_id]['total'] += 1
-            if h.was_correct:
-                word_stats[h.word_id]['correct'] += 1
-            else:
-                word_stats[h.word_id]['errors'] += 1
-        
-        # Отбираем слова с ошибками (минимум 2 попытки и ошибок >= 50%)
-        weak_words = []
-        for word_id, stats in word_stats.items():
-            if stats['total'] >= 2 and stats['errors'] >= stats['correct']:
-                try:
-                    word = OrthogramExample.objects.get(id=word_id)
-                    weak_words.append({
-                        'text': word.text,
-                        'errors': stats['errors'],
-                        'total': stats['total'],
-                        'orthogram_id': word.orthogram_id
-                    })
-                except OrthogramExample.DoesNotExist:
-                    continue
-        
-        # Сортируем по количеству ошибок
-        weak_words.sort(key=lambda x: x['errors'], reverse=True)
-        
-        return JsonResponse({'weak_words': weak_words[:10]})  # топ-10
+        return JsonResponse(weak_words_report(user_id))  # топ-10
         
     except Exception as e:
         print(f"❌ Ошибка в user_weak_words: {e}")
@@ -2862,7 +2171,7 @@ def get_word_by_id(request):
             return JsonResponse({'error': 'Word not found'}, status=404)
         
         masked = word.masked_word if word.masked_word else word.text
-        masked = re.sub(r'\*\d+\*', '😊', masked)
+        masked = parse_mask(masked).plain('😊')
         
         return JsonResponse({
             'id': word.id,
@@ -2922,50 +2231,25 @@ def get_orthoepy_pair(request):
         return JsonResponse({'error': 'Method not allowed'}, status=405)
     
     try:
-        from .models import OrthoepyWord
-        import random
-        
-        # Получаем все уникальные леммы, у которых есть и правильный, и неправильный варианты
-        from django.db.models import Count
-        
-        # Находим леммы, у которых есть минимум 2 варианта (правильный и неправильный)
-        lemmas_with_both = OrthoepyWord.objects.filter(
-            is_active=True
-        ).values('lemma').annotate(
-            variant_count=Count('id')
-        ).filter(variant_count__gte=2)
-        
-        if not lemmas_with_both:
+        from .orthoepy_pairs import get_orthoepy_pairs
+
+        # Необязательный фильтр по классу: {"grade": 9}
+        try:
+            grade = json.loads(request.body or b'{}').get('grade')
+        except (ValueError, AttributeError):
+            grade = None
+
+        # Случайная пара из готового индекса лемм
+        pair = get_orthoepy_pairs().random_pair(grade)
+        if not pair:
             return JsonResponse({'error': 'No words with both variants'}, status=404)
         
-        # Выбираем случайную лемму
-        selected_lemma = random.choice(lemmas_with_both)['lemma']
-        
-        # Получаем все варианты для этой леммы
-        variants = list(OrthoepyWord.objects.filter(
-            lemma=selected_lemma,
-            is_active=True
-        ))
-        
-        # Находим правильный и неправильный варианты
-        correct = None
-        incorrect = None
-        
-        for v in variants:
-            if v.is_correct:
-                correct = v
-            else:
-                incorrect = v
-        
-        if not correct or not incorrect:
-            return JsonResponse({'error': 'Missing correct or incorrect variant'}, status=404)
-        
         return JsonResponse({
-            'id': correct.id,
-            'lemma': correct.lemma,
-            'variant1': correct.word,
-            'variant2': incorrect.word,
-            'correct': correct.word
+            'id': pair.correct_id,
+            'lemma': pair.lemma,
+            'variant1': pair.correct_word,
+            'variant2': pair.incorrect_word,
+            'correct': pair.correct_word
         })
         
     except Exception as e:
@@ -3024,13 +2308,13 @@ def generate_text_analysis(request):
             context['questions'].append(question_data)
         
         # Сохраняем в сессию для проверки
-        request.session['current_text_analysis'] = {
+        save_answer_key(request, 'current_text_analysis', {
             'task_id': task.id,
             'correct_answers': {
                 str(q.question_number): q.correct_answer
                 for q in questions
             }
-        }
+        })
         
         # Генерируем HTML
         html = render_to_string('text_analysis_snippet.html', context)
@@ -3051,7 +2335,7 @@ def check_text_analysis(request):
         user_answers = data.get('answers', {})
         
         # Получаем правильные ответы из сессии
-        session_data = request.session.get('current_text_analysis')
+        session_data = load_answer_key(request, 'current_text_analysis')
         if not session_data:
             return JsonResponse({'error': 'Сессия устарела'}, status=400)
         
@@ -3065,15 +2349,9 @@ def check_text_analysis(request):
             user_answer = user_answers.get(q_num, '').strip()
             correct_answer = correct_answers.get(q_num, '').strip()
             
-            if q_num == '1':
-                # Для вопроса 1: сравниваем текст (можно несколько вариантов через /)
-                correct_variants = [v.strip() for v in correct_answer.split('/')]
-                is_correct = user_answer.lower() in [v.lower() for v in correct_variants]
-            else:
-                # Для вопросов 2 и 3: сравниваем строку с номерами (например "345")
-                user_sorted = ''.join(sorted(user_answer))
-                correct_sorted = ''.join(sorted(correct_answer))
-                is_correct = user_sorted == correct_sorted
+            # Вопрос 1 — текст (варианты через /), вопросы 2 и 3 — номера (например "345")
+            mode = 'slash_variants' if q_num == '1' else 'sorted'
+            is_correct = answer_matches(mode, user_answer, correct_answer)
             
             results[q_num] = {
                 'is_correct': is_correct,
@@ -3170,13 +2448,13 @@ def generate_text_analysis_23_24(request):
             context['questions'].append(question_data)
         
         # Сохраняем в сессию
-        request.session['current_text_analysis_23_24'] = {
+        save_answer_key(request, 'current_text_analysis_23_24', {
             'task_id': task.id,
             'correct_answers': {
                 str(q.question_number): q.correct_answer
                 for q in questions
             }
-        }
+        })
         
         html = render_to_string('text_analysis_snippet.html', context)
         return JsonResponse({'html': html})
@@ -3196,7 +2474,7 @@ def check_text_analysis_23_24(request):
         data = json.loads(request.body)
         user_answers = data.get('answers', {})
         
-        session_data = request.session.get('current_text_analysis_23_24')
+        session_data = load_answer_key(request, 'current_text_analysis_23_24')
         if not session_data:
             return JsonResponse({'error': 'Сессия устарела'}, status=400)
         
@@ -3209,9 +2487,7 @@ def check_text_analysis_23_24(request):
             user_answer = user_answers.get(q_num, '').strip()
             correct_answer = correct_answers.get(q_num, '').strip()
             
-            user_sorted = ''.join(sorted(user_answer))
-            correct_sorted = ''.join(sorted(correct_answer))
-            is_correct = user_sorted == correct_sorted
+            is_correct = answer_matches('sorted', user_answer, correct_answer)
             
             results[q_num] = {
                 'is_correct': is_correct,
@@ -3234,13 +2510,8 @@ def check_text_analysis_23_24(request):
 
 
 # =========== ЗАДАНИЯ 25-26 ===============================================
-def normalize_free_text(s):
-    """Нормализация текста: нижний регистр, один пробел"""
-    return re.sub(r'\s+', ' ', s.strip().lower())
-
-def normalize_numbers_only(s):
-    """Оставить только цифры из строки"""
-    return re.sub(r'\D', '', s.strip())
+# Режимы сравнения main/scoring.py для тренажёра 23–26
+TEXT_ANALYSIS_23_26_MODES = {23: 'sorted_digits', 24: 'sorted_digits', 25: 'free_variants', 26: 'digit_variants'}
 
 @login_required
 def generate_text_analysis_23_26(request):
@@ -3287,12 +2558,12 @@ def generate_text_analysis_23_26(request):
             context['questions'].append(q_data)
 
         # Сохраняем правильные ответы в сессию
-        request.session['current_text_analysis_23_26'] = {
+        save_answer_key(request, 'current_text_analysis_23_26', {
             'task_id': task.id,
             'correct_answers': {
                 str(q.question_number): q.correct_answer for q in questions
             }
-        }
+        })
 
         html = render_to_string('text_analysis_snippet.html', context)
         return JsonResponse({'html': html})
@@ -3311,7 +2582,7 @@ def check_text_analysis_23_26(request):
     try:
         data = json.loads(request.body)
         user_answers = data.get('answers', {})
-        session = request.session.get('current_text_analysis_23_26')
+        session = load_answer_key(request, 'current_text_analysis_23_26')
         if not session:
             return JsonResponse({'error': 'Сессия устарела. Перезагрузите задание.'}, status=400)
 
@@ -3324,28 +2595,10 @@ def check_text_analysis_23_26(request):
             q_num = int(q_num_str)
             user_ans = user_answers.get(q_num_str, '').strip()
 
-            if q_num in (23, 24):
-                # Чекбоксы: сравниваем отсортированные цифры
-                ua_clean = normalize_numbers_only(user_ans)
-                ca_clean = normalize_numbers_only(correct_ans)
-                ua_sorted = ''.join(sorted(ua_clean))
-                ca_sorted = ''.join(sorted(ca_clean))
-                is_correct = ua_sorted == ca_sorted
-
-            elif q_num == 25:
-                # Фразеологизм: сравнение с вариантами через |
-                user_norm = normalize_free_text(user_ans)
-                correct_variants = [normalize_free_text(v) for v in correct_ans.split('|')]
-                is_correct = user_norm in correct_variants
-
-            elif q_num == 26:
-                # Номера предложений: только цифры, без сортировки!
-                user_digits = normalize_numbers_only(user_ans)
-                correct_variants = [normalize_numbers_only(v) for v in correct_ans.split('|')]
-                is_correct = user_digits in correct_variants
-
-            else:
-                is_correct = False
+            # 23–24 — отсортированные цифры, 25 — фразеологизм (варианты через |),
+            # 26 — номера предложений (только цифры, без сортировки)
+            mode = TEXT_ANALYSIS_23_26_MODES.get(q_num)
+            is_correct = bool(mode) and answer_matches(mode, user_ans, correct_ans)
 
             results[q_num_str] = {
                 'is_correct': is_correct,
@@ -3439,9 +2692,11 @@ def generate_orthoepy_test(request):
     })
 
     # === Сохраняем в сессию ===
-    request.session['orthoepy_correct'] = correct_answers  # СПИСОК правильных
-    request.session['orthoepy_all_variants'] = variants    # ВСЕ варианты
-    request.session['orthoepy_test_type'] = test_type
+    save_answer_key(request, 'orthoepy_test', {
+        'correct': correct_answers,   # СПИСОК правильных
+        'variants': variants,         # ВСЕ варианты
+        'test_type': test_type,
+    })
 
     return JsonResponse({
         'html': html,
@@ -3465,20 +2720,21 @@ def check_orthoepy_test(request):
     # Получаем ответы пользователя
     selected = set(data.get('selected', []))
     
-    # Получаем правильные ответы из сессии
-    correct_answers = request.session.get('orthoepy_correct', [])
+    # Получаем правильные ответы из хранилища ключей
+    test = load_answer_key(request, 'orthoepy_test', {})
+    correct_answers = test.get('correct', [])
     if not isinstance(correct_answers, list):
         correct_answers = [correct_answers]
     correct = set(correct_answers)
     
-    # Получаем ВСЕ варианты из сессии
-    all_variants = request.session.get('orthoepy_all_variants', [])
+    # Получаем ВСЕ варианты
+    all_variants = test.get('variants', [])
     
     # === Формируем результат для КАЖДОГО варианта ===
     variant_results = {}
+    normalized_correct = {text_norm(x) for x in correct}
     for i, variant in enumerate(all_variants, 1):
-        normalized = _normalize_text(variant)
-        normalized_correct = set(_normalize_text(x) for x in correct)
+        normalized = text_norm(variant)
         
         is_correct_variant = normalized in normalized_correct
         was_selected = variant in selected
@@ -3522,7 +2778,7 @@ def generate_task_paponim_test_view(request):
             return JsonResponse({'error': 'Нет активных заданий с ошибками'}, status=400)
 
         # 2. Выбираем ОДНО случайное ошибочное
-        erroneous = erroneous_qs.order_by('?').first()
+        erroneous = random_first(erroneous_qs)
 
         # 3. Исключаем предложения с тем же корнем
         excluded_roots = [erroneous.root] if erroneous.root else []
@@ -3535,7 +2791,7 @@ def generate_task_paponim_test_view(request):
         if excluded_roots:
             correct_qs = correct_qs.exclude(root__in=excluded_roots)
 
-        correct_list = list(correct_qs.order_by('?')[:4])
+        correct_list = list(random_sample(correct_qs, 4))
         if len(correct_list) < 4:
             return JsonResponse({
                 'error': f'Недостаточно корректных предложений (исключены корни: {excluded_roots})'
@@ -3547,10 +2803,10 @@ def generate_task_paponim_test_view(request):
 
         # 5. Сохраняем в сессии
         erroneous_index = next(i for i, s in enumerate(all_sentences) if s.has_error)
-        request.session['task_paponim_test'] = {
+        save_answer_key(request, 'task_paponim_test', {
             'correct_word': erroneous.correct_word.lower().strip(),
             'erroneous_index': erroneous_index
-        }
+        })
 
         html = render_to_string('task_paponim_snippet.html', {
             'sentences': [{'text': s.text} for s in all_sentences]
@@ -3571,7 +2827,7 @@ def check_task_paponim_test_view(request):
     try:
         data = json.loads(request.body)
         user_word = data.get('answer', '').lower().strip()
-        session = request.session.get('task_paponim_test', {})
+        session = load_answer_key(request, 'task_paponim_test', {})
 
         correct_word = session.get('correct_word', '')
         is_correct = user_word == correct_word
@@ -3597,11 +2853,11 @@ def generate_task_wordok_test_view(request):
         task_type = random.choice(['6100', '6200'])
 
         # Берём случайный пример нужного типа
-        example = WordOk.objects.filter(
+        example = random_first(WordOk.objects.filter(
             task_type=task_type,
             is_active=True,
             is_for_quiz=True
-        ).order_by('?').first()
+        ))
 
         if not example:
             return JsonResponse({
@@ -3615,10 +2871,10 @@ def generate_task_wordok_test_view(request):
             instruction = "Отредактируйте предложение: исправьте лексическую ошибку, ЗАМЕНИВ употреблённое неверно слово. Запишите подобранное слово."
 
         # Сохраняем в сессии
-        request.session['task_wordok_test'] = {
+        save_answer_key(request, 'task_wordok_test', {
             'correct_words': example.get_correct_words(),
             'task_type': task_type
-        }
+        })
 
         html = render_to_string('task_wordok_snippet.html', {
             'instruction': instruction,
@@ -3640,7 +2896,7 @@ def check_task_wordok_test_view(request):
     try:
         data = json.loads(request.body)
         user_word = data.get('answer', '').strip().lower()
-        session = request.session.get('task_wordok_test', {})
+        session = load_answer_key(request, 'task_wordok_test', {})
 
         correct_words = session.get('correct_words', [])
         is_correct = user_word in correct_words
@@ -3677,11 +2933,11 @@ def generate_correction_test_view(request):
     explanation = wrong_item.explanation.lower().strip() if wrong_item else ''
     correct_for_check = explanation or test_data['correct_answer'].lower().strip()
     
-    request.session['correction_test'] = {
+    save_answer_key(request, 'correction_test', {
         'correct_answer': correct_for_check,  # ← теперь здесь explanation
         'exercise_id': test_data['exercise_id'],
         'incorrect_word': test_data['incorrect_word'].lower().strip(),
-    }
+    })
     
     html = render_to_string('correction_test_snippet.html', {
         'words': test_data['words'],
@@ -3696,7 +2952,7 @@ def check_correction_view(request):
         return JsonResponse({'error': 'Только POST'}, status=405)
     data = json.loads(request.body)
     user_answer = data.get('answer', '').lower().strip()
-    test = request.session.get('correction_test', {})
+    test = load_answer_key(request, 'correction_test', {})
     correct = test.get('correct_answer', '')
     is_correct = user_answer == correct
     return JsonResponse({
@@ -3791,11 +3047,11 @@ def generate_task_eight_test_view(request):
         }
 
         # 9. Сохраняем в сессии
-        request.session['task_eight_test'] = {
+        save_answer_key(request, 'task_eight_test', {
             'new_structure': correct_answers_new,  # {'A': '1', 'B': '2', ...}
             'old_structure': correct_answers_old,  # {'id1': 'A', 'id2': None, ...}
             'sentences_positions': {str(ex.id): i for i, ex in enumerate(all_selected, 1)}
-        }
+        })
 
         # 10. Генерируем HTML с новой структурой
         html = render_to_string('task_grammatic_eight.html', {
@@ -3833,7 +3089,7 @@ def check_task_eight_test(request):
         return JsonResponse({'error': 'Некорректный формат данных'}, status=400)
 
     # Получаем эталон из сессии
-    session_data = request.session.get('task_eight_test')
+    session_data = load_answer_key(request, 'task_eight_test')
     if not session_data or not isinstance(session_data, dict):
         return JsonResponse({'error': 'Тест не найден. Обновите страницу.'}, status=400)
 
@@ -3961,11 +3217,11 @@ def generate_task_twotwo_test_view(request):
             device_names_list.append((str(i), device.get_id_display()))
 
         # Сохраняем в сессии
-        request.session['task_twotwo_test'] = {
+        save_answer_key(request, 'task_twotwo_test', {
             'correct_answers': correct_answers,
             'device_names_list': device_names_list,
             'all_devices': [d.id for d in all_devices]
-        }
+        })
 
         # Генерируем HTML С кнопкой проверки
         html = render_to_string('task_grammatic_twotwo_snippet.html', {
@@ -3996,7 +3252,7 @@ def check_task_twotwo_test(request):
         return JsonResponse({'error': 'Некорректный формат данных'}, status=400)
 
     # Получаем эталон из сессии
-    session_data = request.session.get('task_twotwo_test')
+    session_data = load_answer_key(request, 'task_twotwo_test')
     if not session_data:
         return JsonResponse({'error': 'Тест не найден. Обновите страницу.'}, status=400)
 
@@ -4041,20 +3297,24 @@ def check_task_twotwo_test(request):
 # ======= ДИАГНОСТИКА  =================================================
 
 # ======= УНИВЕРСАЛЬНАЯ ФУНКЦИЯ ДЛЯ ЗАДАНИЙ С КАРТИНКАМИ ========
-def generate_task_with_image(punktum_id, num_sentences=1, add_numbering=True):
+def generate_task_with_image(punktum_id, num_sentences=1, add_numbering=True, pools=None):
     """
     Минималистичная универсальная функция для заданий 16-21
     
     :param punktum_id: '1600', '1700', '2100' и т.д.
     :param num_sentences: количество предложений (5 для 16, 1 для остальных)
     :param add_numbering: True - с нумерацией, False - без
+    :param pools: DiagnosticPools с заранее загруженными примерами (необязательно)
     :return: словарь с данными или None
     """
     # Берем примеры
-    examples = PunktumExample.objects.filter(
-        punktum__id=punktum_id,
-        is_active=True
-    ).order_by('?')[:num_sentences]
+    if pools is not None:
+        examples = pools.punktum_sample(punktum_id, num_sentences)
+    else:
+        examples = random_sample(PunktumExample.objects.filter(
+            punktum__id=punktum_id,
+            is_active=True
+        ), num_sentences)
     
     if not examples:
         return None
@@ -4075,12 +3335,13 @@ def generate_task_with_image(punktum_id, num_sentences=1, add_numbering=True):
             correct = ['!' if p == '!' else '?' for p in parts]
         
         # Заменяем маски
-        mask_count = masked.count(f'*{punktum_id}*')
-        for _ in range(mask_count):
-            mask_id = f"{task_number}-{mask_idx}"
-            masked = masked.replace(f'*{punktum_id}*', f'*{mask_id}*', 1)
+        template = parse_mask(masked)
+        mask_count = template.count(punktum_id)
+        mask_ids = [f"{task_number}-{mask_idx + i}" for i in range(mask_count)]
+        masked = template.renumber(punktum_id, mask_ids)
+        for mask_id in mask_ids:
             letter_groups[mask_id] = f'punktum_{task_number}'
-            mask_idx += 1
+        mask_idx += mask_count
         
         # Корректировка если нужно
         if len(correct) != mask_count:
@@ -4126,17 +3387,54 @@ def generate_task_with_image(punktum_id, num_sentences=1, add_numbering=True):
     return result
 
 
-def generate_starting_diagnostic(request):
-    """Генерация входящей диагностической работы (задания 1–27)"""
-    if request.method != 'POST':
-        return JsonResponse({'error': 'Только POST'}, status=405)
+def generate_starting_diagnostic(request):
+    """Генерация входящей диагностической работы (задания 1–27)"""
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Только POST'}, status=405)
+
+    try:
+        user_grade = None
+        if request.user.is_authenticated and hasattr(request.user, 'profile'):
+            user_grade = request.user.profile.grade
+
+        # === Готовый вариант из пула (см. refill_diagnostic_pool) ===
+        timer = DiagnosticTimer()
+        with timer.step('pool'):
+            variant = pop_diagnostic_variant('ege', user_grade)
+
+        if variant:
+            html, session_data = variant.html, variant.answers
+        else:
+            html, session_data, timer = build_starting_diagnostic(user_grade)
+
+        save_answer_key(request, 'starting_diagnostic', session_data)
+
+        timer.log('Сборка диагностики')
+        response = JsonResponse({'html': html})
+        response['Server-Timing'] = timer.server_timing_header()
+        return response
+
+    except Exception as e:
+        logger.error(f"Ошибка генерации диагностики: {e}", exc_info=True)
+        return JsonResponse({'error': f'Ошибка: {str(e)}'}, status=500)
+
+
+def build_starting_diagnostic(user_grade=None):
+    """
+    Собирает вариант входящей диагностики.
+    Возвращает (html, ключ ответов для сессии, DiagnosticTimer).
+    """
+    session_data = {}
+    context = {}
+    timer = DiagnosticTimer()
 
-    try:
-        session_data = {}
-        context = {}
+    # === Общие пулы контента для всех заданий ===
+    with timer.step('pools'):
+        pools = DiagnosticPools()
 
-        # === Задания 1-3 ===
-        text_task_1_3, text_questions_1_3 = get_text_analysis_questions('1_3')
+    # === Задания 1-3 ===
+    with timer.step('task1_3'):
+        text_task_1_3, text_questions_1_3 = get_text_analysis_questions('1_3', pools=pools)
         if text_task_1_3:
             context['text_task_1_3'] = text_task_1_3
             context['text_questions_1_3'] = text_questions_1_3
@@ -4144,12 +3442,8 @@ def generate_starting_diagnostic(request):
                 str(q.question_number): q.correct_answer for q in text_questions_1_3
             }
 
-        # === Получаем класс пользователя ===
-        user_grade = None
-        if request.user.is_authenticated and hasattr(request.user, 'profile'):
-            user_grade = request.user.profile.grade
-        
-        # === ЗАДАНИЕ 4: ОРФОЭПИЯ (НОВАЯ ЛОГИКА) ===
+    # === ЗАДАНИЕ 4: ОРФОЭПИЯ (НОВАЯ ЛОГИКА) ===
+    with timer.step('task4'):
         test_data = OrthoepyWord.generate_test(
             num_options=5,
             correct_min=2,
@@ -4163,23 +3457,23 @@ def generate_starting_diagnostic(request):
             session_data['answer_4'] = test_data['correct_answers']
             session_data['variants_4'] = test_data['variants']
 
-        # === Задание 5: Паронимы ===
+    # === Задание 5: Паронимы ===
+    with timer.step('task5'):
         try:
-            erroneous_qs = TaskPaponim.objects.filter(is_active=True, correct_word__gt='')
-            correct_qs = TaskPaponim.objects.filter(is_active=True, correct_word__exact='')
-            if erroneous_qs.exists() and correct_qs.count() >= 4:
-                erroneous = erroneous_qs.order_by('?').first()
-                correct_list = list(correct_qs.order_by('?')[:4])
-                all_sentences = [erroneous] + correct_list
+            erroneous = pools.paronym_erroneous
+            correct_list = pools.paronym_correct
+            if erroneous and len(correct_list) >= 4:
+                all_sentences = [erroneous] + correct_list[:4]
                 random.shuffle(all_sentences)
                 context['paponim_sentences'] = all_sentences
                 session_data['answer_5'] = erroneous.correct_word
         except Exception as e:
             logger.error(f"Ошибка генерации задания 5: {e}")
 
-        # === Задание 6: Лексика ===
-        wordok_exclude = WordOk.objects.filter(is_active=True, task_type='6100').first()
-        wordok_replace = WordOk.objects.filter(is_active=True, task_type='6200').first()
+    # === Задание 6: Лексика ===
+    with timer.step('task6'):
+        wordok_exclude = pools.wordoks.get('6100')
+        wordok_replace = pools.wordoks.get('6200')
         available = []
         if wordok_exclude:
             available.append(('exclude', wordok_exclude))
@@ -4192,11 +3486,9 @@ def generate_starting_diagnostic(request):
                 context['wordok_task_type'] = task_type
                 session_data['answer_6'] = wordok.correct_variants
 
-        # === Задание 7: Грамматика ===
+    # === Задание 7: Грамматика ===
+    with timer.step('task7'):
         try:
-            user_grade = None
-            if request.user.is_authenticated and hasattr(request.user, 'profile'):
-                user_grade = request.user.profile.grade
             test_data = CorrectionExercise.generate_correction_test(user_grade=user_grade)
             if test_data:
                 wrong_item = CorrectionExercise.objects.filter(
@@ -4209,13 +3501,15 @@ def generate_starting_diagnostic(request):
         except Exception as e:
             logger.error(f"Ошибка генерации задания 7: {e}")
 
-        # === ЗАДАНИЕ 8: Грамматические ошибки ===
+    # === ЗАДАНИЕ 8: Грамматические ошибки ===
+    with timer.step('task8'):
         task8_data = generate_task8_for_diagnostic()
         if task8_data:
             context['task8_html'] = task8_data['html']
             session_data['task8_correct'] = task8_data['correct_answers']  # ← Это важно!
 
-        # === ЗАДАНИЕ 9 ===
+    # === ЗАДАНИЕ 9 ===
+    with timer.step('task9'):
         task9_lines = generate_task9_lines()
         if task9_lines:
             context['task9_lines'] = task9_lines
@@ -4223,7 +3517,8 @@ def generate_starting_diagnostic(request):
             if flat_letters:
                 session_data['task9_correct'] = flat_letters
 
-        # === ЗАДАНИЕ 10 ===
+    # === ЗАДАНИЕ 10 ===
+    with timer.step('task10'):
         task10_data = generate_task10_lines()
         if task10_data['lines']:
             context['task10_lines'] = task10_data['lines']
@@ -4231,7 +3526,8 @@ def generate_starting_diagnostic(request):
             context['task10_letter_groups'] = json.dumps(task10_data['letter_groups'])
             context['task10_subgroup_letters'] = json.dumps(task10_data['subgroup_letters_map'])
 
-        # === ЗАДАНИЕ 11 ===
+    # === ЗАДАНИЕ 11 ===
+    with timer.step('task11'):
         task11_data = generate_task11_lines()
         if task11_data['lines']:
             context['task11_lines'] = task11_data['lines']
@@ -4242,7 +3538,8 @@ def generate_starting_diagnostic(request):
             context['task11_subgroup_letters'] = json.dumps(task11_data['subgroup_letters_map'])
             context['task11_subgroup_info'] = json.dumps(task11_data.get('subgroup_info', {}))
 
-        # === ЗАДАНИЕ 12 ===
+    # === ЗАДАНИЕ 12 ===
+    with timer.step('task12'):
         task12_data = generate_task12_lines()
         if task12_data['lines']:
             context['task12_lines'] = task12_data['lines']
@@ -4250,7 +3547,8 @@ def generate_starting_diagnostic(request):
             context['task12_letter_groups'] = json.dumps(task12_data['letter_groups'])
             context['task12_subgroup_letters'] = json.dumps(task12_data['subgroup_letters_map'])
 
-        # === ЗАДАНИЕ 13: Слитное/раздельное НЕ ===
+    # === ЗАДАНИЕ 13: Слитное/раздельное НЕ ===
+    with timer.step('task13'):
         task13_data = generate_task13_lines()
         if task13_data['lines']:
             context['task13_lines'] = task13_data['lines']
@@ -4258,15 +3556,17 @@ def generate_starting_diagnostic(request):
             context['task13_letter_groups'] = json.dumps(task13_data['letter_groups'])
             context['task13_subgroup_letters'] = json.dumps(task13_data['subgroup_letters_map'])
 
-        # === ЗАДАНИЕ 14 ===
+    # === ЗАДАНИЕ 14 ===
+    with timer.step('task14'):
         task14_data = generate_task14_lines()
         if task14_data['lines']:
             context['task14_lines'] = task14_data['lines']
             session_data['task14_correct'] = task14_data['expected_letters']
             context['task14_letter_groups'] = json.dumps(task14_data['letter_groups'])
             context['task14_subgroup_letters'] = json.dumps(task14_data['subgroup_letters_map'])
-            
-        # === ЗАДАНИЕ 15 ===
+        
+    # === ЗАДАНИЕ 15 ===
+    with timer.step('task15'):
         task15_data = generate_task15_lines()
         if task15_data['lines']:
             context['task15_lines'] = task15_data['lines']
@@ -4274,11 +3574,13 @@ def generate_starting_diagnostic(request):
             context['task15_letter_groups'] = json.dumps(task15_data['letter_groups'])
             context['task15_subgroup_letters'] = json.dumps(task15_data['subgroup_letters_map'])
 
-        # === ЗАДАНИЕ 16: ПУНКТОГРАММА ===
+    # === ЗАДАНИЕ 16: ПУНКТОГРАММА ===
+    with timer.step('task16'):
         task16_data = generate_task_with_image(
             punktum_id='1600',
             num_sentences=5,      # 5 предложений для задания 16
-            add_numbering=True    # с нумерацией 1), 2), 3)...
+            add_numbering=True,   # с нумерацией 1), 2), 3)...
+            pools=pools
         )
 
         if task16_data:
@@ -4289,11 +3591,13 @@ def generate_starting_diagnostic(request):
             context['task16_letter_groups'] = json.dumps(task16_data['letter_groups'])
             context['task16_subgroup_letters'] = json.dumps(task16_data['subgroup_letters'])
 
-        # === ЗАДАНИЕ 17: ПУНКТОГРАММА ===
+    # === ЗАДАНИЕ 17: ПУНКТОГРАММА ===
+    with timer.step('task17'):
         task17_data = generate_task_with_image(
             punktum_id='1700',
             num_sentences=1,      # 1 предложение для задания 17
-            add_numbering=False   # без нумерации
+            add_numbering=False,  # без нумерации
+            pools=pools
         )
 
         if task17_data:
@@ -4304,8 +3608,9 @@ def generate_starting_diagnostic(request):
             context['task17_letter_groups'] = json.dumps(task17_data['letter_groups'])
             context['task17_subgroup_letters'] = json.dumps(task17_data['subgroup_letters'])
 
-        # === ЗАДАНИЕ 18: с абзацами ===
-        task18_data = generate_task18_with_paragraphs()  # Новая функция!
+    # === ЗАДАНИЕ 18: с абзацами ===
+    with timer.step('task18'):
+        task18_data = generate_task18_with_paragraphs(pools=pools)
 
         if task18_data:
             context['task18_data'] = task18_data
@@ -4318,11 +3623,13 @@ def generate_starting_diagnostic(request):
             context['task18_structured_examples'] = task18_data.get('structured_examples', [])
             context['task18_is_punktum_with_paragraphs'] = task18_data.get('is_punktum_with_paragraphs', False)
 
-        # === ЗАДАНИЕ 19: ПУНКТОГРАММА ===
+    # === ЗАДАНИЕ 19: ПУНКТОГРАММА ===
+    with timer.step('task19'):
         task19_data = generate_task_with_image(
             punktum_id='1900',
             num_sentences=1,      # 1 предложение для задания 19
-            add_numbering=False   # без нумерации
+            add_numbering=False,  # без нумерации
+            pools=pools
         )
 
         if task19_data:
@@ -4333,11 +3640,13 @@ def generate_starting_diagnostic(request):
             context['task19_letter_groups'] = json.dumps(task19_data['letter_groups'])
             context['task19_subgroup_letters'] = json.dumps(task19_data['subgroup_letters'])
 
-        # === ЗАДАНИЕ 20: ПУНКТОГРАММА ===
+    # === ЗАДАНИЕ 20: ПУНКТОГРАММА ===
+    with timer.step('task20'):
         task20_data = generate_task_with_image(
             punktum_id='2000',
             num_sentences=1,      # 1 предложение для задания 20
-            add_numbering=False   # без нумерации
+            add_numbering=False,  # без нумерации
+            pools=pools
         )
 
         if task20_data:
@@ -4348,15 +3657,17 @@ def generate_starting_diagnostic(request):
             context['task20_letter_groups'] = json.dumps(task20_data['letter_groups'])
             context['task20_subgroup_letters'] = json.dumps(task20_data['subgroup_letters'])
 
-        # === ЗАДАНИЕ 21: ДИНАМИЧЕСКОЕ (ТИРЕ/ДВОЕТОЧИЕ/ЗАПЯТЫЕ) ===
-        task21_data = generate_task21_for_diagnostic()
+    # === ЗАДАНИЕ 21: ДИНАМИЧЕСКОЕ (ТИРЕ/ДВОЕТОЧИЕ/ЗАПЯТЫЕ) ===
+    with timer.step('task21'):
+        task21_data = generate_task21_for_diagnostic(pools=pools)
         if task21_data:
             context['task21_data'] = task21_data
             session_data['task21_correct'] = task21_data['correct_symbols']
             context['task21_letter_groups'] = json.dumps(task21_data['letter_groups'])
             context['task21_subgroup_letters'] = json.dumps(task21_data['subgroup_letters'])
 
-        # === ЗАДАНИЕ 22: Средства выразительности ===
+    # === ЗАДАНИЕ 22: Средства выразительности ===
+    with timer.step('task22'):
         task22_data = generate_task_twotwo_for_diagnostic()
         if task22_data:
             context['task22_html'] = task22_data['html']
@@ -4364,8 +3675,9 @@ def generate_starting_diagnostic(request):
         else:
             context['task22_html'] = '<p>Задание 22 временно недоступно</p>'
 
-        # === Задания 23-26 ===
-        text_task_23_26, text_questions_23_26 = get_text_analysis_questions('23_26')
+    # === Задания 23-26 ===
+    with timer.step('task23_26'):
+        text_task_23_26, text_questions_23_26 = get_text_analysis_questions('23_26', pools=pools)
         if text_task_23_26:
             context['text_task_23_26'] = text_task_23_26
             context['text_questions_23_26'] = text_questions_23_26
@@ -4373,763 +3685,31 @@ def generate_starting_diagnostic(request):
                 str(q.question_number): q.correct_answer for q in text_questions_23_26
             }
 
-        # === Сохраняем в сессию ===
-        request.session['starting_diagnostic'] = session_data
+    # === Эталоны для проверки (main/scoring.py) ===
+    session_data['scoring'] = EGE_SCORER.prepare(session_data)
 
-        # === Рендерим шаблон ===
+    # === Рендерим шаблон ===
+    with timer.step('render'):
         html = render_to_string('diagnostic_snippet.html', context)
-        return JsonResponse({'html': html})
 
-    except Exception as e:
-        logger.error(f"Ошибка генерации диагностики: {e}", exc_info=True)
-        return JsonResponse({'error': f'Ошибка: {str(e)}'}, status=500)
+    return html, session_data, timer
     
 
 
-def _normalize_text(s):
-    """Приводит строку к нижнему регистру и убирает пробелы по краям."""
-    if not isinstance(s, str):
-        s = str(s)
-    return s.strip().lower()
-
-def _normalize_digits(s):
-    """Извлекает только цифры из строки."""
-    if not isinstance(s, str):
-        s = str(s)
-    return ''.join(filter(str.isdigit, s))
-
-
 def check_starting_diagnostic(request):
+    """Проверка стартовой диагностики ЕГЭ по спецификациям main/scoring.py."""
     if request.method != 'POST':
         return JsonResponse({'error': 'Только POST'}, status=405)
 
     try:
-        # УБИРАЕМ лишние переменные
         data = json.loads(request.body)
         user_answers_dict = data.get('answers', {})
-        session = request.session.get('starting_diagnostic')
-        
+        session = load_answer_key(request, 'starting_diagnostic')
+
         if not session:
             return JsonResponse({'error': 'Сессия устарела'}, status=400)
 
-        results = {}
-        total_score = 0
-        max_score = 0
-
-        # === Задания 1–3 (ТОЧНО как в тренажере) ===
-        answers_1_3 = session.get('answers_1_3', {})
-
-        for q_num_str, correct in answers_1_3.items():
-            # Получаем ответ пользователя (может быть строкой или списком)
-            user_ans_raw = user_answers_dict.get(q_num_str, '')
-            
-            # Обрабатываем по-разному в зависимости от типа
-            if isinstance(user_ans_raw, list):
-                # Для чекбоксов — объединяем в строку
-                user_ans = ''.join(str(x) for x in user_ans_raw)
-            else:
-                # Для текстовых полей — строка
-                user_ans = str(user_ans_raw).strip()
-            
-            if not user_ans:
-                continue
-            
-            is_correct = False
-            q_num = int(q_num_str)
-            
-            if q_num == 1:
-                # Задание 1: варианты через / (как в тренажере!)
-                correct_variants = [v.strip() for v in correct.split('/')]
-                is_correct = user_ans.lower() in [v.lower() for v in correct_variants]
-            else:
-                # Задания 2 и 3
-                user_sorted = ''.join(sorted(user_ans))
-                correct_sorted = ''.join(sorted(correct))
-                is_correct = user_sorted == correct_sorted
-            
-            results[q_num_str] = {'is_correct': is_correct}
-            total_score += int(is_correct)
-            max_score += 1
-
-        # === Задание 4: Орфоэпия ===
-        if 'answer_4' in session:
-            # Получаем правильные ответы и все варианты
-            correct_answers = session['answer_4']  # список правильных
-            all_variants = session.get('variants_4', [])  # все 5 вариантов
-            
-            # Получаем выбранные пользователем варианты (массив)
-            user_selected = user_answers_dict.get('4', [])
-            
-            # Нормализуем для сравнения
-            normalized_correct = set(_normalize_text(x) for x in correct_answers)
-            normalized_selected = set(_normalize_text(x) for x in user_selected)
-            
-            # Формируем результат для КАЖДОГО варианта
-            variant_results = {}
-            for i, variant in enumerate(all_variants, 1):
-                normalized = _normalize_text(variant)
-                is_correct_variant = normalized in normalized_correct
-                was_selected = normalized in normalized_selected
-                
-                variant_results[f'4-{i}'] = {
-                    'variant_text': variant,
-                    'is_correct': is_correct_variant,
-                    'was_selected': was_selected,
-                }
-            
-            # Правило ЕГЭ: 1 балл только если ВСЕ правильные выбраны и НИЧЕГО лишнего
-            is_perfect = normalized_selected == normalized_correct
-            
-            results['4'] = {
-                'is_correct': is_perfect,
-                'score': 1 if is_perfect else 0,
-                'variant_results': variant_results,
-            }
-            
-            total_score += 1 if is_perfect else 0
-            max_score += 1
-
-        # === Задание 5: Паронимы ===
-        if 'answer_5' in session:
-            correct = session['answer_5']
-            user_ans = user_answers_dict.get('5', '').strip()
-            if user_ans:
-                is_correct = _normalize_text(user_ans) == _normalize_text(correct)
-                results['5'] = {'is_correct': is_correct}
-                total_score += int(is_correct)
-                max_score += 1
-
-        # === Задание 6: Лексика ===
-        if 'answer_6' in session:
-            correct = session['answer_6']
-            user_ans = user_answers_dict.get('6', '').strip()
-            if user_ans:
-                variants = [v.strip() for v in correct.split(',') if v.strip()]
-                is_correct = _normalize_text(user_ans) in [_normalize_text(v) for v in variants]
-                results['6'] = {'is_correct': is_correct}
-                total_score += int(is_correct)
-                max_score += 1
-
-        # === Задание 7: Грамматика ===
-        if 'answer_7' in session:
-            correct = session['answer_7'].strip().lower()
-            user_ans = user_answers_dict.get('7', '').strip().lower()
-            user_words_list = user_ans.split()
-            user_word = user_words_list[-1] if user_words_list else ''
-            is_correct = _normalize_text(user_word) == _normalize_text(correct)
-            results['7'] = {'is_correct': is_correct}
-            total_score += int(is_correct)
-            max_score += 1
-
-        # === ЗАДАНИЕ 8: Грамматические ошибки ===
-        task8_correct = session.get('task8_correct', {})
-
-        if task8_correct:
-            task8_correct_count = 0
-            task8_details = {}
-            
-            letters = ['А', 'Б', 'В', 'Г', 'Д']
-            for letter in letters:
-                key = f"8-{letter}"
-                user_answer = user_answers_dict.get(key, '-')
-                correct_answer = task8_correct.get(letter, '')
-                
-                is_correct = (user_answer != '-' and 
-                            user_answer == correct_answer)
-                
-                task8_details[key] = {
-                    'is_correct': is_correct,
-                    'user_answer': user_answer,
-                    'correct_answer': correct_answer
-                }
-                
-                if is_correct:
-                    task8_correct_count += 1
-            
-            # Правила баллов для задания 8 (ТАК ЖЕ КАК ДЛЯ 22):
-            # 5 правильных = 2 балла
-            # 3-4 правильных = 1 балл
-            # 0-2 правильных = 0 баллов
-            if task8_correct_count == 5:
-                final_score = 2
-            elif task8_correct_count >= 3:  # ← ИЗМЕНИТЬ НА >= 3
-                final_score = 1
-            else:
-                final_score = 0
-            
-            results['8'] = {
-                'is_correct': final_score > 0,
-                'score': final_score,
-                'correct_count': task8_correct_count,
-                'max_score': 2,
-                'details': task8_details
-            }
-            
-            # Добавляем детальные результаты для подсветки
-            results.update({k: {'is_correct': v['is_correct']} 
-                        for k, v in task8_details.items()})
-            
-            total_score += final_score
-            max_score += 2  # Максимум 2 балла для задания 8
-
-        # === ЗАДАНИЕ 9: НОВОЕ ФОРМАТИРОВАНИЕ ===
-        if 'task9_correct' in session:
-            
-            # Получаем правильные буквы из сессии
-            expected_letters = session['task9_correct']
-            
-            # Собираем ответы пользователя для заданий 9-1, 9-2, ..., 9-15
-            user_answers_for_9 = []
-            total_masks = len(expected_letters)  # Должно быть 15, но проверяем
-            
-            for i in range(1, total_masks + 1):
-                key = f"9-{i}"
-                user_answer = user_answers_dict.get(key, "😊")
-                # Нормализуем ответ: убираем пробелы, приводим к нижнему регистру
-                user_answer = str(user_answer).strip().lower()
-                user_answers_for_9.append(user_answer)
-            
-            # Проверяем каждую букву
-            task9_correct_count = 0
-            task9_results = {}
-            
-            for i in range(total_masks):
-                key = f"9-{i+1}"
-                user_letter = user_answers_for_9[i]
-                correct_letter = expected_letters[i].lower() if i < len(expected_letters) else ''
-                
-                is_correct = (user_letter != "😊" and user_letter != '' and 
-                             user_letter == correct_letter)
-                
-                task9_results[key] = {'is_correct': is_correct}
-                if is_correct:
-                    task9_correct_count += 1
-            
-            # Определяем, сколько баллов давать за задание 9
-            # Если всего 15 масок, то 1 балл за все правильные
-            task9_score = 0
-            if total_masks == 15:
-                # 1 балл за все 15 правильных
-                is_task9_all_correct = (task9_correct_count == 15)
-                if is_task9_all_correct:
-                    task9_score = 1
-                    results['9'] = {'is_correct': True}
-                else:
-                    results['9'] = {'is_correct': False}
-            else:
-                # Альтернативная логика: частичные баллы
-                # Например, 1 балл за 12+ правильных из 15
-                required_for_full = min(12, total_masks)
-                if task9_correct_count >= required_for_full:
-                    task9_score = 1
-                    results['9'] = {'is_correct': True}
-                else:
-                    results['9'] = {'is_correct': False}
-            
-            # Добавляем детальные результаты для подсветки
-            results.update(task9_results)
-            
-            total_score += task9_score
-            max_score += 1  # Задание 9 дает максимум 1 балл
-            
-        # === ЗАДАНИЕ 10 ===
-        if 'task10_expected_map' in session:
-            expected_map = session['task10_expected_map']
-            
-            task10_correct_count = 0
-            task10_results = {}
-            
-            for key, correct_letter in expected_map.items():
-                user_answer = user_answers_dict.get(key, "😊")
-                user_clean = str(user_answer).strip().lower()
-                correct_clean = str(correct_letter).strip().lower()
-                
-                is_correct = (user_clean != "😊" and user_clean != "" and
-                            user_clean == correct_clean)
-                
-                task10_results[key] = {'is_correct': is_correct}
-                if is_correct:
-                    task10_correct_count += 1
-            
-            # 1 балл только если все маски заполнены верно
-            task10_score = 1 if task10_correct_count == len(expected_map) else 0
-            results['10'] = {'is_correct': task10_score == 1}
-            
-            # Добавляем детальные результаты для подсветки
-            results.update(task10_results)
-            
-            total_score += task10_score
-            max_score += 1
-            
-        # === ЗАДАНИЕ 11 ===
-        if 'task11_correct' in session:
-            expected_letters = session['task11_correct']
-            total_masks = len(expected_letters)
-            
-            task11_correct_count = 0
-            task11_results = {}
-            
-            for i in range(1, total_masks + 1):
-                key = f"11-{i}"
-                user_answer = user_answers_dict.get(key, "😊")
-                user_clean = str(user_answer).strip()  # не lower — сравнение точное
-                correct_letter = expected_letters[i - 1] if i <= len(expected_letters) else ""
-                
-                is_correct = (user_clean != "😊" and user_clean != "" and
-                             user_clean == correct_letter)
-                
-                task11_results[key] = {'is_correct': is_correct}
-                if is_correct:
-                    task11_correct_count += 1
-            
-            # 1 балл только если все маски заполнены верно
-            task11_score = 1 if task11_correct_count == total_masks else 0
-            results['11'] = {'is_correct': task11_score == 1}
-            
-            # Добавляем детальные результаты для подсветки
-            results.update(task11_results)
-            
-            total_score += task11_score
-            max_score += 1
-
-        # === ЗАДАНИЕ 12 ===
-        if 'task12_correct' in session:
-            expected_letters = session['task12_correct']
-            total_masks = len(expected_letters)  # Должно быть 10 (5 строк × 2 примера)
-            
-            task12_correct_count = 0
-            task12_results = {}
-            
-            for i in range(1, total_masks + 1):
-                key = f"12-{i}"
-                user_answer = user_answers_dict.get(key, "😊")
-                user_clean = str(user_answer).strip().lower()
-                correct_letter = expected_letters[i - 1] if i <= len(expected_letters) else ""
-                
-                is_correct = (user_clean != "😊" and user_clean != "" and
-                            user_clean == correct_letter)
-                
-                task12_results[key] = {'is_correct': is_correct}
-                if is_correct:
-                    task12_correct_count += 1
-            
-            # 1 балл только если все маски заполнены верно
-            task12_score = 1 if task12_correct_count == total_masks else 0
-            results['12'] = {'is_correct': task12_score == 1}
-            
-            # Добавляем детальные результаты для подсветки
-            results.update(task12_results)
-            
-            total_score += task12_score
-            max_score += 1
-
-        # === ЗАДАНИЕ 13 ===
-        if 'task13_correct' in session:
-            expected_letters = session['task13_correct']
-            total_masks = len(expected_letters)
-            task13_correct_count = 0
-            task13_results = {}
-            
-            for i in range(1, total_masks + 1):
-                key = f"13-{i}"
-                user_answer = user_answers_dict.get(key, "😊")
-                user_clean = str(user_answer).strip().lower()
-                correct_letter = expected_letters[i - 1] if i <= len(expected_letters) else ""
-                is_correct = (user_clean != "😊" and user_clean != "" and
-                            user_clean == correct_letter)
-                task13_results[key] = {'is_correct': is_correct}
-                if is_correct:
-                    task13_correct_count += 1
-            
-            # 1 балл только если все маски заполнены верно
-            task13_score = 1 if task13_correct_count == total_masks else 0
-            results['13'] = {'is_correct': task13_score == 1}
-            results.update(task13_results)
-            total_score += task13_score
-            max_score += 1
-
-        # === ЗАДАНИЕ 14 ===
-        if 'task14_correct' in session:
-            expected_letters = session['task14_correct']
-            total_masks = len(expected_letters)
-            
-            task14_correct_count = 0
-            task14_results = {}
-            
-            for i in range(1, total_masks + 1):
-                key = f"14-{i}"
-                user_answer = user_answers_dict.get(key, "😊")
-                user_clean = str(user_answer).strip().lower()
-                correct_letter = expected_letters[i - 1] if i <= len(expected_letters) else ""
-                
-                # Нормализация: \ → |
-                if user_clean == '\\':
-                    user_clean = '|'
-                if correct_letter == '\\':
-                    correct_letter = '|'
-                
-                is_correct = (user_clean != "😊" and user_clean != "" and
-                            user_clean == correct_letter)
-                
-                task14_results[key] = {'is_correct': is_correct}
-                if is_correct:
-                    task14_correct_count += 1
-            
-            # 1 балл за все правильные
-            task14_score = 1 if task14_correct_count == total_masks else 0
-            results['14'] = {'is_correct': task14_score == 1}
-            results.update(task14_results)
-            
-            total_score += task14_score
-            max_score += 1
-
-        # === ЗАДАНИЕ 15 ===
-        if 'task15_correct' in session:
-            expected_letters = session['task15_correct']
-            total_masks = len(expected_letters)
-            
-            task15_correct_count = 0
-            task15_results = {}
-            
-            for i in range(1, total_masks + 1):
-                key = f"15-{i}"
-                user_answer = user_answers_dict.get(key, "😊")
-                user_clean = str(user_answer).strip().lower()
-                correct_letter = expected_letters[i - 1] if i <= len(expected_letters) else ""
-                
-                is_correct = (user_clean != "😊" and user_clean != "" and
-                            user_clean == correct_letter)
-                
-                task15_results[key] = {'is_correct': is_correct}
-                if is_correct:
-                    task15_correct_count += 1
-            
-            # 1 балл за все правильные (в задании 15 обычно 1 балл за все маски в предложении)
-            task15_score = 1 if task15_correct_count == total_masks else 0
-            results['15'] = {'is_correct': task15_score == 1}
-            results.update(task15_results)
-            
-            total_score += task15_score
-            max_score += 1
-
-        # === ЗАДАНИЕ 16: Пунктуация ===
-        if 'task16_correct' in session:
-            expected_symbols = session['task16_correct']
-            
-            task16_correct_count = 0
-            task16_results = {}
-            
-            for i in range(1, len(expected_symbols) + 1):
-                key = f"16-{i}"
-                user_answer = user_answers_dict.get(key, "😊")
-                user_clean = str(user_answer).strip()
-                
-                # Нормализация
-                if user_clean == ',':
-                    user_clean = '!'
-                elif user_clean in ['х', 'x', '?']:
-                    user_clean = '?'
-                
-                correct_symbol = expected_symbols[i-1] if i <= len(expected_symbols) else '?'
-                is_correct = (user_clean != "😊" and user_clean != "" and
-                            user_clean == correct_symbol)
-                
-                task16_results[key] = {'is_correct': is_correct}
-                if is_correct:
-                    task16_correct_count += 1
-            
-            # 1 балл за все правильные
-            task16_score = 1 if task16_correct_count == len(expected_symbols) else 0
-            results['16'] = {'is_correct': task16_score == 1}
-            results.update(task16_results)
-            
-            total_score += task16_score
-            max_score += 1
-
-        # === ЗАДАНИЕ 17: Пунктуация ===
-        if 'task17_correct' in session:
-            expected_symbols = session['task17_correct']
-            
-            task17_correct_count = 0
-            task17_results = {}
-            
-            for i in range(1, len(expected_symbols) + 1):
-                key = f"17-{i}"
-                user_answer = user_answers_dict.get(key, "😊")
-                user_clean = str(user_answer).strip()
-                
-                # Нормализация
-                if user_clean == ',':
-                    user_clean = '!'
-                elif user_clean in ['х', 'x', '?']:
-                    user_clean = '?'
-                
-                correct_symbol = expected_symbols[i-1] if i <= len(expected_symbols) else '?'
-                is_correct = (user_clean != "😊" and user_clean != "" and
-                            user_clean == correct_symbol)
-                
-                task17_results[key] = {'is_correct': is_correct}
-                if is_correct:
-                    task17_correct_count += 1
-            
-            # 1 балл за все правильные
-            task17_score = 1 if task17_correct_count == len(expected_symbols) else 0
-            results['17'] = {'is_correct': task17_score == 1}
-            results.update(task17_results)
-            
-            total_score += task17_score
-            max_score += 1
-
-        # === ЗАДАНИЕ 18: Пунктуация ===
-        if 'task18_correct' in session:
-            expected_symbols = session['task18_correct']
-            
-            task18_correct_count = 0
-            task18_results = {}
-            
-            for i in range(1, len(expected_symbols) + 1):
-                key = f"18-{i}"
-                user_answer = user_answers_dict.get(key, "😊")
-                user_clean = str(user_answer).strip()
-                
-                # Нормализация
-                if user_clean == ',':
-                    user_clean = '!'
-                elif user_clean in ['х', 'x', '?']:
-                    user_clean = '?'
-                
-                correct_symbol = expected_symbols[i-1] if i <= len(expected_symbols) else '?'
-                is_correct = (user_clean != "😊" and user_clean != "" and
-                            user_clean == correct_symbol)
-                
-                task18_results[key] = {'is_correct': is_correct}
-                if is_correct:
-                    task18_correct_count += 1
-            
-            # 1 балл за все правильные
-            task18_score = 1 if task18_correct_count == len(expected_symbols) else 0
-            results['18'] = {'is_correct': task18_score == 1}
-            results.update(task18_results)
-            
-            total_score += task18_score
-            max_score += 1
-
-        # === ЗАДАНИЕ 19: Пунктуация ===
-        if 'task19_correct' in session:
-            expected_symbols = session['task19_correct']
-            
-            task19_correct_count = 0
-            task19_results = {}
-            
-            for i in range(1, len(expected_symbols) + 1):
-                key = f"19-{i}"
-                user_answer = user_answers_dict.get(key, "😊")
-                user_clean = str(user_answer).strip()
-                
-                # Нормализация
-                if user_clean == ',':
-                    user_clean = '!'
-                elif user_clean in ['х', 'x', '?']:
-                    user_clean = '?'
-                
-                correct_symbol = expected_symbols[i-1] if i <= len(expected_symbols) else '?'
-                is_correct = (user_clean != "😊" and user_clean != "" and
-                            user_clean == correct_symbol)
-                
-                task19_results[key] = {'is_correct': is_correct}
-                if is_correct:
-                    task19_correct_count += 1
-            
-            # 1 балл за все правильные
-            task19_score = 1 if task19_correct_count == len(expected_symbols) else 0
-            results['19'] = {'is_correct': task19_score == 1}
-            results.update(task19_results)
-            
-            total_score += task19_score
-            max_score += 1
-
-        # === ЗАДАНИЕ 20: Пунктуация ===
-        if 'task20_correct' in session:
-            expected_symbols = session['task20_correct']
-            
-            task20_correct_count = 0
-            task20_results = {}
-            
-            for i in range(1, len(expected_symbols) + 1):
-                key = f"20-{i}"
-                user_answer = user_answers_dict.get(key, "😊")
-                user_clean = str(user_answer).strip()
-                
-                # Нормализация
-                if user_clean == ',':
-                    user_clean = '!'
-                elif user_clean in ['х', 'x', '?']:
-                    user_clean = '?'
-                
-                correct_symbol = expected_symbols[i-1] if i <= len(expected_symbols) else '?'
-                is_correct = (user_clean != "😊" and user_clean != "" and
-                            user_clean == correct_symbol)
-                
-                task20_results[key] = {'is_correct': is_correct}
-                if is_correct:
-                    task20_correct_count += 1
-            
-            # 1 балл за все правильные
-            task20_score = 1 if task20_correct_count == len(expected_symbols) else 0
-            results['20'] = {'is_correct': task20_score == 1}
-            results.update(task20_results)
-            
-            total_score += task20_score
-            max_score += 1
-
-        # === ЗАДАНИЕ 21: Пунктуация (динамическое) ===
-        if 'task21_correct' in session:
-            expected_symbols = session['task21_correct']
-            
-            task21_correct_count = 0
-            task21_results = {}
-            
-            for i in range(1, len(expected_symbols) + 1):
-                key = f"21-{i}"
-                user_answer = user_answers_dict.get(key, "😊")
-                user_clean = str(user_answer).strip()
-                
-                # Нормализация (задание 21 использует те же символы)
-                if user_clean == ',':
-                    user_clean = '!'
-                elif user_clean in ['х', 'x', '?']:
-                    user_clean = '?'
-                
-                correct_symbol = expected_symbols[i-1] if i <= len(expected_symbols) else '?'
-                is_correct = (user_clean != "😊" and user_clean != "" and
-                            user_clean == correct_symbol)
-                
-                task21_results[key] = {'is_correct': is_correct}
-                if is_correct:
-                    task21_correct_count += 1
-            
-            # 1 балл за все правильные
-            task21_score = 1 if task21_correct_count == len(expected_symbols) else 0
-            results['21'] = {'is_correct': task21_score == 1}
-            results.update(task21_results)
-            
-            total_score += task21_score
-            max_score += 1
-
-        # === ЗАДАНИЕ 22: Средства выразительности ===
-        task22_correct = session.get('task22_correct', {})
-
-        if task22_correct:
-            task22_score = 0
-            task22_details = {}
-            task22_correct_count = 0
-            
-            letters = ['А', 'Б', 'В', 'Г', 'Д']
-            for letter in letters:
-                key = f"22-{letter}"
-                user_answer = user_answers_dict.get(key, '-')
-                correct_answer = task22_correct.get(letter, '')
-                
-                is_correct = (user_answer != '-' and 
-                            user_answer == correct_answer)
-                
-                task22_details[key] = {
-                    'is_correct': is_correct,
-                    'user_answer': user_answer,
-                    'correct_answer': correct_answer
-                }
-                
-                if is_correct:
-                    task22_correct_count += 1
-            
-            # Все 5 правильных = 2 балла, 3 или 4 правильных = 1 балл, 0-2 правильных = 0 баллов
-            
-            if task22_correct_count == 5:
-                final_score = 2
-            elif task22_correct_count >= 3:
-                final_score = 1
-            else:
-                final_score = 0
-            
-            results['22'] = {
-                'is_correct': final_score > 0,  # True если есть хоть 1 балл
-                'score': final_score,
-                'correct_count': task22_correct_count,
-                'max_score': 2,
-                'details': task22_details
-            }
-            
-            # Добавляем детальные результаты для подсветки
-            results.update({k: {'is_correct': v['is_correct']} 
-                        for k, v in task22_details.items()})
-            
-            total_score += final_score
-            max_score += 2  # Максимум 2 балла для задания 22
-
-        # === Задания 23–26 ===
-        answers_23_26 = session.get('answers_23_26', {})
-
-        for q_num_str, correct in answers_23_26.items():
-            q_num = int(q_num_str)
-            
-            # Получаем ответ пользователя (может быть строкой или списком)
-            user_ans_raw = user_answers_dict.get(q_num_str, '')
-            
-            # Обрабатываем по-разному в зависимости от типа
-            if isinstance(user_ans_raw, list):
-                # Для чекбоксов — объединяем в строку
-                user_ans = ''.join(str(x) for x in user_ans_raw)
-            else:
-                # Для текстовых полей — строка
-                user_ans = str(user_ans_raw).strip()
-            
-            if not user_ans:
-                continue
-            
-            is_correct = False
-            
-            if q_num in (23, 24):
-                # Чекбоксы: сравниваем отсортированные цифры
-                user_sorted = ''.join(sorted(user_ans))
-                correct_sorted = ''.join(sorted(correct))
-                is_correct = user_sorted == correct_sorted
-            
-            elif q_num == 25:
-                # Фразеологизм: варианты через | (в тренажере используется |)
-                # Но в БД у вас может быть /
-                correct_variants = []
-                
-                # Сначала пробуем /
-                if '/' in correct:
-                    correct_variants = [v.strip() for v in correct.split('/')]
-                # Потом пробуем |
-                elif '|' in correct:
-                    correct_variants = [v.strip() for v in correct.split('|')]
-                else:
-                    correct_variants = [correct.strip()]
-                
-                # Убираем пробелы для сравнения
-                user_norm = user_ans.lower().replace(' ', '')
-                variants_norm = [v.lower().replace(' ', '') for v in correct_variants]
-                
-                is_correct = user_norm in variants_norm
-            
-            elif q_num == 26:
-                # Номера предложений: варианты через | (в тренажере)
-                correct_variants = []
-                if '|' in correct:
-                    correct_variants = [v.strip() for v in correct.split('|')]
-                elif '/' in correct:
-                    correct_variants = [v.strip() for v in correct.split('/')]
-                else:
-                    correct_variants = [correct.strip()]
-                
-                # Сравниваем цифры
-                is_correct = user_ans in correct_variants
-            
-            results[q_num_str] = {'is_correct': is_correct}
-            total_score += int(is_correct)
-            max_score += 1
+        results, total_score, max_score, _ = EGE_SCORER.score(user_answers_dict, session)
 
         return JsonResponse({
             'results': results,
@@ -5143,11 +3723,15 @@ def check_starting_diagnostic(request):
         return JsonResponse({'error': f'Ошибка: {str(e)}'}, status=500)
 
 
-def get_text_analysis_questions(task_type='1_3'):
+def get_text_analysis_questions(task_type='1_3', pools=None):
     """
     Возвращает TextAnalysisTask и вопросы для указанного типа.
     task_type: '1_3' или '23_26'
+    pools: DiagnosticPools — если передан, берём тексты из заранее загруженного пула
     """
+    if pools is not None:
+        return pools.text_analysis(task_type)
+
     required_numbers = [1, 2, 3] if task_type == '1_3' else [23, 24, 25, 26]
     tasks = TextAnalysisTask.objects.filter(is_active=True)
     for task in tasks:
@@ -5270,10 +3854,10 @@ def generate_task9_lines():
             continue
 
         # Получаем примеры для этой группы
-        examples_qs = OrthogramExample.objects.filter(
-            orthogram_id__in=orth_ids,
-            is_active=True
-        ).order_by('?')[:30]  # Берем больше для выборки
+        examples_qs = [
+            entry.example
+            for entry in get_orthogram_catalog().sample(orth_ids, 30)
+        ]  # Берем больше для выборки
 
         # Собираем валидные примеры
         valid_examples = []
@@ -5338,7 +3922,7 @@ def generate_task9_lines():
         # Формируем строку
         parts = []
         for ex in examples:
-            masked = re.sub(r'\*\d+(?:_\d+)?\*', f'*9-{flat_index}*', ex.masked_word, count=1)
+            masked = parse_mask(ex.masked_word).fill_first(f'9-{flat_index}')
             parts.append(masked)
             flat_index += 1
 
@@ -5382,10 +3966,7 @@ def generate_task10_lines():
     for group in SUBGROUPS:
         examples = []
         for orth_id in group['orth_ids']:
-            qs = OrthogramExample.objects.filter(
-                orthogram_id=orth_id,
-                is_active=True
-            ).order_by('?')[:50]
+            qs = [entry.example for entry in get_orthogram_catalog().sample([orth_id], 50)]
             
             for ex in qs:
                 correct = extract_correct_letter(ex.text, ex.masked_word)
@@ -5490,7 +4071,7 @@ def generate_task10_lines():
             mask_id = f"10_{orth_id}-{mask_index}"
             
             # Заменяем маску
-            masked = re.sub(r'\*\d+(?:_\d+)?\*', f'*{mask_id}*', ex.masked_word, count=1)
+            masked = parse_mask(ex.masked_word).fill_first(mask_id)
             parts.append(masked)
             
             # Сохраняем для проверки
@@ -5561,10 +4142,10 @@ def generate_task11_lines():
     for subgroup in SUFFIX_SUBGROUPS:
         examples = []
         for orth_id in subgroup['orth_ids']:
-            qs = OrthogramExample.objects.filter(
-                orthogram_id=orth_id,
-                is_active=True
-            ).order_by('?')[:30]  # Берем больше для выборки
+            qs = [
+                entry.example
+                for entry in get_orthogram_catalog().sample([orth_id], 30)
+            ]  # Берем больше для выборки
             
             for ex in qs:
                 correct = extract_correct_letter(ex.text, ex.masked_word)
@@ -5689,7 +4270,7 @@ def generate_task11_lines():
             mask_id = f"11-{mask_index}"
             
             # Заменяем маску
-            masked = re.sub(r'\*\d+(?:_\d+)?\*', f'*{mask_id}*', ex.masked_word, count=1)
+            masked = parse_mask(ex.masked_word).fill_first(mask_id)
             parts.append(masked)
             
             expected_letters.append(letter)
@@ -5791,10 +4372,10 @@ def generate_task12_lines():
     # === 3. Загружаем примеры из БД ===
     all_examples = []
     for orth_id in ORTH_ALL_IDS:
-        qs = OrthogramExample.objects.filter(
-            orthogram_id=orth_id,
-            is_active=True
-        ).order_by('?')[:30]  # Берем больше для выборки
+        qs = [
+            entry.example
+            for entry in get_orthogram_catalog().sample([orth_id], 30)
+        ]  # Берем больше для выборки
         
         for ex in qs:
             correct = extract_correct_letter(ex.text, ex.masked_word)
@@ -5891,7 +4472,7 @@ def generate_task12_lines():
             ex = item['example']
             masked_word = ex.masked_word
             # Заменяем исходную маску на нашу
-            masked = re.sub(r'\*\d+(?:_\d+)?\*', f'*{mask_id}*', masked_word, count=1)
+            masked = parse_mask(masked_word).fill_first(mask_id)
             parts.append(masked)
             
             # Сохраняем ожидаемую букву
@@ -5957,10 +4538,10 @@ def generate_task13_lines():
     # Собираем все примеры
     all_examples = []
     for orth_id in TASK13_ORTHOGRAMS:
-        examples_qs = OrthogramExample.objects.filter(
-            orthogram_id=orth_id,
-            is_active=True
-        ).order_by('?')[:30]  # Берем больше для выборки
+        examples_qs = [
+            entry.example
+            for entry in get_orthogram_catalog().sample([orth_id], 30, with_letter=False)
+        ]  # Берем больше для выборки
         
         for ex in examples_qs:
             correct = extract_correct_letter(ex.text, ex.masked_word)
@@ -6107,10 +4688,10 @@ def generate_task14_lines():
     from random import sample
     
     # Берем 5 случайных активных примеров
-    examples = OrthogramExample.objects.filter(
-        orthogram_id=1400,
-        is_active=True
-    ).order_by('?')[:5]
+    examples = [
+        entry.example
+        for entry in get_orthogram_catalog().sample([1400], 5, with_letter=False)
+    ]
     
     if len(examples) < 5:
         # Можно вернуть меньше или использовать дубли
@@ -6140,12 +4721,11 @@ def generate_task14_lines():
         masked_word = ex.masked_word
         line_parts = []
         
-        while f'*1400*' in masked_word:
-            mask_id = f"14-{mask_index}"
-            
-            # Заменяем маску
-            masked_word = masked_word.replace(f'*1400*', f'*{mask_id}*', 1)
-            
+        template = parse_mask(masked_word)
+        mask_ids = [f"14-{mask_index + i}" for i in range(template.count(1400))]
+        masked_word = template.renumber(1400, mask_ids)
+        
+        for mask_id in mask_ids:
             # Сохраняем правильный ответ
             if parts:
                 expected_letters.append(parts.pop(0))
@@ -6173,10 +4753,8 @@ def generate_task15_lines():
     Берет 1 пример из орфограммы 1500.
     """
     # Берем 1 случайный активный пример
-    example = OrthogramExample.objects.filter(
-        orthogram_id=1500,
-        is_active=True
-    ).order_by('?').first()
+    entries = get_orthogram_catalog().sample([1500], 1, with_letter=False)
+    example = entries[0].example if entries else None
     
     if not example:
         return {'lines': [], 'expected_letters': [], 'letter_groups': {}, 'subgroup_letters_map': {}}
@@ -6202,18 +4780,17 @@ def generate_task15_lines():
                     expected_letters.append(part)
         else:
             # Крайний fallback
-            expected_letters = ['н', 'нн', 'н', 'нн'][:example.masked_word.count('*1500*')]
+            expected_letters = ['н', 'нн', 'н', 'нн'][:parse_mask(example.masked_word).count(1500)]
     
     # Заменяем маски в предложении
     masked_word = example.masked_word
     lines = []
     
-    while f'*1500*' in masked_word:
-        mask_id = f"15-{mask_index}"
-        
-        # Заменяем маску
-        masked_word = masked_word.replace(f'*1500*', f'*{mask_id}*', 1)
-        
+    template = parse_mask(masked_word)
+    mask_ids = [f"15-{mask_index + i}" for i in range(template.count(1500))]
+    masked_word = template.renumber(1500, mask_ids)
+    
+    for mask_id in mask_ids:
         letter_groups[mask_id] = 'nn'
         mask_index += 1
     
@@ -6229,17 +4806,20 @@ def generate_task15_lines():
     }
 
 # ======= Задание 18 функция деления на абзацы =======================
-def generate_task18_with_paragraphs():
+def generate_task18_with_paragraphs(pools=None):
     """
     Задание 18 с абзацами (как в тренажерах)
     """
     punktum_id = '1800'
     
     # Берем 1 пример для задания 18
-    example = PunktumExample.objects.filter(
-        punktum__id=punktum_id,
-        is_active=True
-    ).order_by('?').first()
+    if pools is not None:
+        example = pools.punktum_first(punktum_id)
+    else:
+        example = random_first(PunktumExample.objects.filter(
+            punktum__id=punktum_id,
+            is_active=True
+        ))
     
     if not example:
         return None
@@ -6249,7 +4829,7 @@ def generate_task18_with_paragraphs():
     
     if not paragraphs:
         # Fallback: если нет абзацев, используем обычный формат
-        return generate_task_with_image(punktum_id, 1, False)
+        return generate_task_with_image(punktum_id, 1, False, pools=pools)
     
     # Заменяем маски в каждом абзаце
     mask_index = 1
@@ -6265,14 +4845,11 @@ def generate_task18_with_paragraphs():
     
     # Обрабатываем каждый абзац
     for para in paragraphs:
-        # Считаем маски в этом абзаце
-        mask_count_in_para = para.count(f'*{punktum_id}*')
-        
-        # Заменяем маски
-        for _ in range(mask_count_in_para):
-            mask_id = f"18-{mask_index}"
-            para = para.replace(f'*{punktum_id}*', f'*{mask_id}*', 1)
-            mask_index += 1
+        # Считаем и заменяем маски в этом абзаце
+        template = parse_mask(para)
+        mask_count_in_para = template.count(punktum_id)
+        para = template.renumber(punktum_id, (f"18-{mask_index + i}" for i in range(mask_count_in_para)))
+        mask_index += mask_count_in_para
         
         processed_paragraphs.append(para)
     
@@ -6304,7 +4881,7 @@ def generate_task18_with_paragraphs():
     }
 
 # ======= Задание 21 - динамическое формирование =====================
-def generate_task21_for_diagnostic():
+def generate_task21_for_diagnostic(pools=None):
     """
     Генерация задания 21 для диагностики
     """
@@ -6317,11 +4894,14 @@ def generate_task21_for_diagnostic():
     # Используем существующую функцию для тренажеров
     # Или копируем ее логику
     
-    # Берем пример из БД
-    example = PunktumExample.objects.filter(
-        punktum__id=chosen_variant,
-        is_active=True
-    ).order_by('?').first()
+    # Берем пример из пула или из БД
+    if pools is not None:
+        example = pools.punktum_first(chosen_variant)
+    else:
+        example = random_first(PunktumExample.objects.filter(
+            punktum__id=chosen_variant,
+            is_active=True
+        ))
     
     if not example:
         return None
@@ -6342,15 +4922,18 @@ def generate_task21_for_diagnostic():
     processed_paragraphs = []
     
     for para in paragraphs:
-        while f'*{chosen_variant}*' in para:
-            mask_id = f"21-{mask_index}"
-            para = para.replace(f'*{chosen_variant}*', f'*{mask_id}*', 1)
-            mask_index += 1
+        template = parse_mask(para)
+        mask_count = template.count(chosen_variant)
+        para = template.renumber(chosen_variant, (f"21-{mask_index + i}" for i in range(mask_count)))
+        mask_index += mask_count
         processed_paragraphs.append(para)
     
     # Получаем доступные номера пунктограмм
     try:
-        punktum = Punktum.objects.get(id=chosen_variant)
+        if pools is not None and chosen_variant in pools.punktums:
+            punktum = pools.punktums[chosen_variant]
+        else:
+            punktum = Punktum.objects.get(id=chosen_variant)
         allowed_letters = [letter.strip() for letter in punktum.letters.split(',')]
     except:
         # Fallback
@@ -6587,7 +5170,7 @@ def get_oge_text_analysis_questions(task_type):
     if not required_numbers:
         return None, []
 
-    tasks = OgeTextAnalysisTask.objects.filter(is_active=True).order_by('?')
+    tasks = iter_random(OgeTextAnalysisTask.objects.filter(is_active=True))
     for task in tasks:
         qs = task.questions.filter(question_number__in=required_numbers)
         if qs.count() == len(required_numbers):
@@ -6646,7 +5229,7 @@ def generate_oge_task4_with_image(punktum_id, num_sentences=1, add_numbering=Fal
     if is_for_quiz is not None:
         query_kwargs['is_for_quiz'] = is_for_quiz
 
-    examples = OgePunktumExample.objects.filter(**query_kwargs).order_by('?')[:num_sentences]
+    examples = random_sample(OgePunktumExample.objects.filter(**query_kwargs), num_sentences)
 
     if not examples:
         return None
@@ -6689,10 +5272,11 @@ def generate_oge_task4_with_image(punktum_id, num_sentences=1, add_numbering=Fal
             elif ex.choices_per_mask:
                 correct_list = [v.strip() for v in ex.choices_per_mask.split('|') if v.strip()]
 
-        mask_count = masked.count(f'*{punktum_id}*')
+        template = parse_mask(masked)
+        mask_count = template.count(punktum_id)
+        masked = template.renumber(punktum_id, (f"{task_number}-{mask_idx + i}" for i in range(mask_count)))
         for pos in range(mask_count):
             mask_id = f"{task_number}-{mask_idx}"
-            masked = masked.replace(f'*{punktum_id}*', f'*{mask_id}*', 1)
             subgroup_key = f'punktum_5_{mask_idx}'
             letter_groups[mask_id] = subgroup_key
             if per_mask_data and pos < len(per_mask_data):
@@ -6766,13 +5350,38 @@ def generate_oge_diagnostic(request):
         return JsonResponse({'error': 'Только POST'}, status=405)
 
     try:
-        session_data = {}
-        context = {}
+        # === Готовый вариант из пула (см. refill_diagnostic_pool) ===
+        timer = DiagnosticTimer()
+        with timer.step('pool'):
+            variant = pop_diagnostic_variant('oge')
 
-        user_grade = None
-        if request.user.is_authenticated and hasattr(request.user, 'profile'):
-            user_grade = request.user.profile.grade
+        if variant:
+            html, session_data = variant.html, variant.answers
+        else:
+            html, session_data, timer = build_oge_diagnostic()
+
+        save_answer_key(request, 'oge_diagnostic', session_data)
+
+        timer.log('Сборка ОГЭ-диагностики')
+        response = JsonResponse({'html': html})
+        response['Server-Timing'] = timer.server_timing_header()
+        return response
+
+    except Exception as e:
+        logger.error(f"Ошибка генерации ОГЭ-диагностики: {e}", exc_info=True)
+        return JsonResponse({'error': f'Ошибка: {str(e)}'}, status=500)
 
+
+def build_oge_diagnostic():
+    """
+    Собирает вариант ОГЭ-диагностики.
+    Возвращает (html, ключ ответов для сессии, DiagnosticTimer).
+    """
+    session_data = {}
+    context = {}
+    timer = DiagnosticTimer()
+
+    with timer.step('tasks'):
         # === Задания 2, 3: Чекбоксы (из OgeTextAnalysisTask) ===
         text_task_1_2, text_questions_1_2 = get_oge_text_analysis_questions('1_2')
         if text_task_1_2:
@@ -6813,7 +5422,7 @@ def generate_oge_diagnostic(request):
         # === Задание 7: Смайлики букв (из OgeOrthogramExample) ===
         try:
             oge_orth_examples = list(
-                OgeOrthogramExample.objects.filter(is_active=True).order_by('?')[:3]
+                random_sample(OgeOrthogramExample.objects.filter(is_active=True), 3)
             )
             if oge_orth_examples:
                 task6_lines = []
@@ -6826,13 +5435,12 @@ def generate_oge_diagnostic(request):
                     orth_id = str(ex.orthogram_id)
                     # correct_letters: "а|а/о,а|а/о,ь|ь/ъ,..." — correct|choices per position
                     correct_letters_raw = (ex.correct_letters or '').split(',')
-                    # Count how many *orth_id* masks are in this example
-                    import re
-                    mask_pattern = f'*{orth_id}*'
-                    num_masks = masked.count(mask_pattern)
+                    # Маски *orth_id* по порядку получают ID 6-1, 6-2, ...
+                    template = parse_mask(masked)
+                    num_masks = template.count(orth_id)
+                    masked = template.renumber(orth_id, (f"6-{mask_idx + i}" for i in range(num_masks)))
                     for pos in range(num_masks):
                         mask_id = f"6-{mask_idx}"
-                        masked = masked.replace(mask_pattern, f'*{mask_id}*', 1)
                         # Parse per-position data
                         if pos < len(correct_letters_raw):
                             raw = correct_letters_raw[pos].strip()
@@ -6860,7 +5468,7 @@ def generate_oge_diagnostic(request):
 
         # === Задание 8: Инпут — раскройте скобки (из OgeCorrectionExercise) ===
         try:
-            task7_item = OgeCorrectionExercise.objects.filter(is_active=True).order_by('?').first()
+            task7_item = random_first(OgeCorrectionExercise.objects.filter(is_active=True))
             if task7_item:
                 context['task7_word'] = task7_item.incorrect_text       # «вишня»
                 context['task7_sentence'] = task7_item.explanation      # Для украшения десерта... (вишня).
@@ -6870,7 +5478,7 @@ def generate_oge_diagnostic(request):
 
         # === Задание 9: Инпут — словосочетание (из OgeWordOk) ===
         try:
-            wordok = OgeWordOk.objects.filter(is_active=True).order_by('?').first()
+            wordok = random_first(OgeWordOk.objects.filter(is_active=True))
             if wordok and wordok.correct_variants.strip():
                 context['wordok_8'] = wordok
                 session_data['answer_8'] = wordok.correct_variants
@@ -6895,16 +5503,14 @@ def generate_oge_diagnostic(request):
                 str(q.question_number): q.correct_answer for q in text_questions_11
             }
 
-        # === Сохраняем в сессию ===
-        request.session['oge_diagnostic'] = session_data
+    # === Эталоны для проверки (main/scoring.py) ===
+    session_data['scoring'] = OGE_SCORER.prepare(session_data)
 
-        # === Рендерим шаблон ===
+    # === Рендерим шаблон ===
+    with timer.step('render'):
         html = render_to_string('diagnostic_oge_snippet.html', context)
-        return JsonResponse({'html': html})
 
-    except Exception as e:
-        logger.error(f"Ошибка генерации ОГЭ-диагностики: {e}", exc_info=True)
-        return JsonResponse({'error': f'Ошибка: {str(e)}'}, status=500)
+    return html, session_data, timer
 
 
 def generate_oge_task5_mixed_dash_colon(is_for_quiz=None):
@@ -6929,16 +5535,16 @@ def generate_oge_task5_mixed_dash_colon(is_for_quiz=None):
         query_kwargs['is_for_quiz'] = is_for_quiz
 
     dash_examples = list(
-        OgePunktumExample.objects.filter(
+        random_sample(OgePunktumExample.objects.filter(
             punktum__id__in=dash_ids,
             **query_kwargs
-        ).order_by('?')[:num_dash]
+        ), num_dash)
     )
     colon_examples = list(
-        OgePunktumExample.objects.filter(
+        random_sample(OgePunktumExample.objects.filter(
             punktum__id__in=colon_ids,
             **query_kwargs
-        ).order_by('?')[:num_colon]
+        ), num_colon)
     )
 
     all_examples = dash_examples + colon_examples
@@ -6963,10 +5569,11 @@ def generate_oge_task5_mixed_dash_colon(is_for_quiz=None):
         else:
             correct_symbol = ':'
 
-        mask_count = masked.count(f'*{punktum_id}*')
+        template = parse_mask(masked)
+        mask_count = template.count(punktum_id)
+        masked = template.renumber(punktum_id, (f"{task_number}-{mask_idx + i}" for i in range(mask_count)))
         for _ in range(mask_count):
             mask_id = f"{task_number}-{mask_idx}"
-            masked = masked.replace(f'*{punktum_id}*', f'*{mask_id}*', 1)
             letter_groups[mask_id] = 'punktum_5_mixed'
             all_correct_symbols.append(correct_symbol)
             mask_idx += 1
@@ -6998,7 +5605,7 @@ def generate_oge_single_task(request):
         data = json.loads(request.body)
         task_number = str(data.get('task_number', ''))
 
-        session_data = request.session.get('oge_diagnostic', {})
+        session_data = load_answer_key(request, 'oge_diagnostic', {})
         context = {}
         template_name = f'diagnostic_oge_task{task_number}_snippet.html'
 
@@ -7114,7 +5721,7 @@ def generate_oge_single_task(request):
         
         elif task_number == '7':
             oge_orth_examples = list(
-                OgeOrthogramExample.objects.filter(is_active=True).order_by('?')[:3]
+                random_sample(OgeOrthogramExample.objects.filter(is_active=True), 3)
             )
             if oge_orth_examples:
                 task6_lines = []
@@ -7126,12 +5733,11 @@ def generate_oge_single_task(request):
                     masked = ex.masked_word
                     orth_id = str(ex.orthogram_id)
                     correct_letters_raw = (ex.correct_letters or '').split(',')
-                    import re
-                    mask_pattern = f'*{orth_id}*'
-                    num_masks = masked.count(mask_pattern)
+                    template = parse_mask(masked)
+                    num_masks = template.count(orth_id)
+                    masked = template.renumber(orth_id, (f"6-{mask_idx + i}" for i in range(num_masks)))
                     for pos in range(num_masks):
                         mask_id = f"6-{mask_idx}"
-                        masked = masked.replace(mask_pattern, f'*{mask_id}*', 1)
                         if pos < len(correct_letters_raw):
                             raw = correct_letters_raw[pos].strip()
                             if '|' in raw:
@@ -7155,14 +5761,14 @@ def generate_oge_single_task(request):
                 context['task6_subgroup_letters'] = json.dumps(task6_subgroup_letters)
         
         elif task_number == '8':
-            task7_item = OgeCorrectionExercise.objects.filter(is_active=True).order_by('?').first()
+            task7_item = random_first(OgeCorrectionExercise.objects.filter(is_active=True))
             if task7_item:
                 context['task7_word'] = task7_item.incorrect_text
                 context['task7_sentence'] = task7_item.explanation
                 session_data['answer_7'] = task7_item.correct_text.lower().strip()
                 
         elif task_number == '9':
-            wordok = OgeWordOk.objects.filter(is_active=True).order_by('?').first()
+            wordok = random_first(OgeWordOk.objects.filter(is_active=True))
             if wordok and wordok.correct_variants.strip():
                 context['wordok_8'] = wordok
                 session_data['answer_8'] = wordok.correct_variants
@@ -7187,7 +5793,9 @@ def generate_oge_single_task(request):
         else:
             return JsonResponse({'error': 'Неизвестное задание'}, status=400)
 
-        request.session['oge_diagnostic'] = session_data
+        # Эталоны пересчитываются: в ключе могли остаться эталоны прошлой диагностики
+        session_data['scoring'] = OGE_SCORER.prepare(session_data)
+        save_answer_key(request, 'oge_diagnostic', session_data)
         html = render_to_string(template_name, context)
         return JsonResponse({'html': html})
 
@@ -7204,203 +5812,17 @@ def check_oge_diagnostic(request):
     try:
         data = json.loads(request.body)
         user_answers_dict = data.get('answers', {})
-        session = request.session.get('oge_diagnostic')
+        session = load_answer_key(request, 'oge_diagnostic')
 
         if not session:
             return JsonResponse({'error': 'Сессия устарела'}, status=400)
 
-        results = {}
-        total_score = 0
-        max_score = 0
-        analytics_parts = []
-
-        def process_checkbox_task(answers_dict, task_q_nums):
-            nonlocal total_score, max_score
-            for q_num_str, correct in answers_dict.items():
-                if int(q_num_str) not in task_q_nums: continue
-                user_ans_raw = user_answers_dict.get(q_num_str, '')
-                if isinstance(user_ans_raw, list):
-                    user_ans = ''.join(str(x) for x in user_ans_raw)
-                else:
-                    user_ans = str(user_ans_raw).strip()
-
-                q_num = int(q_num_str)
-                is_correct = False
-                correct_str = correct
-                
-                if q_num == 1:
-                    correct_variants = [v.strip() for v in correct.split('/')]
-                    is_correct = user_ans.lower() in [v.lower() for v in correct_variants]
-                    correct_str = correct_variants[0]
-                else:
-                    user_sorted = ''.join(sorted(user_ans))
-                    correct_sorted = ''.join(sorted(correct))
-                    is_correct = user_sorted == correct_sorted
-
-                score = 1 if is_correct else 0
-                max_s = 1
-                
-                # Задание 6 - Орфограммы
-                extras = ''
-                if q_num == 6:
-                    from main.models import OgeQuestionOption
-                    options = OgeQuestionOption.objects.filter(question__question_number=6).order_by('option_number')
-                    orth_parts = []
-                    for opt in options:
-                        if opt.orthogram_numbers:
-                            orth_parts.append(f"{opt.option_number} - {opt.orthogram_numbers}")
-                    if orth_parts:
-                        extras = "ОРФОГРАММЫ:<br>" + "<br>".join(orth_parts)
-
-                results[q_num_str] = {
-                    'is_correct': is_correct,
-                    'score': score,
-                    'max_score': max_s,
-                    'correct_answer': correct_str,
-                    'extras': extras
-                }
-                total_score += score
-                max_score += max_s
-                analytics_parts.append((q_num, is_correct))
-
-        # === Задания 2–3, 6, 10–11 ===
-        process_checkbox_task(session.get('answers_1_2', {}), [2, 3])
-        process_checkbox_task(session.get('answers_5', {}), [6])
-        process_checkbox_task(session.get('answers_9_10', {}), [10, 11])
-
-        # === Задание 4: Выпадающие списки ===
-        task3_correct = session.get('task3_correct', {})
-        if task3_correct:
-            task3_correct_count = 0
-            task3_details = {}
-            letters = ['А', 'Б', 'В']
-            correct_pairs = []
-            for letter in letters:
-                key = f"4-{letter}"
-                user_answer = user_answers_dict.get(key, '-')
-                correct_answer = task3_correct.get(letter, '')
-                if correct_answer:
-                    correct_pairs.append(f"{letter} - {correct_answer}")
-                is_correct = (str(user_answer).strip() != '-' and str(user_answer).strip() == str(correct_answer).strip())
-                task3_details[key] = {'is_correct': is_correct}
-                if is_correct:
-                    task3_correct_count += 1
-
-            final_score = 1 if task3_correct_count == 3 else 0
-
-            results['4'] = {
-                'is_correct': final_score > 0,
-                'score': final_score,
-                'max_score': 1,
-                'correct_answer': ""
-            }
-            results.update({k: {'is_correct': v['is_correct']} for k, v in task3_details.items()})
-            total_score += final_score
-            max_score += 1
-            analytics_parts.append((4, final_score > 0))
-
-        # === Задание 5: Пунктуация (смайлики) ===
-        if 'task4_correct' in session:
-            expected_symbols = session['task4_correct']
-            task4_correct_count = 0
-            task4_results = {}
-            for i in range(1, len(expected_symbols) + 1):
-                key = f"5-{i}"
-                user_answer = user_answers_dict.get(key, '😊')
-                user_clean = str(user_answer).strip()
-                correct_symbol = expected_symbols[i-1] if i <= len(expected_symbols) else '?'
-                is_correct = (user_clean != '😊' and user_clean != '' and user_clean == correct_symbol)
-                task4_results[key] = {'is_correct': is_correct}
-                if is_correct: task4_correct_count += 1
-
-            task4_score = 1 if task4_correct_count == len(expected_symbols) else 0
-            results['5'] = {
-                'is_correct': task4_score == 1,
-                'score': task4_score, 'max_score': 1,
-                'correct_answer': ""
-            }
-            results.update(task4_results)
-            total_score += task4_score
-            max_score += 1
-            analytics_parts.append((5, task4_score == 1))
-
-        # === Задание 7: Смайлики букв ===
-        if 'task6_correct' in session:
-            expected_letters = session['task6_correct']
-            total_masks = len(expected_letters)
-            task6_correct_count = 0
-            task6_results = {}
-            for i in range(1, total_masks + 1):
-                key = f"6-{i}"
-                user_answer = user_answers_dict.get(key, '😊')
-                user_clean = str(user_answer).strip().lower()
-                correct_letter = expected_letters[i - 1].lower() if i <= len(expected_letters) else ''
-                is_correct = (user_clean != '😊' and user_clean != '' and user_clean == correct_letter)
-                task6_results[key] = {'is_correct': is_correct}
-                if is_correct: task6_correct_count += 1
-
-            task6_score = 1 if task6_correct_count == total_masks else 0
-            results['7'] = {
-                'is_correct': task6_score == 1,
-                'score': task6_score, 'max_score': 1,
-                'correct_answer': ""
-            }
-            results.update(task6_results)
-            total_score += task6_score
-            max_score += 1
-            analytics_parts.append((7, task6_score == 1))
-
-        # === Задание 8: Инпут ===
-        if 'answer_7' in session:
-            correct = session['answer_7'].strip().lower()
-            user_ans = user_answers_dict.get('8', '').strip().lower()
-            user_words_list = user_ans.split()
-            user_word = user_words_list[-1] if user_words_list else ''
-            is_correct = _normalize_text(user_word) == _normalize_text(correct)
-            score = 1 if is_correct else 0
-            results['8'] = {
-                'is_correct': is_correct, 'score': score, 'max_score': 1,
-                'correct_answer': correct
-            }
-            total_score += score
-            max_score += 1
-            analytics_parts.append((8, is_correct))
-
-        # === Задание 9: Инпут (лексика) ===
-        if 'answer_8' in session:
-            correct = session['answer_8']
-            user_ans = user_answers_dict.get('9', '').strip()
-            variants = [v.strip() for v in correct.split(',') if v.strip()]
-            is_correct = _normalize_text(user_ans) in [_normalize_text(v) for v in variants]
-            score = 1 if is_correct else 0
-            results['9'] = {
-                'is_correct': is_correct, 'score': score, 'max_score': 1,
-                'correct_answer': variants[0] if variants else correct
-            }
-            total_score += score
-            max_score += 1
-            analytics_parts.append((9, is_correct))
-
-        # === Задание 12: Инпут по тексту ===
-        answers_11 = session.get('answers_11', {})
-        for q_num_str, correct in answers_11.items():
-            user_ans = str(user_answers_dict.get(q_num_str, '')).strip()
-            correct_variants = [v.strip() for v in correct.split('/')]
-            is_correct = user_ans.lower() in [v.lower() for v in correct_variants]
-            score = 1 if is_correct else 0
-            results[q_num_str] = {
-                'is_correct': is_correct, 'score': score, 'max_score': 1,
-                'correct_answer': correct_variants[0] if correct_variants else correct
-            }
-            total_score += score
-            max_score += 1
-            analytics_parts.append((int(q_num_str), is_correct))
+        results, total_score, max_score, summary = OGE_SCORER.score(user_answers_dict, session)
 
         # Формируем строку аналитики: 1+ 2- 3+ 4- ...
-        analytics_parts.sort(key=lambda x: x[0])
         analytics_str = ' '.join(
             f"{num}+" if correct else f"{num}-"
-            for num, correct in analytics_parts
+            for num, correct in sorted(summary)
         )
 
         return JsonResponse({
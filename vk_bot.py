@@ -1,20 +1,26 @@
 # vk_bot.py
-import os, json, random, requests
+import os, json, random
 from dotenv import load_dotenv
 import vk_api
 from vk_api.bot_longpoll import VkBotLongPoll, VkBotEventType
 from vk_api.utils import get_random_id
+from vk_dispatch import KeyedDispatcher, make_http_session
+from bot_state import make_state_store
 
 load_dotenv()
 VK_TOKEN = os.getenv('VK_GROUP_TOKEN')
 VK_GROUP_ID = int(os.getenv('VK_GROUP_ID', 0))
 API_URL = os.getenv('DJANGO_API_URL', 'http://127.0.0.1:8000').rstrip('/')
+VK_BOT_WORKERS = int(os.getenv('VK_BOT_WORKERS', 16))
 
 vk_session = vk_api.VkApi(token=VK_TOKEN)
 vk = vk_session.get_api()
 longpoll = VkBotLongPoll(vk_session, VK_GROUP_ID)
+http = make_http_session(VK_BOT_WORKERS)  # keep-alive соединения к Django
 
-user_data = {}  # {vk_id: {'user_id': 123, 'username': 'name'}}
+# Состояние в общем хранилище с TTL (см. bot_state.py)
+users = make_state_store('vk_user', ttl=30 * 24 * 60 * 60)  # {vk_id: {'user_id': 123, 'username': 'name'}}
+questions = make_state_store('vk_question', ttl=60 * 60)    # {vk_id: {'id': ..., 'correct': ..., 'exp': ...}}
 
 
 def send(user_id, text, keyboard=None):
@@ -28,7 +34,7 @@ def send(user_id, text, keyboard=None):
 
 def api_post(endpoint, data):
     try:
-        r = requests.post(f"{API_URL}{endpoint}", json=data, timeout=5)
+        r = http.post(f"{API_URL}{endpoint}", json=data, timeout=5)
         return r.json() if r.status_code == 200 else None
     except: return None
 
@@ -62,7 +68,7 @@ def handle(event):
             data = json.loads(payload)
             a = data['action']
             if a in ['quiz_answer', 'orthoepy_answer']:
-                quiz = user_data.get(vk_id, {}).get('last')
+                quiz = questions.get(vk_id)
                 if not quiz or quiz['id'] != data['word_id']:
                     return send(vk_id, "⚠️ Вопрос устарел")
                 
@@ -94,7 +100,7 @@ def handle(event):
     if t in ['/start', 'start', 'привет']:
         user = api_post('/api/vk/get-user/', {'vk_id': vk_id})
         if user and user.get('found'):
-            user_data[vk_id] = {'user_id': user['user_id'], 'username': user['username']}
+            users.set(vk_id, {'user_id': user['user_id'], 'username': user['username']})
             send(vk_id, f"👋 Привет, {user['username']}!\n\nКоманды: квиз, ударение, статистика")
         else:
             send(vk_id, "🔗 Привяжи аккаунт:\n1. Сайт → Профиль → Получить код\n2. Отправь код сюда")
@@ -108,7 +114,7 @@ def handle(event):
     elif len(text) == 8 and text.isalnum():
         res = api_post('/api/vk/verify-code/', {'code': text.upper(), 'vk_id': vk_id})
         if res and res.get('success'):
-            user_data[vk_id] = {'user_id': res['user_id'], 'username': res['username']}
+            users.set(vk_id, {'user_id': res['user_id'], 'username': res['username']})
             send(vk_id, f"✅ Привязан! Привет, {res['username']}!")
         else:
             send(vk_id, "❌ Код не подошёл")
@@ -117,12 +123,13 @@ def handle(event):
 
 
 def handle_quiz(vk_id):
-    if vk_id not in user_data:
+    user = users.get(vk_id)
+    if not user:
         return send(vk_id, "❌ Сначала /start")
     
     try:
         vk.messages.setActivity(user_id=vk_id, type='typing')
-        r = requests.post(f"{API_URL}/api/daily-quiz/", json={'user_id': user_data[vk_id]['user_id']}, timeout=5)
+        r = http.post(f"{API_URL}/api/daily-quiz/", json={'user_id': user['user_id']}, timeout=5)
         quiz = r.json() if r.status_code == 200 else None
         
         if quiz and 'options' in quiz:
@@ -135,11 +142,11 @@ def handle_quiz(vk_id):
             else:
                 left, right, lc = incorrect, correct, False
             
-            user_data[vk_id]['last'] = {
+            questions.set(vk_id, {
                 'id': quiz.get('example_id'),
                 'correct': correct,
                 'exp': quiz.get('explanation', '')
-            }
+            })
             send(vk_id, f"❓ {quiz.get('question', 'Как пишется?')}", make_keyboard(quiz['example_id'], left, right, lc))
     except: send(vk_id, "⚠️ Ошибка")
 
@@ -147,7 +154,7 @@ def handle_quiz(vk_id):
 def handle_orthoepy(vk_id):
     try:
         vk.messages.setActivity(user_id=vk_id, type='typing')
-        r = requests.post(f"{API_URL}/api/get-orthoepy-pair/", json={}, timeout=5)
+        r = http.post(f"{API_URL}/api/get-orthoepy-pair/", json={}, timeout=5)
         pair = r.json() if r.status_code == 200 else None
         
         if pair and pair.get('variant1'):
@@ -157,28 +164,32 @@ def handle_orthoepy(vk_id):
             else:
                 left, right = v2, v1
             
-            user_data[vk_id]['last'] = {'id': pair['id'], 'correct': cor}
+            questions.set(vk_id, {'id': pair['id'], 'correct': cor})
             send(vk_id, "❓ Как правильно?", make_keyboard(pair['id'], left, right))
     except: send(vk_id, "⚠️ Ошибка")
 
 
 def handle_stats(vk_id):
-    if vk_id not in user_data:
+    user = users.get(vk_id)
+    if not user:
         return send(vk_id, "❌ Сначала /start")
     
     try:
         vk.messages.setActivity(user_id=vk_id, type='typing')
-        r = requests.post(f"{API_URL}/api/weekly-report/", json={'user_id': user_data[vk_id]['user_id']}, timeout=5)
+        r = http.post(f"{API_URL}/api/weekly-report/", json={'user_id': user['user_id']}, timeout=5)
         if r.status_code == 200:
             s = r.json()
             send(vk_id, f"📊 Статистика\n📚 Слов: {s.get('total_words',0)}\n🎯 Попыток: {s.get('total_attempts',0)}\n✅ Правильно: {s.get('correct_answers',0)}\n📈 {s.get('success_rate',0)}%")
     except: send(vk_id, "📊 Ошибка")
 
 
-# Запуск
+# Запуск: события разных пользователей — параллельно, одного — по порядку
 if __name__ == '__main__':
-    print("✅ Бот запущен")
-    for event in longpoll.listen():
-        if event.type == VkBotEventType.MESSAGE_NEW:
-            try: handle(event)
-            except: pass
\ No newline at end of file
+    print(f"✅ Бот запущен ({VK_BOT_WORKERS} потоков)")
+    dispatcher = KeyedDispatcher(handle, workers=VK_BOT_WORKERS)
+    try:
+        for event in longpoll.listen():
+            if event.type == VkBotEventType.MESSAGE_NEW:
+                dispatcher.submit(event.object.get('message', {}).get('from_id'), event)
+    finally:
+        dispatcher.shutdown()
\ No newline at end of file
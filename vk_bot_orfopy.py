@@ -1,24 +1,29 @@
 import os
 import random
 import json
-import requests
 from dotenv import load_dotenv
 import vk_api
 from vk_api.bot_longpoll import VkBotLongPoll, VkBotEventType
+from vk_dispatch import KeyedDispatcher, make_http_session
+from bot_state import make_state_store
 
 # Загружаем .env
 load_dotenv()
 VK_TOKEN = os.getenv('VK_GROUP_TOKEN')
 VK_GROUP_ID = int(os.getenv('VK_GROUP_ID'))
 DJANGO_API_URL = os.getenv('DJANGO_API_URL', 'http://127.0.0.1:8000')
+VK_BOT_WORKERS = int(os.getenv('VK_BOT_WORKERS', 16))
 
 # Инициализация VK
 vk_session = vk_api.VkApi(token=VK_TOKEN)
 vk = vk_session.get_api()
 longpoll = VkBotLongPoll(vk_session, VK_GROUP_ID)
 
-# Хранилище последних тестов для каждого пользователя
-user_last_word = {}
+# Общая сессия с keep-alive соединениями к Django
+http = make_http_session(VK_BOT_WORKERS)
+
+# Последний тест каждого пользователя — в общем хранилище с TTL (см. bot_state.py)
+user_last_word = make_state_store('vk_orthoepy_word', ttl=60 * 60)
 
 print(f"✅ VK Бот Орфоэпия запущен!")
 print(f"📚 Тренировка ударений (из базы данных)")
@@ -84,7 +89,7 @@ def get_orthoepy_pair():
     Возвращает: правильное и неправильное ударение для одного слова
     """
     try:
-        response = requests.post(
+        response = http.post(
             f"{DJANGO_API_URL}/api/get-orthoepy-pair/",
             json={},
             timeout=5
@@ -203,7 +208,7 @@ def send_word_to_user(user_id):
         
         if word_data:
             # Сохраняем данные для этого пользователя
-            user_last_word[user_id] = word_data
+            user_last_word.set(user_id, word_data)
             
             variant1 = word_data.get('variant1')
             variant2 = word_data.get('variant2')
@@ -246,13 +251,17 @@ def send_help(user_id):
     send_message(user_id, help_text)
 
 
-# Главный цикл
+# Главный цикл: события разных пользователей — параллельно, одного — по порядку
 if __name__ == '__main__':
-    print(f"🎧 Слушаю сообщения...")
+    print(f"🎧 Слушаю сообщения... ({VK_BOT_WORKERS} потоков)")
     
-    for event in longpoll.listen():
-        try:
-            if event.type == VkBotEventType.MESSAGE_NEW:
-                handle_message(event)
-        except Exception as e:
-            print(f"Ошибка в цикле: {e}")
\ No newline at end of file
+    dispatcher = KeyedDispatcher(handle_message, workers=VK_BOT_WORKERS)
+    try:
+        for event in longpoll.listen():
+            try:
+                if event.type == VkBotEventType.MESSAGE_NEW:
+                    dispatcher.submit(event.object.get('message', {}).get('from_id'), event)
+            except Exception as e:
+                print(f"Ошибка в цикле: {e}")
+    finally:
+        dispatcher.shutdown()
\ No newline at end of file
@@ -0,0 +1,70 @@
+# vk_dispatch.py
+"""
+Параллельная обработка событий long-poll для VK-ботов (vk_bot.py, vk_bot_orfopy.py).
+
+События разных пользователей обрабатываются пулом потоков одновременно,
+поэтому медленный ответ Django одному ученику не задерживает остальных.
+События одного пользователя выполняются строго по очереди: у каждого
+ключа своя очередь, и её разбирает не больше одного потока.
+
+HTTP-запросы к Django идут через общую requests.Session с пулом
+keep-alive соединений (make_http_session).
+"""
+import logging
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+
+def make_http_session(pool_size=16):
+    """Сессия с пулом keep-alive соединений на pool_size потоков."""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+class KeyedDispatcher:
+    """
+    Пул потоков с сохранением порядка по ключу (например, VK ID).
+    Очередь ключа удаляется, как только разобрана, так что память
+    не растёт с числом пользователей.
+    """
+
+    def __init__(self, handler, workers=16):
+        self.handler = handler
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='vk-worker')
+        self._queues = {}
+        self._lock = threading.Lock()
+
+    def submit(self, key, *args):
+        with self._lock:
+            queue = self._queues.get(key)
+            if queue is not None:
+                # Ключ уже обрабатывается — событие выполнится после предыдущих
+                queue.append(args)
+                return
+            self._queues[key] = deque([args])
+        self.executor.submit(self._drain, key)
+
+    def _drain(self, key):
+        while True:
+            with self._lock:
+                queue = self._queues[key]
+                if not queue:
+                    del self._queues[key]
+                    return
+                args = queue.popleft()
+            try:
+                self.handler(*args)
+            except Exception:
+                logger.error(f"Ошибка обработки события {key}", exc_info=True)
+
+    def shutdown(self, wait=True):
+        self.executor.shutdown(wait=wait)